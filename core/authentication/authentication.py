@@ -3,6 +3,7 @@ from fastapi import Request, Response
 from httpx import BasicAuth
 from base64 import b64encode
 
+from core.authentication.credentials import StaticCredentials
 from core.logging.logging import register_mod_lib
 
 class AuthenticationHandler(BaseModel):
@@ -24,17 +25,25 @@ class RegisterLibAuthenticationHandler():
 
 class BasicAuthenticationHandler(RegisterLibAuthenticationHandler):
     register_name: str = "BasicAuthenticationHandler"
+    def __init__(self, username: str, password: str, mod_name: str = "", register_name: str = ""):
+        super().__init__(username, password, mod_name, register_name)
+        # Encoded once, the credentials never change
+        self._b64 = b64encode(f"{username}:{password}".encode('utf-8')).decode("ascii")
     def create_auth_header(self) -> BasicAuth:
         return BasicAuth(self.auth_handler.username, self.auth_handler.password.get_secret_value())
     def create_raw_header(self):
-        tokenized = b64encode(f"{self.auth_handler.username}:{self.auth_handler.password.get_secret_value()}".encode('utf-8')).decode("ascii")
-        return f'Basic {tokenized}'
+        return f'Basic {self._b64}'
     def create_b64_header(self) -> str:
-        return b64encode(f"{self.auth_handler.username}:{self.auth_handler.password.get_secret_value()}".encode('utf-8')).decode("ascii")
+        return self._b64
+    def credentials(self) -> StaticCredentials:
+        # For ProxyDefinition.credentials or a route's auth, the header is then set without httpx re-encoding it per request
+        return StaticCredentials(self.create_raw_header())
 
 class BearerAuthenticationHandler(RegisterLibAuthenticationHandler):
     register_name: str = "BearerAuthenticationHandler"
     def create_auth_header(self, token: str) -> str:
         return token
+    def credentials(self, token: str) -> StaticCredentials:
+        return StaticCredentials.bearer(token)
 
 
@@ -0,0 +1,205 @@
+"""
+Credentials Sisyphus sends upstream. A route asks its provider for the header value on every
+request. Static credentials are encoded once. Tokens are cached until they expire, and concurrent
+requests share one refresh, so the token endpoint sees a single call. The token is refreshed in the
+background refresh_margin seconds before it expires, so requests never wait for it once it is warm.
+Configured with [mod_settings.credentials], or pass a provider as ProxyDefinition.credentials or
+as a route's auth.
+"""
+
+import asyncio
+import os
+import time
+from base64 import b64encode
+from typing import Awaitable, Callable
+
+from httpx import AsyncBaseTransport, AsyncClient
+
+from core.factory.singleflight import SingleFlight
+from core.logging.logging import custom_message
+from core.shared.proxy_definition import CredentialSettings
+
+
+class CredentialError(Exception):
+    pass
+
+
+class CredentialProvider:
+    # Lowercase name of the header the credentials go in
+    header: str = "authorization"
+
+    async def value(self) -> str:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def invalidate(self, value: str) -> None:
+        """The upstream rejected value (a 401), the next request fetches new credentials."""
+
+    async def close(self) -> None:
+        pass
+
+
+class StaticCredentials(CredentialProvider):
+    __slots__ = ("header", "_value")
+
+    def __init__(self, value: str, header: str = "authorization") -> None:
+        self.header = header.lower()
+        self._value = value
+
+    @classmethod
+    def basic(cls, username: str, password: str) -> "StaticCredentials":
+        return cls(basic_header(username, password))
+
+    @classmethod
+    def bearer(cls, token: str) -> "StaticCredentials":
+        return cls(f"Bearer {token}")
+
+    @classmethod
+    def api_key(cls, key: str, header: str = "x-api-key") -> "StaticCredentials":
+        return cls(key, header)
+
+    async def value(self) -> str:
+        return self._value
+
+
+def basic_header(username: str, password: str) -> str:
+    return "Basic " + b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+
+
+class CachedToken(CredentialProvider):
+    """
+    A token from fetch, an async function returning (token, seconds until it expires).
+    Shared by every route of a mod, so they all use one token and one refresh.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[tuple[str, float]]], refresh_margin: float = 30.0, token_type: str = "Bearer") -> None:
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.token_type = token_type
+        self._value: str | None = None
+        # time.monotonic() deadline of _value
+        self._expires_at = 0.0
+        self._flight = SingleFlight()
+        self._timer: asyncio.TimerHandle | None = None
+        self._background: asyncio.Future | None = None
+        # Calls to fetch that returned a token
+        self.refreshes = 0
+
+    async def value(self) -> str:
+        if self._value is not None and time.monotonic() < self._expires_at:
+            return self._value
+        return await self._flight.do("token", self._refresh)
+
+    def invalidate(self, value: str) -> None:
+        # Only the value that was rejected, a token refreshed in the meantime stays
+        if value == self._value:
+            self._value = None
+            self._expires_at = 0.0
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._background is not None and not self._background.done():
+            self._background.cancel()
+            await asyncio.gather(self._background, return_exceptions=True)
+
+    async def _refresh(self) -> str:
+        try:
+            token, expires_in = await self._fetch()
+        except CredentialError:
+            raise
+        except Exception as e:
+            raise CredentialError(f"Token refresh failed: {e!r}") from e
+        self._value = f"{self.token_type} {token}" if self.token_type else token
+        self._expires_at = time.monotonic() + expires_in
+        self.refreshes += 1
+        self._schedule(expires_in - self.refresh_margin if expires_in > 2 * self.refresh_margin else expires_in / 2)
+        return self._value
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.0), self._refresh_ahead)
+
+    def _refresh_ahead(self) -> None:
+        self._timer = None
+        self._background = asyncio.ensure_future(self._flight.do("token", self._refresh))
+        self._background.add_done_callback(self._refreshed_ahead)
+
+    def _refreshed_ahead(self, task: asyncio.Future) -> None:
+        if task.cancelled() or task.exception() is None:
+            return
+        # The current token stays in use, try again while it is still valid
+        remaining = self._expires_at - time.monotonic()
+        custom_message(f"Background token refresh failed, {max(remaining, 0):.0f}s left: {task.exception()}", "warning")
+        if remaining > 0:
+            self._schedule(min(remaining / 2, 5.0))
+
+
+class ClientCredentials(CachedToken):
+    """OAuth 2 client credentials grant, the client id and secret go to token_url as HTTP basic auth."""
+
+    def __init__(
+        self,
+        token_url: str,
+        client_id: str,
+        client_secret: str,
+        scope: str | None = None,
+        refresh_margin: float = 30.0,
+        default_expires_in: float = 300.0,
+        client: AsyncClient | None = None,
+        transport: AsyncBaseTransport | None = None,
+    ) -> None:
+        super().__init__(self._request_token, refresh_margin)
+        self.token_url = token_url
+        self.default_expires_in = default_expires_in
+        self._form = {"grant_type": "client_credentials", **({"scope": scope} if scope else {})}
+        self._client_auth = basic_header(client_id, client_secret)
+        self._client = client
+        self._owns_client = client is None
+        # Of the client opened on the first fetch, when none was passed in
+        self._transport = transport
+
+    async def _request_token(self) -> tuple[str, float]:
+        if self._client is None:
+            self._client = AsyncClient(timeout=10.0, transport=self._transport)
+        response = await self._client.post(self.token_url, data=self._form, headers={"Authorization": self._client_auth})
+        if response.status_code != 200:
+            raise CredentialError(f"Token endpoint {self.token_url} answered {response.status_code}")
+        payload = response.json()
+        if "access_token" not in payload:
+            raise CredentialError(f"Token endpoint {self.token_url} sent no access_token")
+        return payload["access_token"], float(payload.get("expires_in", self.default_expires_in))
+
+    async def close(self) -> None:
+        await super().close()
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _secret(value: str | None) -> str:
+    # "env:NAME" reads the secret from the environment instead of the TOML
+    if value and value.startswith("env:"):
+        name = value[4:]
+        if name not in os.environ:
+            raise CredentialError(f"Environment variable {name} is not set")
+        return os.environ[name]
+    return value or ""
+
+
+def build_credentials(settings: CredentialSettings, transport: AsyncBaseTransport | None = None) -> CredentialProvider:
+    if settings.type == "basic":
+        provider: CredentialProvider = StaticCredentials.basic(settings.username, _secret(settings.password))
+    elif settings.type == "bearer":
+        provider = StaticCredentials.bearer(_secret(settings.token))
+    elif settings.type == "api_key":
+        return StaticCredentials.api_key(_secret(settings.token), settings.header or "x-api-key")
+    else:
+        provider = ClientCredentials(
+            str(settings.token_url), settings.client_id, _secret(settings.client_secret), settings.scope, settings.refresh_margin,
+            transport=transport,
+        )
+    if settings.header:
+        provider.header = settings.header.lower()
+    return provider
@@ -0,0 +1,79 @@
+"""
+JSON handling on the response path: the old flow (stdlib json, every hook decodes and
+encodes the body again) versus a ParsedBody going through each installed codec backend.
+A response passes a transform, an out callback and the cache, like a cached transformed route.
+
+    python -m core.bench.bench_codec --sizes 1 100 10000
+"""
+
+import argparse
+import json
+import time
+
+from core.shared import codec
+from core.shared.codec import ParsedBody
+
+
+def make_payload(records: int) -> bytes:
+    return json.dumps([
+        {"userId": i % 10, "id": i, "title": "delectus aut autem", "completed": bool(i % 2), "geo": {"lat": i / 7, "lng": -i / 3}}
+        for i in range(records)
+    ]).encode("utf-8")
+
+
+def hooks(data):
+    # Stands in for a transform and an out callback changing the body
+    if isinstance(data, list) and data:
+        data[0]["seen"] = True
+    return data
+
+
+def per_hook_stdlib(body: bytes) -> bytes:
+    # Transform stage and out callback each parse and re-encode
+    body = json.dumps(hooks(json.loads(body.decode("utf-8")))).encode("utf-8")
+    body = json.dumps(hooks(json.loads(body))).encode("utf-8")
+    cached = body
+    return cached
+
+
+def parsed_body(body: bytes) -> bytes:
+    parsed = ParsedBody(body)
+    hooks(parsed.json())
+    hooks(codec.loads(parsed))
+    parsed.mark_dirty()
+    cached = parsed.raw
+    return cached
+
+
+def timed(fn, payload: bytes, repeat: int, number: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(payload)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    backends = list(codec.BACKENDS)
+    previous = codec.backend
+    print(f"{'records':>10} {'bytes':>10} {'per-hook us':>12}" + "".join(f" {name + ' us':>12}" for name in backends))
+    for records in args.sizes:
+        payload = make_payload(records)
+        number = max(1, 20_000 // records)
+        row = f"{records:>10} {len(payload):>10} {timed(per_hook_stdlib, payload, args.repeat, number) * 1e6:>12.1f}"
+        for name in backends:
+            codec.use_backend(name)
+            row += f" {timed(parsed_body, payload, args.repeat, number) * 1e6:>12.1f}"
+        print(row)
+    codec.use_backend(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Columnar transform engine versus the per-dict path (convert_dict_to_array / convert_array_to_dict
+called once per record) on jsonplaceholder-like /todos payloads.
+
+    python -m core.bench.bench_columnar_transform --records 10000 50000 100000
+"""
+
+import argparse
+import copy
+import time
+
+from core.scripts.transform import (
+    convert_array_to_dict,
+    convert_dict_to_array,
+    fast_json_process,
+    transform_records,
+    warmup,
+)
+
+
+def make_payload(records: int) -> list[dict]:
+    return [
+        {"userId": i % 10, "id": i, "title": "delectus aut autem", "completed": bool(i % 2), "geo": {"lat": i / 7, "lng": -i / 3}}
+        for i in range(records)
+    ]
+
+
+def per_dict(payload: list[dict]) -> list[dict]:
+    out = []
+    for record in payload:
+        data_array = convert_dict_to_array(record)
+        if len(data_array) > 0:
+            record = convert_array_to_dict(record, fast_json_process(data_array))
+        out.append(record)
+    return out
+
+
+def columnar(payload: list[dict]) -> list[dict]:
+    # Same top-level columns the per-dict path touches
+    return transform_records(payload, {"userId": "fast_json_process", "id": "fast_json_process"})
+
+
+def columnar_nested(payload: list[dict]) -> list[dict]:
+    # Every numeric path, nested ones included, which the per-dict path can't reach
+    return transform_records(payload, "fast_json_process")
+
+
+def timed(fn, payload: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        data = copy.deepcopy(payload)
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, nargs="+", default=[10_000, 50_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    warmup()
+    print(f"{'records':>10} {'per-dict ms':>12} {'columnar ms':>12} {'speedup':>8} {'all paths ms':>13}")
+    for records in args.records:
+        payload = make_payload(records)
+        before = timed(per_dict, payload, args.repeat)
+        after = timed(columnar, payload, args.repeat)
+        nested = timed(columnar_nested, payload, args.repeat)
+        print(f"{records:>10} {before * 1000:>12.1f} {after * 1000:>12.1f} {before / after:>7.1f}x {nested * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
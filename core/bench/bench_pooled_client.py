@@ -0,0 +1,85 @@
+"""
+Requests/sec through a RouteFactory route with a fresh AsyncClient per request (the old
+behaviour) versus the pooled per-mod client.
+
+    python -m core.bench.bench_pooled_client --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+from contextvars import ContextVar
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from core.bench.upstream_stub import StubTransport, UpstreamStub, make_upstream_app, route_to_stubs
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+_request_client: ContextVar[AsyncClient] = ContextVar("_request_client")
+
+
+class PerRequestClientFactory(RouteFactory):
+    # Reproduces the previous `async with AsyncClient(...)` per call
+    def get_client(self) -> AsyncClient:
+        return _request_client.get(None)
+
+    def _build_client(self) -> AsyncClient:
+        # Closing a client closes its transport, so every client gets its own
+        self._transport = StubTransport(self._transport.ports, self.proxy.mod_settings)
+        return super()._build_client()
+
+    async def httpx_request_handle(self, *args, **kwargs):
+        async with self._build_client() as client:
+            token = _request_client.set(client)
+            try:
+                return await super().httpx_request_handle(*args, **kwargs)
+            finally:
+                _request_client.reset(token)
+
+
+async def run_load(factory: RouteFactory, total: int, concurrency: int) -> float:
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+    await factory.startup()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get("/bench/item")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    await factory.shutdown()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--http2", action="store_true")
+    args = parser.parse_args()
+
+    with UpstreamStub(make_upstream_app()) as upstream:
+        proxy = ProxyDefinition(
+            endpoint="/bench",
+            target_url="http://upstream.test",
+            mod_settings=ModSettings(http2=args.http2, max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        )
+        ports = {"upstream.test": upstream.port}
+        before = asyncio.run(run_load(route_to_stubs(PerRequestClientFactory(proxy), ports), args.requests, args.concurrency))
+        after = asyncio.run(run_load(route_to_stubs(RouteFactory(proxy), ports), args.requests, args.concurrency))
+
+    print(f"client per request : {before:10.1f} req/s")
+    print(f"pooled client      : {after:10.1f} req/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
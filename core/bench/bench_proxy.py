@@ -0,0 +1,170 @@
+"""
+Benchmark suite for the proxy data path. Every scenario runs RouteFactory routes against a
+local upstream stub over TCP, no network needed, and reports throughput, p50/p99 latency and RSS.
+Save a run with --json and pass it as --baseline to a later run to see the regressions.
+
+    python -m core.bench.bench_proxy --requests 2000 --concurrency 50
+    python -m core.bench.bench_proxy --scenarios httpx-small requests-small --json before.json
+    python -m core.bench.bench_proxy --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from core.bench.upstream_stub import UpstreamStub, make_upstream_app, route_to_stubs
+from core.factory.route_factory import RouteFactory
+from core.shared import codec
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+LARGE_BODY = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    # create_router (httpx) or create_requests_router
+    router: str = "create_router"
+    body_size: int = 256
+    records: int = 0
+    stream: bool = False
+    transform: str | None = None
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("httpx-small"),
+    Scenario("httpx-large", body_size=LARGE_BODY),
+    Scenario("httpx-stream", body_size=LARGE_BODY, stream=True),
+    Scenario("httpx-transform", records=1000, transform="fast_json_process"),
+    Scenario("requests-small", router="create_requests_router"),
+    Scenario("requests-large", router="create_requests_router", body_size=LARGE_BODY),
+    Scenario("requests-transform", router="create_requests_router", records=1000, transform="fast_json_process"),
+)}
+
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    rps: float
+    p50_ms: float
+    p99_ms: float
+    rss_mb: float
+
+
+def rss_mb() -> float:
+    # Current RSS where /proc exists, the peak otherwise
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * share), len(sorted_values) - 1)]
+
+
+async def run_scenario(scenario: Scenario, upstream_port: int, total: int, concurrency: int) -> Result:
+    factory = route_to_stubs(RouteFactory(ProxyDefinition(
+        endpoint="/bench",
+        target_url="http://upstream.test",
+        mod_settings=ModSettings(max_connections=concurrency, max_keepalive_connections=concurrency, requests_max_workers=concurrency),
+    )), {"upstream.test": upstream_port})
+    getattr(factory, scenario.router)(ProxyRouteDefinition(
+        route="/item", url_route="/todos", method="GET", stream=scenario.stream, response_transform=scenario.transform
+    ))
+    app = FastAPI()
+    app.include_router(factory.router)
+    await factory.startup()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus", timeout=60) as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/bench/item")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        # Opens the connections and warms the code paths before anything is measured
+        await asyncio.gather(*(one() for _ in range(min(concurrency, total))))
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    await factory.shutdown()
+    latencies.sort()
+    return Result(
+        scenario=scenario.name,
+        requests=total,
+        rps=total / elapsed,
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        rss_mb=rss_mb(),
+    )
+
+
+def run(names: list[str], total: int, concurrency: int, latency: float) -> list[Result]:
+    results = []
+    for name in names:
+        scenario = SCENARIOS[name]
+        upstream = make_upstream_app(latency=latency, body_size=scenario.body_size, records=scenario.records)
+        with UpstreamStub(upstream) as stub:
+            results.append(asyncio.run(run_scenario(scenario, stub.port, total, concurrency)))
+    return results
+
+
+def report(results: list[Result], baseline: dict[str, dict] | None = None) -> None:
+    print(f"{'scenario':20} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8}")
+    for result in results:
+        line = f"{result.scenario:20} {result.rps:10.1f} {result.p50_ms:9.2f} {result.p99_ms:9.2f} {result.rss_mb:8.1f}"
+        before = (baseline or {}).get(result.scenario)
+        if before:
+            line += f"   req/s {result.rps / before['rps'] - 1:+.1%}, p99 {result.p99_ms / before['p99_ms'] - 1:+.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Upstream latency in seconds")
+    parser.add_argument("--json", help="Write the results here")
+    parser.add_argument("--baseline", help="Results of an earlier run (--json) to compare against")
+    args = parser.parse_args()
+
+    results = run(args.scenarios, args.requests, args.concurrency, args.latency)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "codec": codec.backend,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "results": [asdict(result) for result in results],
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
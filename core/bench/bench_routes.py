@@ -0,0 +1,85 @@
+"""
+Route matching as the route count grows. Builds one mod with N proxy routes, half static and half
+with a path param, in both dispatch modes and reports the build time, the time to match a
+request to the last route added (the worst case of a linear scan) and full requests per second
+against an in-process upstream transport.
+
+    python -m core.bench.bench_routes --routes 10 100 1000 10000
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from starlette.routing import Match
+
+from core.bench.bench_route_plan import InstantUpstream
+from core.factory.route_factory import RouteFactory
+from core.logging.logging import configure_logging
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+
+def build(count: int, dispatch: str) -> tuple[FastAPI, RouteFactory, float]:
+    start = time.perf_counter()
+    proxy = ProxyDefinition(endpoint="/bench", target_url="http://upstream.test", mod_settings=ModSettings(dispatch=dispatch))
+    factory = RouteFactory(proxy, transport=InstantUpstream())
+    for i in range(count // 2):
+        factory.create_router(ProxyRouteDefinition(route=f"/r{i}/items", url_route="/todos", method="GET"))
+        factory.create_router_param(ProxyRouteDefinition(route=f"/r{i}/item/{{id}}", url_route="/todos/{id}", method="GET", params={"id": "id"}))
+    app = FastAPI()
+    app.include_router(factory.router)
+    if factory.trie is not None:
+        app.router.routes.append(factory.trie)
+    return app, factory, time.perf_counter() - start
+
+
+def match_time(app: FastAPI, path: str, iterations: int) -> float:
+    # What Starlette's Router does for every request, without the handler
+    scope = {"type": "http", "method": "GET", "path": path, "root_path": "", "path_params": {}}
+    routes = app.router.routes
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for route in routes:
+            if route.matches(scope)[0] is Match.FULL:
+                break
+        else:
+            raise AssertionError(f"{path} did not match")
+    return (time.perf_counter() - start) / iterations
+
+
+async def request_rate(app: FastAPI, paths: list[str], total: int) -> float:
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        await client.get(paths[0])
+        start = time.perf_counter()
+        for i in range(total):
+            response = await client.get(paths[i % len(paths)])
+            response.raise_for_status()
+        return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+    # 10k "Created Route" lines would drown the numbers
+    configure_logging({"level": "warning"})
+
+    print(f"{'routes':>7} {'dispatch':9} {'build s':>8} {'match us':>9} {'req/s':>8}")
+    for count in args.routes:
+        last = count // 2 - 1
+        paths = [f"/bench/r{last}/item/7", f"/bench/r{last}/items", "/bench/r0/item/1"]
+        for dispatch in ("fastapi", "trie"):
+            app, factory, build_time = build(count, dispatch)
+            matched = match_time(app, paths[0], args.iterations)
+            rate = asyncio.run(request_rate(app, paths, args.requests))
+            asyncio.run(factory.shutdown())
+            print(f"{count:7} {dispatch:9} {build_time:8.2f} {matched * 1e6:9.2f} {rate:8.0f}")
+    configure_logging(None)
+
+
+if __name__ == "__main__":
+    main()
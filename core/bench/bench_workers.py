@@ -0,0 +1,141 @@
+"""
+Requests/sec through a real Sisyphus server as the worker count grows. The upstream is a
+set of stub processes behind the balancer and the load comes from separate client processes,
+so neither side caps the proxy.
+
+    python -m core.bench.bench_workers --workers 1 2 4 --duration 5 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from core.bench.upstream_stub import free_port, make_upstream_app, route_to_stubs
+from core.factory.route_factory import RouteFactory
+from core.server import ServerConfig, run_server
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+# Ports of the upstream stubs, comma separated. Environment variables reach the worker processes
+UPSTREAMS_ENV = "SISYPHUS_BENCH_UPSTREAMS"
+
+
+def create_bench_app() -> FastAPI:
+    """App factory run by every worker."""
+    ports = {f"upstream-{i}.test": int(port) for i, port in enumerate(os.environ[UPSTREAMS_ENV].split(","))}
+    factory = route_to_stubs(RouteFactory(ProxyDefinition(
+        endpoint="/bench",
+        target_url=[f"http://{host}" for host in ports],
+        mod_settings=ModSettings(circuit_breaker=None),
+    )), ports)
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await factory.startup()
+        yield
+        await factory.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(factory.router)
+    return app
+
+
+def serve_upstream(port: int, latency: float) -> None:
+    uvicorn.run(make_upstream_app(latency=latency), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def serve_proxy(port: int, workers: int) -> None:
+    run_server("core.bench.bench_workers:create_bench_app", ServerConfig(host="127.0.0.1", workers=workers, graceful_timeout=1), port)
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} didn't come up")
+
+
+async def client_load(url: str, duration: float, concurrency: int) -> int:
+    done = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def worker():
+            nonlocal done
+            while time.monotonic() < deadline:
+                response = await client.get(url)
+                response.raise_for_status()
+                done += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done
+
+
+def run_client(url: str, duration: float, concurrency: int, results) -> None:
+    results.put(asyncio.run(client_load(url, duration, concurrency)))
+
+
+def measure(port: int, workers: int, clients: int, duration: float, concurrency: int) -> float:
+    proxy = multiprocessing.Process(target=serve_proxy, args=(port, workers))
+    proxy.start()
+    try:
+        url = f"http://127.0.0.1:{port}/bench/item"
+        wait_for(url)
+        results = multiprocessing.Queue()
+        load = [multiprocessing.Process(target=run_client, args=(url, duration, concurrency, results)) for _ in range(clients)]
+        for process in load:
+            process.start()
+        total = sum(results.get() for _ in load)
+        for process in load:
+            process.join()
+        return total / duration
+    finally:
+        # SIGTERM: the workers drain and shut down gracefully
+        proxy.terminate()
+        proxy.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="Connections per client process")
+    parser.add_argument("--clients", type=int, default=2, help="Load generating processes")
+    parser.add_argument("--upstreams", type=int, default=2, help="Upstream stub processes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Upstream latency in seconds")
+    args = parser.parse_args()
+
+    ports = [free_port() for _ in range(args.upstreams)]
+    upstreams = [multiprocessing.Process(target=serve_upstream, args=(port, args.latency), daemon=True) for port in ports]
+    for process in upstreams:
+        process.start()
+    os.environ[UPSTREAMS_ENV] = ",".join(str(port) for port in ports)
+    try:
+        for port in ports:
+            wait_for(f"http://127.0.0.1:{port}/")
+        baseline = None
+        for workers in args.workers:
+            rps = measure(free_port(), workers, args.clients, args.duration, args.concurrency)
+            baseline = baseline or rps
+            print(f"{workers:3d} worker(s): {rps:10.1f} req/s ({rps / baseline:.2f}x)")
+    finally:
+        for process in upstreams:
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Local upstream stub used by the benchmarks and the resilience tests, plus a token endpoint for the credential tests.
+A bare ASGI app (no framework overhead) that answers every request with a JSON body
+after an optional delay, so the numbers measure the proxy and not the upstream.
+Delays and error statuses can be injected for the first calls.
+ProxyDefinition refuses localhost upstreams, so mods point at a made up host and route_to_stubs
+sends that host's calls to the stub.
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import uvicorn
+from httpx import AsyncHTTPTransport, Limits, Request, Response
+from requests.adapters import HTTPAdapter
+
+from core.shared.proxy_definition import ModSettings
+
+
+def make_upstream_app(latency: float = 0.0, body_size: int = 256, faults: list[tuple[float, int]] | None = None, records: int = 0):
+    """
+    Build the stub ASGI app.
+
+    Args:
+        latency: Seconds to sleep before answering
+        body_size: Approximate size in bytes of the JSON body
+        faults: (extra delay in seconds, status) for each of the first calls, the calls after them answer normally
+        records: When set, answer with a JSON array of that many todo records instead (body_size is ignored)
+
+    Returns:
+        ASGI application, its `calls` attribute counts the requests it got
+    """
+    if records:
+        body = json.dumps([{"id": i, "userId": i % 10, "completed": False, "title": "delectus aut autem"} for i in range(records)]).encode("utf-8")
+    else:
+        body = json.dumps({"id": 1, "userId": 1, "completed": False, "title": "x" * max(body_size - 64, 0)}).encode("utf-8")
+    faults = list(faults or [])
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        # Drain the request body
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        call = app.calls
+        app.calls += 1
+        delay, status = faults[call] if call < len(faults) else (0.0, 200)
+        if latency or delay:
+            await asyncio.sleep(latency + delay)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    app.calls = 0
+    return app
+
+
+def make_token_app(expires_in: float = 3600, latency: float = 0.0, client_auth: str | None = None):
+    """
+    Build an OAuth 2 token endpoint stub for the client credentials grant.
+
+    Args:
+        expires_in: Lifetime in seconds of the tokens it hands out
+        latency: Seconds to sleep before answering
+        client_auth: The Authorization header a client must send, anything else gets a 401
+
+    Returns:
+        ASGI application, its `calls` attribute counts the tokens it issued ("token-1", "token-2", ...)
+    """
+
+    async def app(scope, receive, send):
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        headers = dict(scope["headers"])
+        if latency:
+            await asyncio.sleep(latency)
+        if b"grant_type=client_credentials" not in body.split(b"&"):
+            status, payload = 400, {"error": "unsupported_grant_type"}
+        elif client_auth is not None and headers.get(b"authorization", b"").decode("latin-1") != client_auth:
+            status, payload = 401, {"error": "invalid_client"}
+        else:
+            app.calls += 1
+            status, payload = 200, {"access_token": f"token-{app.calls}", "token_type": "Bearer", "expires_in": expires_in}
+        content = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(content)).encode())],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    app.calls = 0
+    return app
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StubTransport(AsyncHTTPTransport):
+    """Real TCP connections to the stubs on 127.0.0.1, ports maps the made up upstream hosts to their stub."""
+
+    def __init__(self, ports: dict[str, int], mod_settings: ModSettings | None = None) -> None:
+        # A client given a transport ignores its own pool settings, so the transport takes the mod's
+        settings = mod_settings or ModSettings()
+        super().__init__(http2=settings.http2, limits=Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ))
+        self.ports = ports
+
+    async def handle_async_request(self, request: Request) -> Response:
+        port = self.ports.get(request.url.host)
+        if port is not None:
+            request.url = request.url.copy_with(host="127.0.0.1", port=port)
+        return await super().handle_async_request(request)
+
+
+class StubAdapter(HTTPAdapter):
+    """StubTransport for the requests based routes."""
+
+    def __init__(self, ports: dict[str, int], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.ports = ports
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        port = self.ports.get(url.hostname)
+        if port is not None:
+            request.url = urlunsplit(url._replace(netloc=f"127.0.0.1:{port}"))
+        return super().send(request, **kwargs)
+
+
+def route_to_stubs(factory, ports: dict[str, int]):
+    """Send the upstream calls of a RouteFactory, httpx and requests alike, for the hosts in ports to their stubs."""
+    factory._transport = StubTransport(ports, factory.proxy.mod_settings)
+    workers = factory.proxy.mod_settings.requests_max_workers
+    factory.get_requests_session().mount("http://", StubAdapter(ports, pool_connections=workers, pool_maxsize=workers))
+    return factory
+
+
+class UpstreamStub:
+    """Runs an ASGI app with uvicorn on a background thread, for use as a real TCP upstream."""
+
+    def __init__(self, app, port: int | None = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "UpstreamStub":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join()
@@ -0,0 +1,169 @@
+"""
+Spreads a mod's requests over the upstreams of its target_url. Hosts that keep failing are ejected
+for a while (passive health), an optional task polls a health endpoint on every host (active health).
+With a single upstream every strategy just returns it.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import time
+from itertools import count
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlsplit
+
+from httpx import AsyncClient
+
+from core.logging.logging import custom_message
+from core.middleware.concurrency import ConcurrencyLimiter
+from core.shared.proxy_definition import BalancerSettings
+
+# Points per host on the consistent hash ring, enough for an even spread over a handful of hosts
+RING_REPLICAS = 100
+
+
+class Upstream:
+    __slots__ = ("url", "origin", "outstanding", "ewma", "failures", "ejected_until", "healthy", "limiter")
+
+    def __init__(self, url: str, limiter: ConcurrencyLimiter | None = None) -> None:
+        parts = urlsplit(url)
+        self.url = url
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.outstanding = 0
+        # Seconds, 0 until the first answer so new hosts get tried
+        self.ewma = 0.0
+        self.failures = 0
+        self.ejected_until = 0.0
+        # Set by the active health check
+        self.healthy = True
+        # BalancerSettings.upstream_concurrency, None when unlimited
+        self.limiter = limiter
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class Balancer:
+    def __init__(self, urls: list[str], settings: BalancerSettings) -> None:
+        limits = settings.upstream_concurrency
+        self.upstreams: list[Upstream] = [
+            Upstream(url, ConcurrencyLimiter(url, limits) if limits is not None else None) for url in urls
+        ]
+        self.settings = settings
+        self._counter = count()
+        self._ring: list[tuple[int, Upstream]] = sorted(
+            ((_ring_hash(f"{upstream.url}#{i}"), upstream) for upstream in self.upstreams for i in range(RING_REPLICAS)),
+            key=lambda point: point[0]
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+        self._strategy: Callable[[list[Upstream], str | None], Upstream] = getattr(self, f"_{settings.strategy}")
+        self._health_task: asyncio.Task | None = None
+
+    def pick(self, key: str | None = None) -> Upstream:
+        if len(self.upstreams) == 1:
+            return self.upstreams[0]
+        now = time.monotonic()
+        candidates = [upstream for upstream in self.upstreams if upstream.available(now)]
+        # Every host is down: keep trying all of them rather than failing every request
+        return self._strategy(candidates or self.upstreams, key)
+
+    def _round_robin(self, candidates: list[Upstream], key: str | None) -> Upstream:
+        return candidates[next(self._counter) % len(candidates)]
+
+    def _least_outstanding(self, candidates: list[Upstream], key: str | None) -> Upstream:
+        # Rotating the start spreads the ties instead of always favouring the first host
+        offset = next(self._counter) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda upstream: upstream.outstanding)
+
+    def _ewma(self, candidates: list[Upstream], key: str | None) -> Upstream:
+        offset = next(self._counter) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        # Latency weighted by the requests already waiting on the host
+        return min(rotated, key=lambda upstream: upstream.ewma * (upstream.outstanding + 1))
+
+    def _consistent_hash(self, candidates: list[Upstream], key: str | None) -> Upstream:
+        if key is None:
+            return self._round_robin(candidates, key)
+        allowed = set(map(id, candidates))
+        start = bisect.bisect(self._ring_keys, _ring_hash(key))
+        # Walk clockwise to the first host that is still up, so only the keys of a down host move
+        for i in range(len(self._ring)):
+            upstream = self._ring[(start + i) % len(self._ring)][1]
+            if id(upstream) in allowed:
+                return upstream
+        return candidates[0]
+
+    async def send(self, upstream: Upstream, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run one call against upstream and feed its outcome back into the strategy and passive health.
+        Raises Overloaded when the upstream_concurrency of the host is used up.
+        """
+        if upstream.limiter is not None:
+            async with upstream.limiter.slot():
+                return await self._send(upstream, send)
+        return await self._send(upstream, send)
+
+    async def _send(self, upstream: Upstream, send: Callable[[], Awaitable[Any]]) -> Any:
+        upstream.outstanding += 1
+        start = time.monotonic()
+        try:
+            response = await send()
+        except Exception:
+            self._record(upstream, False, time.monotonic() - start)
+            raise
+        finally:
+            upstream.outstanding -= 1
+        self._record(upstream, response.status_code < 500, time.monotonic() - start)
+        return response
+
+    def _record(self, upstream: Upstream, ok: bool, latency: float) -> None:
+        alpha = self.settings.ewma_alpha
+        upstream.ewma = latency if upstream.ewma == 0.0 else upstream.ewma + alpha * (latency - upstream.ewma)
+        if ok:
+            upstream.failures = 0
+            return
+        upstream.failures += 1
+        if len(self.upstreams) > 1 and upstream.failures >= self.settings.failure_threshold:
+            upstream.ejected_until = time.monotonic() + self.settings.eject_seconds
+            upstream.failures = 0
+            custom_message(f"Ejected {upstream.origin} for {self.settings.eject_seconds}s after repeated failures", "warning")
+
+    def start_health_checks(self, client: AsyncClient) -> None:
+        if self.settings.health_check is None or self._health_task is not None:
+            return
+        self._health_task = asyncio.create_task(self._health_loop(client))
+
+    async def stop_health_checks(self) -> None:
+        if self._health_task is None:
+            return
+        self._health_task.cancel()
+        try:
+            await self._health_task
+        except asyncio.CancelledError:
+            pass
+        self._health_task = None
+
+    async def _health_loop(self, client: AsyncClient) -> None:
+        while True:
+            await self.check_health(client)
+            await asyncio.sleep(self.settings.health_check.interval)
+
+    async def check_health(self, client: AsyncClient) -> None:
+        check = self.settings.health_check
+
+        async def probe(upstream: Upstream) -> None:
+            try:
+                response = await client.get(upstream.url + check.path, timeout=check.timeout)
+                healthy = response.status_code < 400
+            except Exception:
+                healthy = False
+            if healthy != upstream.healthy:
+                custom_message(f"Upstream {upstream.origin} is {'healthy' if healthy else 'unhealthy'}", "info" if healthy else "warning")
+            upstream.healthy = healthy
+
+        await asyncio.gather(*(probe(upstream) for upstream in self.upstreams))
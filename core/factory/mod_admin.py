@@ -0,0 +1,74 @@
+"""
+Admin endpoints to load, reload and unload mods at runtime. Every request needs the [admin]
+token as a bearer token. Each worker process has its own routes, so with several workers use
+[mods] watch instead, every worker then picks up the change itself.
+"""
+
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, model_validator
+
+from core.factory.mod_loader import ModLoader
+from core.factory.validate import RouteConfigError
+from custom_core.logging import exit_with_custom_message
+
+
+class AdminConfig(BaseModel):
+    # The [admin] table of sisyphus.toml
+    enable: bool = False
+    path: str = "/admin"
+    # Required as "Authorization: Bearer <token>"
+    token: str = ""
+
+    @model_validator(mode="after")
+    def validate_token(self) -> "AdminConfig":
+        if self.enable and not self.token:
+            exit_with_custom_message("The admin endpoints need a token", "error")
+            raise ValueError("[admin] enable needs a token")
+        return self
+
+
+def admin_router(loader: ModLoader, config: AdminConfig) -> APIRouter:
+    expected = f"Bearer {config.token}".encode()
+
+    def authorize(request: Request) -> None:
+        if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected):
+            raise HTTPException(status_code=401, detail="Invalid admin token")
+
+    router = APIRouter(prefix=f"{config.path.rstrip('/')}/mods", dependencies=[Depends(authorize)], include_in_schema=False)
+
+    @router.get("")
+    async def list_mods() -> dict:
+        return {
+            "mods": [
+                {"mod_id": mod_id, "endpoint": route.manifest.endpoint, "loaded": route.version is not None}
+                for mod_id, route in loader.routes.items()
+            ]
+        }
+
+    async def run(change, mod_id: str) -> dict:
+        try:
+            await change(mod_id)
+        except RouteConfigError as e:
+            raise HTTPException(status_code=500, detail=f"Could not {change.__name__} mod {mod_id}: {e}")
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except (Exception, SystemExit) as e:
+            # The mod keeps running its previous version, a validator exiting on a bad value included
+            raise HTTPException(status_code=500, detail=f"Could not {change.__name__} mod {mod_id}: {e!r}")
+        return {"mod_id": mod_id, "status": change.__name__}
+
+    @router.post("/{mod_id}/load")
+    async def load_mod(mod_id: str) -> dict:
+        return await run(loader.load if mod_id in loader.routes else loader.add, mod_id)
+
+    @router.post("/{mod_id}/reload")
+    async def reload_mod(mod_id: str) -> dict:
+        return await run(loader.reload, mod_id)
+
+    @router.post("/{mod_id}/unload")
+    async def unload_mod(mod_id: str) -> dict:
+        return await run(loader.unload, mod_id)
+
+    return router
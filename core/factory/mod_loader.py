@@ -0,0 +1,363 @@
+"""
+Mod discovery, lazy loading and hot reload. Every mods/<id>/<id>.toml is read without importing
+the mod's code. Each mod sits behind one ModRoute of the app, which routes to the current
+version of the mod's routes. Lazy mods have no version until the first request under their
+endpoint (or a warm-up) imports and builds them.
+
+A reload builds the new version next to the old one and swaps it in with one assignment.
+Requests already routed finish on the old version, which is shut down once they are done.
+The new RouteFactory adopts the old one's upstream pools and the response cache is process
+wide, so neither starts cold.
+"""
+
+import asyncio
+import importlib
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+from starlette._utils import get_route_path
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+from core.factory.register_mod import RegisterMod, mod_registry
+from core.factory.validate import load_mod_config
+from core.logging.logging import custom_message
+
+
+class ModsConfig(BaseModel):
+    # The [mods] table of sisyphus.toml
+    path: str = "mods"
+    # Build mods on their first request instead of at startup
+    lazy: bool = True
+    # Mod ids built on startup anyway, so their first request isn't slower
+    warm_up: list[str] = []
+    # Mod ids left out
+    exclude: list[str] = []
+    # Poll the mod directories and load, reload or unload the mods whose files changed
+    watch: bool = False
+    watch_interval: float = 1.0
+    # Seconds requests still running on a replaced version get before it is shut down
+    retire_timeout: float = 30.0
+
+
+class ModManifest(BaseModel):
+    # The [mod] table of the mod's toml
+    mod_id: str
+    mod_name: str = ""
+    # "module:Class" of the mod, instantiated with the Sisyphus instance
+    entry: str | None = None
+    # Prefix of every route of the mod, needed to load it lazily
+    endpoint: str | None = None
+    lazy: bool = True
+
+
+class ModHost:
+    """What a mod is built with instead of Sisyphus, keeps the routers it registers for its ModRoute."""
+
+    def __init__(self, sisyphus: Any) -> None:
+        self._sisyphus = sisyphus
+        self.routers: list = []
+
+    def register(self, route) -> None:
+        self.routers.append(route)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._sisyphus, name)
+
+
+class ModVersion:
+    __slots__ = ("mod", "registered", "routes", "active", "idle")
+
+    def __init__(self, mod: Any, registered: RegisterMod | None, routes: tuple[BaseRoute, ...]) -> None:
+        self.mod = mod
+        self.registered = registered
+        self.routes = routes
+        # Requests being handled by this version
+        self.active = 0
+        self.idle: asyncio.Event | None = None
+
+    def leave(self) -> None:
+        self.active -= 1
+        if self.active == 0 and self.idle is not None:
+            self.idle.set()
+
+    async def retire(self, timeout: float) -> None:
+        """Wait for the requests still running on this version, then close its factory."""
+        if self.active:
+            self.idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self.idle.wait(), timeout)
+            except TimeoutError:
+                custom_message(f"{self.active} requests still running on a replaced mod version", "warning")
+        if self.registered is not None:
+            await self.registered.Factory.shutdown(drain_timeout=timeout)
+
+
+class ModRoute(BaseRoute):
+    """
+    Routes to the current version of one mod. Until a lazy mod is built it matches everything
+    under its endpoint and builds the mod on the first request.
+    """
+
+    def __init__(self, loader: "ModLoader", manifest: ModManifest) -> None:
+        self.loader = loader
+        self.manifest = manifest
+        self.version: ModVersion | None = None
+
+    def matches(self, scope) -> tuple[Match, dict]:
+        version = self.version
+        if version is None:
+            prefix = (self.manifest.endpoint or "").rstrip("/")
+            if scope["type"] == "http" and self.manifest.endpoint is not None:
+                path = get_route_path(scope)
+                if path == prefix or path.startswith(prefix + "/"):
+                    return Match.FULL, {}
+            return Match.NONE, {}
+        partial = None
+        for route in version.routes:
+            match, child_scope = route.matches(scope)
+            if match is Match.FULL:
+                # The version is picked here, a swap while the request runs doesn't move it
+                return Match.FULL, {**child_scope, "sisyphus.mod": (version, route)}
+            if match is Match.PARTIAL and partial is None:
+                partial = {**child_scope, "sisyphus.mod": (version, route)}
+        if partial is not None:
+            return Match.PARTIAL, partial
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params: Any):
+        for route in self.version.routes if self.version is not None else ():
+            try:
+                return route.url_path_for(name, **path_params)
+            except NoMatchFound:
+                pass
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope, receive, send) -> None:
+        target = scope.pop("sisyphus.mod", None)
+        if target is None:
+            try:
+                await self.loader.load(self.manifest.mod_id)
+            except SystemExit as e:
+                # Fails this request like any other build error instead of stopping the server
+                raise RuntimeError(f"Could not build mod {self.manifest.mod_id}") from e
+            # The mod's own routes are in place now
+            await self.loader.sisyphus.app.router(scope, receive, send)
+            return
+        version, route = target
+        version.active += 1
+        try:
+            await route.handle(scope, receive, send)
+        finally:
+            version.leave()
+
+
+class ModLoader:
+    def __init__(self, sisyphus: Any, config: ModsConfig) -> None:
+        # Anything with the app of core.sisyphus.Sisyphus
+        self.sisyphus = sisyphus
+        self.config = config
+        self.manifests: dict[str, ModManifest] = {}
+        # mod id -> the mod instance
+        self.mods: dict[str, Any] = {}
+        self.routes: dict[str, ModRoute] = {}
+        # One load, reload or unload at a time
+        self._lock = asyncio.Lock()
+        self._retiring: set[asyncio.Task] = set()
+        self._watcher: asyncio.Task | None = None
+        self._snapshot: dict[str, float] = {}
+
+    def discover(self) -> list[ModManifest]:
+        start = time.perf_counter()
+        for directory in sorted(Path(self.config.path).iterdir()):
+            manifest = self._read_manifest(directory.name)
+            if manifest is not None:
+                self.manifests[manifest.mod_id] = manifest
+        self._snapshot = self._scan()
+        custom_message(f"Found {len(self.manifests)} mods in {(time.perf_counter() - start) * 1000:.1f}ms", "info")
+        return list(self.manifests.values())
+
+    def register(self) -> None:
+        """Build the eager mods, leave the lazy ones to their first request."""
+        start = time.perf_counter()
+        for manifest in self.manifests.values():
+            self._install(manifest, None if self._is_lazy(manifest) else self._build(manifest))
+        lazy = sum(1 for route in self.routes.values() if route.version is None)
+        custom_message(
+            f"Registered {len(self.manifests)} mods ({lazy} lazy) in {(time.perf_counter() - start) * 1000:.1f}ms", "info"
+        )
+
+    async def load(self, mod_id: str) -> Any:
+        """Build a lazy mod once, concurrent first requests wait for the same build."""
+        async with self._lock:
+            route = self.routes[mod_id]
+            if route.version is None:
+                version = await self._build_async(self.manifests[mod_id])
+                self._install(self.manifests[mod_id], version)
+            return self.mods[mod_id]
+
+    async def warm_up(self, mod_ids: list[str] | None = None) -> None:
+        for mod_id in mod_ids if mod_ids is not None else [mod_id for mod_id, route in self.routes.items() if route.version is None]:
+            await self.load(mod_id)
+
+    async def add(self, mod_id: str) -> None:
+        """Register a mod whose directory appeared after startup."""
+        async with self._lock:
+            if mod_id in self.routes:
+                raise ValueError(f"Mod {mod_id} is already loaded")
+            manifest = self._read_manifest(mod_id)
+            if manifest is None:
+                raise ValueError(f"No manifest for mod {mod_id} in {self.config.path}")
+            self.manifests[mod_id] = manifest
+            self._install(manifest, None if self._is_lazy(manifest) else await self._build_async(manifest))
+
+    async def reload(self, mod_id: str) -> None:
+        """Build the mod again from its current files and swap it in, the old version finishes its requests."""
+        async with self._lock:
+            route = self.routes.get(mod_id)
+            manifest = self._read_manifest(mod_id)
+            if route is None or manifest is None:
+                raise ValueError(f"Mod {mod_id} is not loaded")
+            self._forget_modules(manifest)
+            self.manifests[mod_id] = manifest
+            if route.version is None and self._is_lazy(manifest):
+                route.manifest = manifest
+                return
+            previous = route.version
+            version = await self._build_async(manifest, previous)
+            self._install(manifest, version)
+            self._retire(previous)
+
+    async def unload(self, mod_id: str) -> None:
+        async with self._lock:
+            route = self.routes.pop(mod_id, None)
+            if route is None:
+                raise ValueError(f"Mod {mod_id} is not loaded")
+            self.sisyphus.app.router.routes.remove(route)
+            self.manifests.pop(mod_id, None)
+            self.mods.pop(mod_id, None)
+            if route.version is not None and mod_registry.get(mod_id) is route.version.registered:
+                del mod_registry[mod_id]
+            self._retire(route.version)
+            self._forget_modules(route.manifest)
+            custom_message(f"Unloaded mod {mod_id}", "info")
+
+    def start_watching(self) -> None:
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        """Stop the watcher and wait for the replaced versions to shut down."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        if self._retiring:
+            await asyncio.gather(*self._retiring, return_exceptions=True)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.watch_interval)
+            snapshot = await asyncio.to_thread(self._scan)
+            previous, self._snapshot = self._snapshot, snapshot
+            changes = [(self.add, mod_id) for mod_id in snapshot.keys() - previous.keys()]
+            changes += [(self.unload, mod_id) for mod_id in previous.keys() - snapshot.keys() if mod_id in self.routes]
+            changes += [(self.reload, mod_id) for mod_id in snapshot.keys() & previous.keys() if snapshot[mod_id] != previous[mod_id]]
+            for change, mod_id in changes:
+                try:
+                    await change(mod_id)
+                except (Exception, SystemExit) as e:
+                    # The mod keeps running its previous version. SystemExit too: the settings validators
+                    # exit on a bad value, which must not take the server down with the watcher
+                    custom_message(f"Could not {change.__name__} mod {mod_id}: {e!r}", "error")
+
+    def _scan(self) -> dict[str, float]:
+        # Latest modification time of the files of every mod, keyed by directory name
+        snapshot = {}
+        for directory in Path(self.config.path).iterdir():
+            if directory.name in self.config.exclude or not (directory / f"{directory.name}.toml").is_file():
+                continue
+            snapshot[directory.name] = max(
+                (path.stat().st_mtime for path in directory.rglob("*") if path.is_file() and "__pycache__" not in path.parts),
+                default=0.0,
+            )
+        return snapshot
+
+    def _read_manifest(self, name: str) -> ModManifest | None:
+        manifest_path = Path(self.config.path) / name / f"{name}.toml"
+        if name in self.config.exclude or not manifest_path.is_file():
+            return None
+        # Also parses and validates the mod's [[routes]], the mod reads them from the same snapshot
+        manifest = ModManifest(**load_mod_config(manifest_path).config["mod"])
+        if manifest.entry is None:
+            manifest.entry = f"{Path(self.config.path).name}.{name}.{name}"
+        return manifest
+
+    def _is_lazy(self, manifest: ModManifest) -> bool:
+        return self.config.lazy and manifest.lazy and manifest.endpoint is not None and manifest.mod_id not in self.config.warm_up
+
+    def _module(self, manifest: ModManifest) -> str:
+        return manifest.entry.partition(":")[0]
+
+    def _forget_modules(self, manifest: ModManifest) -> None:
+        # The mod's package and everything under it is imported again from disk
+        module = self._module(manifest)
+        package = module.rpartition(".")[0] or module
+        for name in [name for name in sys.modules if name == package or name.startswith(package + ".")]:
+            del sys.modules[name]
+        importlib.invalidate_caches()
+
+    async def _build_async(self, manifest: ModManifest, previous: ModVersion | None = None) -> ModVersion:
+        # The import is the slow part, kept off the event loop
+        start = time.perf_counter()
+        await asyncio.to_thread(importlib.import_module, self._module(manifest))
+        version = self._build(manifest, (time.perf_counter() - start) * 1000)
+        if version.registered is not None:
+            factory = version.registered.Factory
+            if previous is not None and previous.registered is not None:
+                factory.adopt(previous.registered.Factory)
+            await factory.startup()
+        return version
+
+    def _build(self, manifest: ModManifest, import_ms: float | None = None) -> ModVersion:
+        start = time.perf_counter()
+        module = importlib.import_module(self._module(manifest))
+        imported = time.perf_counter()
+        host = ModHost(self.sisyphus)
+        replaced = mod_registry.get(manifest.mod_id)
+        try:
+            mod = getattr(module, manifest.entry.partition(":")[2] or "Mod")(host)
+        except BaseException:
+            # register_mod may already have replaced the running version's entry
+            if replaced is not None:
+                mod_registry[manifest.mod_id] = replaced
+            else:
+                mod_registry.pop(manifest.mod_id, None)
+            raise
+        built = time.perf_counter()
+        routes = tuple(route for router in host.routers for route in router.routes)
+        import_ms = import_ms if import_ms is not None else (imported - start) * 1000
+        custom_message(
+            f"Loaded mod {manifest.mod_id}: import {import_ms:.1f}ms, routes {(built - imported) * 1000:.1f}ms", "info"
+        )
+        return ModVersion(mod, mod_registry.get(manifest.mod_id), routes)
+
+    def _install(self, manifest: ModManifest, version: ModVersion | None) -> None:
+        route = self.routes.get(manifest.mod_id)
+        if route is None:
+            route = self.routes[manifest.mod_id] = ModRoute(self, manifest)
+            self.sisyphus.app.router.routes.append(route)
+        route.manifest = manifest
+        # The swap, requests routed from here on get the new version
+        route.version = version
+        if version is not None:
+            self.mods[manifest.mod_id] = version.mod
+
+    def _retire(self, version: ModVersion | None) -> None:
+        if version is None:
+            return
+        task = asyncio.create_task(version.retire(self.config.retire_timeout))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
@@ -0,0 +1,215 @@
+"""
+Resilience around upstream calls: retries with jittered backoff under a retry budget,
+hedged requests and a circuit breaker per upstream. One Resilience per RouteFactory.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from core.logging.logging import custom_message
+from core.shared.proxy_definition import CircuitBreakerSettings, HedgeSettings, RetrySettings
+
+# Safe to send twice, RFC 9110 section 9.2.2
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class CircuitOpenError(Exception):
+    """The upstream failed too often lately, calls fail fast until the breaker lets a probe through."""
+
+    def __init__(self, origin: str, retry_in: float) -> None:
+        super().__init__(f"Circuit open for {origin}, retrying in {retry_in:.1f}s")
+        self.origin = origin
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through, consecutive failures are counted.
+    open: calls fail with CircuitOpenError for reset_timeout seconds.
+    half_open: up to half_open_max probe calls go through, one success closes it, one failure opens it again.
+    """
+    __slots__ = ("origin", "settings", "state", "failures", "opened_at", "probes")
+
+    def __init__(self, origin: str, settings: CircuitBreakerSettings) -> None:
+        self.origin = origin
+        self.settings = settings
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def before_call(self) -> None:
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            retry_in = self.opened_at + self.settings.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                raise CircuitOpenError(self.origin, retry_in)
+            self.state, self.probes = "half_open", 0
+        if self.probes >= self.settings.half_open_max:
+            raise CircuitOpenError(self.origin, self.settings.reset_timeout)
+        self.probes += 1
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            custom_message(f"Circuit for {self.origin} closed again", "info")
+        self.state, self.failures = "closed", 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.settings.failure_threshold:
+            if self.state != "open":
+                custom_message(f"Circuit for {self.origin} opened after {self.failures} failures", "warning")
+            self.state, self.opened_at = "open", time.monotonic()
+
+    def release(self) -> None:
+        # The call never reached the upstream (shed or cancelled), give its probe back
+        if self.state == "half_open" and self.probes:
+            self.probes -= 1
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges to a share of the traffic so they can't multiply the load on an upstream
+    that is already struggling. Every request deposits `ratio` tokens, every retry takes one,
+    and `min_per_second` tokens trickle in so low traffic can still retry.
+    """
+    __slots__ = ("ratio", "min_per_second", "cap", "tokens", "updated_at")
+
+    def __init__(self, ratio: float, min_per_second: float) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = max(min_per_second * 10, 10.0)
+        self.tokens = self.cap
+        self.updated_at = time.monotonic()
+
+    def _refill(self, amount: float = 0.0) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.cap, self.tokens + amount + (now - self.updated_at) * self.min_per_second)
+        self.updated_at = now
+
+    def deposit(self) -> None:
+        self._refill(self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def backoff(attempt: int, settings: RetrySettings) -> float:
+    # Full jitter, so retries from many clients don't line up
+    return random.uniform(0, min(settings.max_backoff, settings.backoff * 2 ** attempt))
+
+
+async def discard(response: Any) -> None:
+    # Hands the connection of a response nobody will read back to the pool
+    close = getattr(response, "aclose", None)
+    if close is not None:
+        await close()
+    else:
+        response.close()
+
+
+class Resilience:
+    def __init__(self, circuit_breaker: CircuitBreakerSettings | None, budget: RetrySettings) -> None:
+        self.circuit_breaker = circuit_breaker
+        self.budget = RetryBudget(budget.budget_ratio, budget.budget_min_per_second)
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, origin: str) -> CircuitBreaker | None:
+        if self.circuit_breaker is None:
+            return None
+        breaker = self.breakers.get(origin)
+        if breaker is None:
+            breaker = self.breakers[origin] = CircuitBreaker(origin, self.circuit_breaker)
+        return breaker
+
+    async def call(
+        self,
+        pick: Callable[[], Any],
+        send: Callable[[Any], Awaitable[Any]],
+        errors: tuple[type[BaseException], ...],
+        retries: RetrySettings | None = None,
+        hedge: HedgeSettings | None = None,
+    ) -> Any:
+        """
+        Call an upstream: pick() chooses it (anything with an origin, see core.factory.balancer)
+        and send(upstream) makes the call, so every retry and hedge can go to another host.
+        retries and hedge are None for calls that must not be repeated (non-idempotent methods,
+        streamed request bodies).
+        Raises CircuitOpenError while the breaker is open, otherwise the last error of send().
+        """
+        self.budget.deposit()
+        # Retried statuses, the breaker counts its own whatever the method
+        statuses = retries.statuses if retries is not None else ()
+
+        async def attempt():
+            upstream = pick()
+            breaker = self.breaker(upstream.origin)
+            if breaker is None:
+                return await send(upstream)
+            breaker.before_call()
+            try:
+                response = await send(upstream)
+            except errors:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            if response.status_code in breaker.settings.statuses:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+        tries = 0
+        while True:
+            try:
+                response = await (self._hedged(attempt, hedge) if hedge is not None else attempt())
+            except errors:
+                if not self._may_retry(tries, retries):
+                    raise
+            else:
+                if response.status_code not in statuses or not self._may_retry(tries, retries):
+                    return response
+                await discard(response)
+            await asyncio.sleep(backoff(tries, retries))
+            tries += 1
+
+    def _may_retry(self, attempt: int, retries: RetrySettings | None) -> bool:
+        return retries is not None and attempt < retries.max_retries and self.budget.withdraw()
+
+    async def _hedged(self, send: Callable[[], Awaitable[Any]], hedge: HedgeSettings) -> Any:
+        # A second copy of a slow request goes out after hedge.delay, whichever answers first wins
+        pending = {asyncio.ensure_future(send())}
+        winner = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge.delay)
+            if not done and self.budget.withdraw():
+                pending.add(asyncio.ensure_future(send()))
+            while winner is None:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None and (task.exception() is None or not pending):
+                        winner = task
+                    elif task.exception() is None:
+                        await discard(task.result())
+                done = set()
+            return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard_late)
+
+
+def _discard_late(task: asyncio.Task) -> None:
+    # The losing copy of a hedged call may still have answered, close its connection
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()))
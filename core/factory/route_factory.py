@@ -1,70 +1,231 @@
 from pydantic import BaseModel
 from core.authentication.authentication import AuthenticationHandler
-from core.logging.logging import check_post_require, log_route_creation
-from typing import Final, Any, Tuple
+from core.authentication.credentials import CredentialError, CredentialProvider, build_credentials
+from core.logging.logging import check_post_require, custom_message, log_route_creation
+from typing import Final, Any, Tuple, AsyncIterator, Callable
 
 from fastapi import APIRouter, Request, Depends, Response as FastAPIResponse
-from httpx import AsyncClient, Response, Client, RequestError
+from httpx import AsyncClient, AsyncBaseTransport, Limits, Response, Client, RequestError, TimeoutException
 from core.types.types import AuthenticationTypes
 import requests
+from requests.adapters import HTTPAdapter
 
-import json
+import time
+import asyncio
 import inspect
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 
-
-from core.scripts.transform import (
-    fast_json_process,
-    parallel_data_transform,
-    convert_dict_to_array,
-    convert_array_to_dict
-)
+from core.scripts.transform_stage import apply_transform, transform_json_bytes, validate_transform, warmup_transforms
 from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
-
-def _make_request_with_data(method_func, url, _headers, _params, _data, _auth):
-    # Check if content-type is application/vnd.api+json (case insensitive)
-    content_type = None
-    if _headers:
-        for key, value in _headers.items():
-            if key.lower() == 'content-type':
-                content_type = value.lower()
-                break
-    
-    if content_type == 'application/vnd.api+json':
-        print(f"Using JSON:API content-type with data: {_data}")
-        # Use content instead of json to preserve the custom content-type
-        content = json.dumps(_data).encode('utf-8') if _data else None
-        headers = {
-            'Content-Type': 'application/vnd.api+json',
-            'Authorization': _auth
-        }
-
-        return requests.request("POST", url, headers=headers, data=content)
-    else:
-        # Use json parameter for standard JSON requests
-        return method_func(url, params=_params, headers=_headers, json=_data, auth=_auth, follow_redirects=True)
+from core.logging.cache import CacheEntry, get_cache, get_cache_config, make_cache_key
+from core.logging.cache_control import cache_lifetime, not_modified
+from core.factory.singleflight import SingleFlight
+from core.factory.route_plan import RoutePlan
+from core.factory.resilience import CircuitOpenError, Resilience
+from core.factory.balancer import Balancer, Upstream
+from core.factory.trie_router import TrieRouter
+from core.factory.validate import RouteEntry
+from core.middleware.concurrency import Overloaded
+from core.logging.metrics import add_time, current_timing, get_metrics, mark_body_read, mark_cache, on_upstream_request, on_upstream_response, RequestTiming
+from core.scripts.stream import is_streaming_transform, iter_upstream
+from core.shared import codec
+from core.shared.codec import ParsedBody
+from core.shared.compression import get_compression_config, gzip_body, should_compress
+
+def _encode_body(_headers, _data):
+    # Raw bytes and passed through request streams go out untouched, everything else is encoded as JSON once
+    if _data is None or isinstance(_data, (bytes, AsyncIterator)):
+        return _headers, _data
+    if not any(key.lower() == 'content-type' for key in _headers):
+        _headers = {**_headers, 'Content-Type': 'application/json'}
+    return _headers, codec.dumps(_data)
+
+def _make_request_with_data(client, method, url, _headers, _params, _data, _auth, _timeout):
+    # A Content-Type the route or client set (application/vnd.api+json and the like) is kept, the body is still encoded as JSON
+    _headers, content = _encode_body(_headers, _data)
+    return client.request(method, url, params=_params, headers=_headers, content=content, auth=_auth, timeout=_timeout, follow_redirects=True)
+
+# Connection-level headers (RFC 9110 section 7.6.1) are never forwarded
+HOP_BY_HOP_HEADERS: Final = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "proxy-connection",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+})
+# Describe the body as it came off the wire, they no longer apply once httpx has decoded it
+ENCODING_HEADERS: Final = frozenset({"content-encoding", "content-length"})
+# Meant for the one client that caused the upstream call, never stored in the shared cache
+UNCACHED_HEADERS: Final = frozenset({"set-cookie", "set-cookie2"})
+
+
+def forwardable_headers(headers, decoded: bool = True) -> dict[str, str]:
+    """Upstream response headers that are safe to pass on to the client, with lowercase names."""
+    drop = HOP_BY_HOP_HEADERS | ENCODING_HEADERS if decoded else HOP_BY_HOP_HEADERS
+    connection = headers.get("connection")
+    if connection:
+        drop = drop | {h.strip().lower() for h in connection.split(",")}
+    return {k.lower(): v for k, v in headers.items() if k.lower() not in drop}
+
+
+def _pool_settings(proxy: ProxyDefinition) -> tuple:
+    settings = proxy.mod_settings
+    return (settings.http2, settings.max_connections, settings.max_keepalive_connections, settings.keepalive_expiry, settings.requests_max_workers)
+
+
+# The requests based routes identify themselves upstream, same as the custom routes
+REQUESTS_HEADERS: Final = {"User-Agent": "Mozilla/5.0 (compatible; ProxyBot/1.0)"}
 
 method_creation  = {
-    "GET": lambda client, url, _headers, _params, _data, _auth: 
-        client.get(url, params=_params, headers=_headers, auth=_auth, follow_redirects=True),
-    "POST": lambda client, url, _headers, _params, _data, _auth:
-        _make_request_with_data(client.post, url, _headers, _params, _data, _auth),
-    "PUT": lambda client, url, _headers, _params, _data, _auth:
-        _make_request_with_data(client.put, url, _headers, _params, _data, _auth),
-    "PATCH": lambda client, url, _headers, _params, _data, _auth:
-        _make_request_with_data(client.patch, url, _headers, _params, _data, _auth),
-    "DELETE": lambda client, url, _headers, _params, _data, _auth:
-        client.delete(url, params=_params, headers=_headers, auth=_auth, follow_redirects=True)
+    "GET": lambda client, url, _headers, _params, _data, _auth, _timeout: 
+        client.get(url, params=_params, headers=_headers, auth=_auth, timeout=_timeout, follow_redirects=True),
+    "POST": lambda client, url, _headers, _params, _data, _auth, _timeout:
+        _make_request_with_data(client, "POST", url, _headers, _params, _data, _auth, _timeout),
+    "PUT": lambda client, url, _headers, _params, _data, _auth, _timeout:
+        _make_request_with_data(client, "PUT", url, _headers, _params, _data, _auth, _timeout),
+    "PATCH": lambda client, url, _headers, _params, _data, _auth, _timeout:
+        _make_request_with_data(client, "PATCH", url, _headers, _params, _data, _auth, _timeout),
+    "DELETE": lambda client, url, _headers, _params, _data, _auth, _timeout:
+        client.delete(url, params=_params, headers=_headers, auth=_auth, timeout=_timeout, follow_redirects=True)
 }
 
 
 class RouteFactory:
-    def __init__(self, proxy: ProxyDefinition) -> None:
+    def __init__(self, proxy: ProxyDefinition, transport: AsyncBaseTransport | None = None) -> None:
         self.proxy: ProxyDefinition = proxy
         self.router: Final[APIRouter] = APIRouter()
-
+        # Long-lived upstream client, opened by Sisyphus on startup and shared by every route
+        self.client: AsyncClient | None = None
+        self._transport: AsyncBaseTransport | None = transport
+        # The requests based routes run on their own bounded pool so they never block the event loop
+        self._requests_executor: ThreadPoolExecutor | None = None
+        self._requests_session: requests.Session | None = None
+        # Identical in-flight GETs of routes with coalesce=True share one upstream call
+        self.singleflight: SingleFlight = SingleFlight()
+        # Background revalidations of stale cache entries, kept so they aren't garbage collected mid-flight
+        self._background_tasks: set[asyncio.Task] = set()
+        # Set once any route declares a transform stage, the numba kernels are then compiled on startup
+        self.uses_transforms: bool = False
+        # Retry budget and circuit breakers, shared by every route of the mod
+        self.resilience: Resilience = Resilience(proxy.mod_settings.circuit_breaker, proxy.mod_settings.retries)
+        # Picks one of the target_url upstreams for every call
+        self.balancer: Balancer = Balancer(proxy.targets, proxy.mod_settings.balancer)
+        # Proxy routes of dispatch = "trie" mods, one entry of self.router created with the first of them
+        self.trie: TrieRouter | None = None
+        # Upstream credentials of every route without its own auth, from ProxyDefinition.credentials or [mod_settings.credentials]
+        self.credentials: CredentialProvider | None = proxy.credentials or (
+            build_credentials(proxy.mod_settings.credentials, transport) if proxy.mod_settings.credentials else None
+        )
+        # Upstream calls in flight, read by sisyphus_upstream_requests_in_flight of /metrics
+        self.in_flight: int = 0
+        # Set once a reloaded version of the mod took over the client and the requests pool
+        self._handed_over: bool = False
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.watch(proxy.endpoint, self)
+
+    def _build_client(self) -> AsyncClient:
+        settings = self.proxy.mod_settings
+        # Timestamps the upstream phases of the request being measured, see core.logging.metrics
+        hooks = {"request": [on_upstream_request], "response": [on_upstream_response]} if get_metrics() is not None else None
+        return AsyncClient(
+            event_hooks=hooks,
+            http2=settings.http2,
+            headers={"User-Agent": "Mozilla/5.0 (compatible; ProxyBot/1.0)"},
+            limits=Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry
+            ),
+            transport=self._transport
+        )
+
+    def get_client(self) -> AsyncClient:
+        # Factories used outside of a Sisyphus app (tests, scripts) open their client lazily
+        if self.client is None or self.client.is_closed:
+            self.client = self._build_client()
+        return self.client
+
+    def get_requests_session(self) -> requests.Session:
+        if self._requests_session is None:
+            workers = self.proxy.mod_settings.requests_max_workers
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session = requests.Session()
+            session.headers["User-Agent"] = "Mozilla/5.0 (compatible; ProxyBot/1.0)"
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._requests_session = session
+            self._requests_executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix=f"sisyphus-requests{self.proxy.endpoint.replace('/', '-')}"
+            )
+        return self._requests_session
+
+    async def run_requests(self, method: str, url: str, **kwargs) -> requests.Response:
+        session = self.get_requests_session()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._requests_executor, partial(session.request, method, url, **kwargs))
+
+    async def startup(self) -> None:
+        self.balancer.start_health_checks(self.get_client())
+        if self.uses_transforms:
+            # Compiled on the loop thread on purpose: numba's parallel threading layer
+            # has to be started by the thread that later runs the kernels
+            warmup_transforms()
+
+    def adopt(self, previous: "RouteFactory") -> bool:
+        """
+        Take over the open upstream pools of the factory this one replaces on a reload, so the
+        new version starts with warm connections. Only done when the pool settings are unchanged.
+        """
+        if previous.client is None or previous.client.is_closed or previous._transport is not self._transport:
+            return False
+        if _pool_settings(previous.proxy) != _pool_settings(self.proxy):
+            return False
+        self.client = previous.client
+        self._requests_session = previous._requests_session
+        self._requests_executor = previous._requests_executor
+        previous._handed_over = True
+        return True
+
+    async def shutdown(self, drain_timeout: float = 5.0) -> None:
+        await self.balancer.stop_health_checks()
+        await self.drain(drain_timeout)
+        if self.credentials is not None:
+            await self.credentials.close()
+        if self._handed_over:
+            # The pools live on in the factory that adopted them
+            self.client = None
+            self._requests_executor = None
+            self._requests_session = None
+            return
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self._requests_executor is not None:
+            self._requests_executor.shutdown(wait=False, cancel_futures=True)
+            self._requests_session.close()
+            self._requests_executor = None
+            self._requests_session = None
+
+    async def drain(self, timeout: float) -> None:
+        """Wait up to timeout seconds for the background revalidations, then cancel what is left."""
+        if not self._background_tasks:
+            return
+        _, pending = await asyncio.wait(set(self._background_tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            custom_message(f"Cancelled {len(pending)} background revalidations on shutdown", "warning")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+    def create_routes(self, routes: list[RouteEntry]) -> None:
+        """Register the [[routes]] of a mod's TOML, see LoadedTomlConfigs.load_routes."""
+        for entry in routes:
+            getattr(self, entry.factory_method)(entry.definition, **entry.callbacks())
 
     def create_custom_router(self, proxy_route_def, _in_callback: Any = None) -> None:
         handler = self._create_custom_handler(proxy_route_def, _in_callback)
@@ -113,8 +274,13 @@ class RouteFactory:
 
         
     def create_router_param(self, proxy_route_def: ProxyRouteDefinition, _in_callback: Any = None, _out_callback: Any=None) -> None:
-        handler = self._create_handler_path_param(proxy_route_def.method, proxy_route_def, _in_callback, _out_callback)
+        self._register_transforms(proxy_route_def)
+        self._check_stream_callback(proxy_route_def, _out_callback)
+        handler = self._create_handler_path_param(self._compile(proxy_route_def, _in_callback, _out_callback))
         route_path: str = str(self.proxy.endpoint) + str(proxy_route_def.route)
+        if self._add_to_trie(route_path, proxy_route_def.method, handler, bool(proxy_route_def.params)):
+            log_route_creation(route_path, proxy_route_def.method, message="with parameters (trie)")
+            return
         route_kwargs = {
             "path": route_path,
             "endpoint": handler,
@@ -140,8 +306,13 @@ class RouteFactory:
 
         
     def create_router(self, proxy_route_def: ProxyRouteDefinition, _in_callback: Any =None, _out_callback: Any =None) -> None:
-        handler = self._create_handler(proxy_route_def.method, proxy_route_def, _in_callback, _out_callback)
+        self._register_transforms(proxy_route_def)
+        self._check_stream_callback(proxy_route_def, _out_callback)
+        handler = self._create_handler(self._compile(proxy_route_def, _in_callback, _out_callback))
         route_path = str(self.proxy.endpoint) + str(proxy_route_def.route)
+        if self._add_to_trie(route_path, proxy_route_def.method, handler, False):
+            log_route_creation(route_path, proxy_route_def.method, message="(trie)")
+            return
         route_kwargs = {
             "path": route_path,
             "endpoint": handler,
@@ -159,8 +330,12 @@ class RouteFactory:
         log_route_creation(route_path, proxy_route_def.method)
 
     def create_requests_router_param(self, proxy_route_def: ProxyRouteDefinition, _in_callback: Any = None, _out_callback: Any=None) -> None:
-        handler = self._create_requests_handler_path_param(proxy_route_def.method, proxy_route_def, _in_callback, _out_callback)
+        self._register_transforms(proxy_route_def)
+        handler = self._create_requests_handler_path_param(self._compile(proxy_route_def, _in_callback, _out_callback, REQUESTS_HEADERS))
         route_path: str = str(self.proxy.endpoint) + str(proxy_route_def.route)
+        if self._add_to_trie(route_path, proxy_route_def.method, handler, bool(proxy_route_def.params)):
+            log_route_creation(route_path, proxy_route_def.method, message="with parameters (requests) (trie)")
+            return
         route_kwargs = {
             "path": route_path,
             "endpoint": handler,
@@ -170,8 +345,8 @@ class RouteFactory:
         }
         if proxy_route_def.params:
             get_params = self.get_param_dict(proxy_route_def.params)
-            def wrapper(request: Request, path_params: Any = get_params) -> Any:
-                return handler(request, **path_params)
+            async def wrapper(request: Request, path_params: Any = get_params) -> Any:
+                return await handler(request, **path_params)
             route_kwargs["endpoint"] = wrapper
         
         if hasattr(proxy_route_def, '_name') and proxy_route_def._name:
@@ -185,8 +360,12 @@ class RouteFactory:
         log_route_creation(route_path, proxy_route_def.method, message="with parameters (requests)")
 
     def create_requests_router(self, proxy_route_def: ProxyRouteDefinition, _in_callback: Any =None, _out_callback: Any =None) -> None:
-        handler = self._create_requests_handler(proxy_route_def.method, proxy_route_def, _in_callback, _out_callback)
+        self._register_transforms(proxy_route_def)
+        handler = self._create_requests_handler(self._compile(proxy_route_def, _in_callback, _out_callback, REQUESTS_HEADERS))
         route_path = str(self.proxy.endpoint) + str(proxy_route_def.route)
+        if self._add_to_trie(route_path, proxy_route_def.method, handler, False):
+            log_route_creation(route_path, proxy_route_def.method, message="(requests) (trie)")
+            return
         route_kwargs = {
             "path": route_path,
             "endpoint": handler,
@@ -204,6 +383,95 @@ class RouteFactory:
         log_route_creation(route_path, proxy_route_def.method, message="(requests)")
 
 
+    async def _cache_lookup(self, method: str, url: str, params: dict, request: Request, proxy_route_def: ProxyRouteDefinition) -> tuple[str | None, CacheEntry | None]:
+        # Only idempotent GETs on routes that opted in are cached, streamed bodies never are
+        if method != "GET" or proxy_route_def.cache is None or proxy_route_def.stream:
+            return None, None
+        cache = get_cache()
+        if cache is None:
+            return None, None
+        key = make_cache_key(method, url, params, request.headers, proxy_route_def.cache.vary_headers)
+        entry = await cache.get(key)
+        mark_cache("miss" if entry is None else "hit" if entry.is_fresh() else "stale")
+        return key, entry
+
+    async def _cache_store(self, key: str | None, proxy_route_def: ProxyRouteDefinition, status_code: int, headers, body: ParsedBody) -> None:
+        cache = get_cache()
+        if key is None or cache is None or status_code != 200:
+            return
+        # Replayed to everyone who gets a hit, a cookie would hand one client's session to the others
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() not in UNCACHED_HEADERS}
+        default_ttl = proxy_route_def.cache.ttl if proxy_route_def.cache.ttl is not None else get_cache_config().cache_duration
+        lifetime = cache_lifetime(headers, default_ttl, proxy_route_def.cache.stale_while_revalidate)
+        if lifetime is None:
+            return
+        ttl, stale = lifetime
+        entry = CacheEntry(body=body.raw, status_code=status_code, headers=headers)
+        entry.expires_at = entry.stored_at + ttl
+        entry.stale_until = entry.expires_at + stale
+        await cache.set(key, entry, self._retention(entry, default_ttl))
+
+    async def _cache_refresh(self, key: str, proxy_route_def: ProxyRouteDefinition, entry: CacheEntry, headers) -> CacheEntry:
+        # The upstream answered a conditional request with a 304, the stored body is still good
+        cache = get_cache()
+        headers = {k.lower(): v for k, v in headers.items()}
+        entry.headers.update({k: v for k, v in headers.items() if k in {"etag", "last-modified", "cache-control", "expires"}})
+        default_ttl = proxy_route_def.cache.ttl if proxy_route_def.cache.ttl is not None else get_cache_config().cache_duration
+        ttl, stale = cache_lifetime(entry.headers, default_ttl, proxy_route_def.cache.stale_while_revalidate) or (0, 0)
+        entry.stored_at = time.time()
+        entry.expires_at = entry.stored_at + ttl
+        entry.stale_until = entry.expires_at + stale
+        if cache is not None:
+            await cache.set(key, entry, self._retention(entry, default_ttl))
+        return entry
+
+    def _retention(self, entry: CacheEntry, default_ttl: int) -> float:
+        # Entries with validators outlive their stale window so they can still be revalidated with a 304
+        extra = default_ttl if entry.validators() else 0
+        return max(entry.stale_until - entry.stored_at + extra, 1)
+
+    def _revalidate_in_background(self, key: str, fetch, entry: CacheEntry) -> None:
+        async def revalidate():
+            try:
+                await self.singleflight.do(("revalidate", key), lambda: fetch(entry))
+            except Exception as e:
+                custom_message(f"Background revalidation failed: {str(e)}", "warning")
+
+        task = asyncio.ensure_future(revalidate())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _coalesce_key(self, url: str, params: dict, headers: dict, proxy_route_def: ProxyRouteDefinition) -> tuple:
+        # Callers only share a response when they would have sent the same request with the same credentials
+        auth_identity = next((v for k, v in headers.items() if k.lower() == "authorization"), None)
+        return id(proxy_route_def), url, tuple(sorted((str(k), str(v)) for k, v in params.items())), auth_identity
+
+    def _has_request_body(self, request: Request) -> bool:
+        if "transfer-encoding" in request.headers:
+            return True
+        return request.headers.get("content-length", "0") != "0"
+
+    def _register_transforms(self, proxy_route_def: ProxyRouteDefinition) -> None:
+        if proxy_route_def.response_transform or proxy_route_def.request_transform or proxy_route_def.column_transforms:
+            self.uses_transforms = True
+
+    def _check_stream_callback(self, proxy_route_def: ProxyRouteDefinition, _out_callback: Any) -> None:
+        if proxy_route_def.stream and _out_callback and not is_streaming_transform(_out_callback):
+            custom_message(
+                f"{proxy_route_def.route} is streamed, its out callback {_out_callback.__name__} will be skipped. "
+                "Mark it with @streaming_transform to run it on every chunk.",
+                "warning"
+            )
+
+    def _add_to_trie(self, route_path: str, method: str, handler: Callable, path_params: bool) -> bool:
+        # False leaves the route to FastAPI: dispatch = "fastapi", or a path the trie can't express
+        if self.proxy.mod_settings.dispatch != "trie":
+            return False
+        if self.trie is None:
+            self.trie = TrieRouter()
+            self.router.routes.append(self.trie)
+        return self.trie.add(route_path, method, handler, path_params)
+
     def get_param_dict(self, param_names: list[str]) -> Any | None:
         def dependency_func(**kwargs):
             return kwargs
@@ -216,105 +484,205 @@ class RouteFactory:
 
 
     
-    def _process_response_data(self, response_data) -> bytes:
+    def _process_response_data(self, response_data, transform: str | dict[str, str] | None = None) -> ParsedBody:
+        # Routes without a transform stage pass the body through without parsing it
+        body = response_data if isinstance(response_data, ParsedBody) else ParsedBody(response_data)
+        if transform is None or not body.raw:
+            return body
+        start = time.perf_counter()
         try:
-            if response_data and isinstance(response_data, bytes):
-                try:
-                    data_dict = json.loads(response_data.decode('utf-8'))
-                    if isinstance(data_dict, dict):
-                        data_array = convert_dict_to_array(data_dict)
-                        if len(data_array) > 0:
-                            processed_array = fast_json_process(data_array)
-                            processed_dict = convert_array_to_dict(data_dict, processed_array)
-                            return json.dumps(processed_dict).encode('utf-8')
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    pass
-            return response_data
+            data = body.json()
+            if isinstance(data, (dict, list)):
+                apply_transform(data, transform)
+                body.mark_dirty()
+        except codec.DecodeError:
+            pass
         except Exception as e:
-            print(f"Error processing response: {str(e)}")
-            return response_data
-
-    def _process_request_data(self, request_data):
+            custom_message(f"Error processing response: {str(e)}", "warning")
+        add_time("transform", time.perf_counter() - start)
+        return body
+
+    def _apply_out_callback(self, body: ParsedBody, _out_callback) -> ParsedBody | FastAPIResponse:
+        # Callbacks get the ParsedBody, they can change body.json() in place (and call body.mark_dirty()),
+        # body.status_code and body.headers, return a new body or return a whole Response
+        if _out_callback is None:
+            return body
+        start = time.perf_counter()
+        result = _out_callback(body)
+        add_time("callback", time.perf_counter() - start)
+        if result is None or result is body:
+            return body
+        if isinstance(result, (ParsedBody, FastAPIResponse)):
+            return result
+        if isinstance(result, (bytes, bytearray)):
+            return ParsedBody(bytes(result), status_code=body.status_code, headers=body.headers)
+        if isinstance(result, str):
+            return ParsedBody(result.encode("utf-8"), status_code=body.status_code, headers=body.headers)
+        body.set(result)
+        return body
+
+    async def _build_response(self, body: ParsedBody | FastAPIResponse, request: Request) -> FastAPIResponse:
+        # The body bytes go out as they are, only a body a hook changed is encoded again
+        if isinstance(body, FastAPIResponse):
+            return body
+        headers = body.headers
+        if body.decoded and "content-type" not in headers:
+            headers["content-type"] = "application/json"
+        content = body.raw
+        if should_compress(headers, len(content), request.headers.get("accept-encoding")):
+            content = await gzip_body(content)
+            headers["content-encoding"] = "gzip"
+            headers["vary"] = f"{headers['vary']}, Accept-Encoding" if headers.get("vary") else "Accept-Encoding"
+        return FastAPIResponse(content=content, status_code=body.status_code, headers=headers)
+
+    def _cached_body(self, entry: CacheEntry) -> ParsedBody:
+        return ParsedBody(entry.body, status_code=entry.status_code, headers=forwardable_headers(entry.headers))
+
+    def _check_body(self, method: str, request_body: Any) -> FastAPIResponse | None:
+        # A POST without a body is the client's mistake, answered with a 400 before anything goes upstream
         try:
-            if request_data and isinstance(request_data, bytes):
-                try:
-                    data_dict = json.loads(request_data.decode('utf-8'))
-                    if isinstance(data_dict, dict):
-                        data_array = convert_dict_to_array(data_dict)
-                        if len(data_array) > 0:
-                            processed_array = parallel_data_transform(data_array)
-                            processed_dict = convert_array_to_dict(data_dict, processed_array)
-                            return json.dumps(processed_dict).encode('utf-8')
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    pass
+            check_post_require(method, request_body)
+        except ValueError:
+            error_response = {"error": f"{method} request requires a body", "status": "failed"}
+            return FastAPIResponse(content=codec.dumps(error_response), status_code=400, media_type="application/json")
+        return None
+
+    def _error_response(self, e: Exception) -> FastAPIResponse:
+        error_response = {
+            "error": f"Error proxying request: {str(e)}",
+            "status": "failed"
+        }
+        headers = None
+        if isinstance(e, CircuitOpenError):
+            status_code, headers = 503, {"Retry-After": str(max(int(e.retry_in), 1))}
+        elif isinstance(e, Overloaded):
+            status_code, headers = 503, {"Retry-After": str(max(int(e.retry_after), 1))}
+        elif isinstance(e, (TimeoutException, requests.Timeout)):
+            status_code = 504
+        else:
+            status_code = 502
+        return FastAPIResponse(content=codec.dumps(error_response), status_code=status_code, headers=headers, media_type="application/json")
+
+    def _process_request_data(self, request_data, transform: str | None = None):
+        if transform is None:
             return request_data
+        try:
+            if request_data and isinstance(request_data, bytes):
+                return transform_json_bytes(request_data, transform)
+            return apply_transform(request_data, transform)
         except Exception as e:
-            print(f"Error processing request: {str(e)}")
+            custom_message(f"Error processing request: {str(e)}", "warning")
             return request_data
 
-    def _create_handler_path_param(self, method: str, proxy_route_def: ProxyRouteDefinition, _in_callback:BaseModel | None = None, _out_callback:BaseModel | None = None):
+    def _compile(self, proxy_route_def: ProxyRouteDefinition, _in_callback: Any = None, _out_callback: Any = None, extra_headers: dict[str, str] | None = None) -> RoutePlan:
+        return RoutePlan.compile(
+            self.proxy, proxy_route_def, method_creation[proxy_route_def.method], extra_headers, _in_callback, _out_callback, self.credentials
+        )
+
+    def _instrumented(self, plan: RoutePlan, handle: Callable) -> Callable:
+        # Outermost, so the latency includes the time spent waiting on the route's limits
+        metrics = plan.metrics
+        if metrics is None:
+            return handle
+
+        async def instrumented(path: str, request: Request, plan: RoutePlan, path_params: dict | None = None):
+            timing = RequestTiming()
+            token = current_timing.set(timing)
+            status, bytes_out = 500, 0
+            try:
+                response = await handle(path, request, plan, path_params)
+                status = response.status_code
+                # Streamed bodies are counted by their Content-Length when the upstream sent one
+                bytes_out = len(response.body) if hasattr(response, "body") else int(response.headers.get("content-length", 0))
+                return response
+            finally:
+                current_timing.reset(token)
+                metrics.record(timing, status, int(request.headers.get("content-length", 0)), bytes_out)
+        return instrumented
+
+    def _limited(self, plan: RoutePlan, handle: Callable) -> Callable:
+        # Routes without rate_limit or concurrency call the handle directly
+        limits = plan.limits
+        if limits is None:
+            return handle
+
+        async def limited(path: str, request: Request, plan: RoutePlan, path_params: dict | None = None):
+            return await limits.run(request.scope, lambda: handle(path, request, plan, path_params))
+        return limited
+
+    def _create_handler_path_param(self, plan: RoutePlan):
+        handle = self._instrumented(plan, self._limited(plan, self.httpx_request_handle))
         async def handler(request: Request, **path_params: dict[str, str]):
-            url = str(str(self.proxy.target_url) + proxy_route_def.url_route).format(**path_params)
-            return await self.httpx_request_handle(
-                url, request, method, proxy_route_def, _in_callback, _out_callback
-            )
+            return await handle(plan.path(path_params), request, plan, path_params)
         return handler
 
-    def _create_handler(self, method: str, proxy_route_def: ProxyRouteDefinition,  _in_callback:BaseModel | None = None, _out_callback:BaseModel | None = None):
+    def _create_handler(self, plan: RoutePlan):
+        handle = self._instrumented(plan, self._limited(plan, self.httpx_request_handle))
         async def handler(request: Request):
-            url = str(str(self.proxy.target_url) + proxy_route_def.url_route)
-
-            return await self.httpx_request_handle(
-                url, request, method, proxy_route_def, _in_callback, _out_callback
-            )
+            return await handle(plan.path_template, request, plan)
         return handler
 
-    def _create_requests_handler_path_param(self, method: str, proxy_route_def: ProxyRouteDefinition, _in_callback:BaseModel | None = None, _out_callback:BaseModel | None = None):
-        def handler(request: Request, **path_params: dict[str, str]):
-            url = str(str(self.proxy.target_url) + proxy_route_def.url_route).format(**path_params)
-            return self.requests_request_handle(
-                url, request, method, proxy_route_def, _in_callback, _out_callback
-            )
+    def _create_requests_handler_path_param(self, plan: RoutePlan):
+        handle = self._instrumented(plan, self._limited(plan, self.requests_request_handle))
+        async def handler(request: Request, **path_params: dict[str, str]):
+            return await handle(plan.path(path_params), request, plan, path_params)
         return handler
 
-    def _create_requests_handler(self, method: str, proxy_route_def: ProxyRouteDefinition,  _in_callback:BaseModel | None = None, _out_callback:BaseModel | None = None):
+    def _create_requests_handler(self, plan: RoutePlan):
+        handle = self._instrumented(plan, self._limited(plan, self.requests_request_handle))
         async def handler(request: Request):
-            url = str(str(self.proxy.target_url) + proxy_route_def.url_route)
-
-            return await self.requests_request_handle(
-                url, request, method, proxy_route_def, _in_callback, _out_callback
-            )
+            return await handle(plan.path_template, request, plan)
         return handler
 
-    async def requests_request_handle(self, url: str, request: Request, method, proxy_def_route: ProxyRouteDefinition, _in_callback=None, _out_callback=None):
-        headers = dict(proxy_def_route.headers) if proxy_def_route.headers else {}
-        headers["User-Agent"] = "Mozilla/5.0 (compatible; ProxyBot/1.0)"
-        
-        print(f"Incoming request headers: {dict(request.headers)}")
-        for key, value in request.headers.items():
-            if key.lower() in {'content-type', 'authorization', 'accept'}:
-                # Avoid duplicate headers by checking if key already exists
-                if key.lower() not in [k.lower() for k in headers.keys()]:
-                    headers[key] = value
-        print(f"Final headers for request: {headers}")
-        if self.proxy.header:
-            headers = {k: v for k, v in headers.items()
-                    if k.lower() not in {h.lower() for h in self.proxy.header}}
-        
+    async def _add_credentials(self, plan: RoutePlan, headers: dict[str, str]) -> str | None:
+        # Cached by the provider, a request only waits here while a token is fetched for the first time or after a 401
+        if plan.credentials is None:
+            return None
+        value = await plan.credentials.value()
+        headers[plan.credentials.header] = value
+        return value
+
+    def _check_rejected(self, plan: RoutePlan, credential: str | None, status_code: int) -> None:
+        # The upstream no longer takes the credentials (revoked, rotated), the next request fetches new ones
+        if credential is not None and status_code == 401:
+            plan.credentials.invalidate(credential)
+
+    async def _send(self, upstream: Upstream, call: Callable) -> Any:
+        self.in_flight += 1
+        try:
+            return await self.balancer.send(upstream, call)
+        finally:
+            self.in_flight -= 1
+
+    def _picker(self, path: str, path_params: dict | None) -> Callable[[], Upstream]:
+        # consistent_hash keeps every value of hash_param on the same upstream, the other strategies ignore the key
+        balancer = self.balancer
+        hash_param = balancer.settings.hash_param
+        key = str(path_params[hash_param]) if hash_param and path_params and hash_param in path_params else path
+        return lambda: balancer.pick(key)
+
+    async def requests_request_handle(self, path: str, request: Request, plan: RoutePlan, path_params: dict | None = None):
+        method, proxy_def_route = plan.method, plan.route
+        url = plan.base + path
+        _in_callback, _out_callback = plan.in_callback, plan.out_callback
+        headers = plan.build_headers(request.headers.raw)
         query_params = "" # ?example=1
-        params = dict(request.query_params)
+        params = plan.build_params(request.query_params)
         request_body = None
         
-        if method in {"POST", "PUT", "PATCH"}:
+        if plan.has_body and not plan.merges_body:
+            # Forwarded as the raw bytes, requests can't read the ASGI stream from its worker thread
+            request_body = await request.body() or None
+        elif plan.has_body:
             try:
-                request_body = await request.json()
+                request_body = await request.body()
+                request_body = codec.loads(request_body) if request_body else request_body
+            except codec.DecodeError:
+                pass
             except:
-                try:
-                    request_body = request.body() if hasattr(request, 'body') else None
-                    if request_body:
-                        request_body = self._process_request_data(request_body)
-                except:
-                    request_body = None
+                request_body = None
+            if request_body:
+                request_body = self._process_request_data(request_body, plan.request_transform)
         
         # Add proxy route data if specified
         if proxy_def_route.data:
@@ -325,146 +693,176 @@ class RouteFactory:
         
         # Apply input callback to request body
         if _in_callback:
+            start = time.perf_counter()
             request_body = _in_callback(request_body) or request_body
+            add_time("callback", time.perf_counter() - start)
             
-        if proxy_def_route.query_params:
-            for key, value in proxy_def_route.query_params.items():
-                if key not in params:
-                    params[key] = value
-                else:
-                    params[key] = str(params[key]) + "," + str(value)
         
-        check_post_require(method, request_body) # Check if POST request has data
+        missing_body = self._check_body(method, request_body)
+        if missing_body is not None:
+            return missing_body
         
+        cache_key, cached = await self._cache_lookup(method, url + query_params, params, request, proxy_def_route)
+        if cached is not None and cached.is_fresh():
+            return await self._build_response(self._apply_out_callback(self._cached_body(cached), _out_callback), request)
         try:
-            # Use requests library instead of httpx
-            timeout = getattr(proxy_def_route, "_timeout", 30)
-            
-            if method == "GET":
-                proxy_response = requests.get(
-                    url + query_params,
-                    params=params,
-                    headers=headers,
-                    timeout=timeout,
-                    allow_redirects=True
-                )
-            elif method == "POST":
-                proxy_response = requests.post(
-                    url + query_params,
-                    json=request_body,
-                    params=params,
-                    headers=headers,
-                    timeout=timeout,
-                    allow_redirects=True
-                )
-            elif method == "PUT":
-                proxy_response = requests.put(
-                    url + query_params,
-                    json=request_body,
-                    params=params,
-                    headers=headers,
-                    timeout=timeout,
-                    allow_redirects=True
-                )
-            elif method == "PATCH":
-                proxy_response = requests.patch(
-                    url + query_params,
-                    json=request_body,
+            # Use requests library instead of httpx, on the factory's thread pool
+            content = None
+            if plan.has_body:
+                headers, content = _encode_body(headers, request_body)
+            credential = await self._add_credentials(plan, headers)
+            # No hedging here, a cancelled copy would keep its worker thread busy anyway
+            proxy_response = await self.resilience.call(
+                self._picker(path, path_params),
+                lambda upstream: self._send(upstream, lambda: self.run_requests(
+                    method,
+                    upstream.url + path + query_params,
+                    data=content,
                     params=params,
                     headers=headers,
-                    timeout=timeout,
+                    timeout=plan.requests_timeout,
                     allow_redirects=True
-                )
-            elif method == "DELETE":
-                proxy_response = requests.delete(
-                    url + query_params,
-                    params=params,
-                    headers=headers,
-                    timeout=timeout,
-                    allow_redirects=True
-                )
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            processed_content = self._process_response_data(proxy_response.content)
-            if _out_callback:
-                processed_content = _out_callback(processed_content)
-            return processed_content,
-            
-        except requests.RequestException as e:
-            error_response = {
-                "error": f"Error proxying request: {str(e)}",
-                "status": "failed"
-            }
-            return json.dumps(error_response).encode("utf-8"),
-
-    async def httpx_request_handle(self, url: str, request: Request, method, proxy_def_route: ProxyRouteDefinition, _in_callback=None, _out_callback=None):
-        async with AsyncClient(
-            http2=True,
-            headers={"User-Agent": "Mozilla/5.0 (compatible; ProxyBot/1.0)"},
-            timeout=getattr(proxy_def_route, "_timeout", 30)
-        ) as client:
-            # Start with headers from route definition
-            headers = dict(proxy_def_route.headers) if proxy_def_route.headers else {}
-            
-            # Add relevant headers from incoming request  
-            for key, value in request.headers.items():
-                if key.lower() in {'content-type', 'authorization', 'accept'}:
-                    # Avoid duplicate headers by checking if key already exists
-                    if key.lower() not in [k.lower() for k in headers.keys()]:
-                        headers[key] = value
-            
-            # Remove excluded headers specified in proxy configuration
-            if self.proxy.header:
-                headers = {k: v for k, v in headers.items()
-                        if k.lower() not in {h.lower() for h in self.proxy.header}}
-            
-            auth = proxy_def_route.auth
-            query_params = "" # ?example=1
-            params = dict(request.query_params)
-            request_body = None
-            if method in {"POST", "PUT", "PATCH"}:
-                try:
-                    request_body = await request.json()
-                except:
-                    request_body = await request.body()
-                    if request_body:
-                        request_body = self._process_request_data(request_body)
+                )),
+                (requests.RequestException,),
+                plan.retries
+            )
+            self._check_rejected(plan, credential, proxy_response.status_code)
             
-            # Add proxy route data if specified
-            if proxy_def_route.data:
-                if request_body and isinstance(request_body, dict):
-                    request_body.update(proxy_def_route.data)
-                else:
-                    request_body = proxy_def_route.data
+            body = self._process_response_data(proxy_response.content, plan.response_transform)
+            body.status_code, body.headers = proxy_response.status_code, forwardable_headers(proxy_response.headers)
+            await self._cache_store(cache_key, proxy_def_route, proxy_response.status_code, proxy_response.headers, body)
+            return await self._build_response(self._apply_out_callback(body, _out_callback), request)
             
-            # Apply input callback to request body
-            if _in_callback:
-                request_body = _in_callback(request_body) or request_body
-                
-            if proxy_def_route.query_params:
-                for key, value in proxy_def_route.query_params.items():
-                    if key not in params:
-                        params[key] = value
-                    else:
-                        params[key] = str(params[key]) + "," + str(value)
-            check_post_require(method, request_body) # Check if POST request has data
+        except (requests.RequestException, CircuitOpenError, Overloaded, CredentialError) as e:
+            return self._error_response(e)
+
+    async def _stream_response(self, client: AsyncClient, path: str, pick: Callable[[], Upstream], plan: RoutePlan, headers, params, request_body, request: Request):
+        # Forward the upstream body chunk by chunk, only one chunk per request is held in memory
+        chunk_callback = plan.out_callback if is_streaming_transform(plan.out_callback) else None
+        # Without a chunk callback the compressed bytes can go through untouched, the upstream
+        # then may only use an encoding the client understands
+        raw = chunk_callback is None and get_compression_config().passthrough
+        if raw and not any(k.lower() == "accept-encoding" for k in headers):
+            headers["Accept-Encoding"] = request.headers.get("accept-encoding", "identity")
+        headers, content = _encode_body(headers, request_body)
+        # Only the response headers are awaited, the retries and hedges happen before any of the body is forwarded
+        replayable = not isinstance(content, AsyncIterator)
+        try:
+            credential = await self._add_credentials(plan, headers)
+            proxy_response = await self.resilience.call(
+                pick,
+                lambda upstream: self._send(upstream, lambda: client.send(
+                    client.build_request(plan.method, upstream.url + path, params=params, headers=headers, timeout=plan.timeout, content=content),
+                    auth=plan.auth,
+                    follow_redirects=True,
+                    stream=True
+                )),
+                (RequestError,),
+                plan.retries if replayable else None,
+                plan.hedge if replayable else None
+            )
+        except (RequestError, CircuitOpenError, Overloaded, CredentialError) as e:
+            return self._error_response(e)
+        self._check_rejected(plan, credential, proxy_response.status_code)
+
+        return StreamingResponse(
+            iter_upstream(proxy_response, chunk_callback, raw),
+            status_code=proxy_response.status_code,
+            headers=forwardable_headers(proxy_response.headers, decoded=not raw),
+            background=BackgroundTask(proxy_response.aclose)
+        )
+
+    async def httpx_request_handle(self, path: str, request: Request, plan: RoutePlan, path_params: dict | None = None):
+        client = self.get_client()
+        method, proxy_def_route = plan.method, plan.route
+        # Names the upstream resource in cache and coalescing keys, the call itself goes to the balancer's pick
+        url = plan.base + path
+        pick = self._picker(path, path_params)
+        _in_callback, _out_callback = plan.in_callback, plan.out_callback
+        # Route headers plus the forwarded request headers, exclusions already applied by the plan
+        headers = plan.build_headers(request.headers.raw)
+        query_params = "" # ?example=1
+        params = plan.build_params(request.query_params)
+        request_body = None
+        if plan.has_body and not plan.merges_body:
+            # Nothing to merge into the body, pipe the incoming stream straight to the upstream
+            if self._has_request_body(request):
+                request_body = request.stream()
+                if "content-length" in request.headers:
+                    headers["Content-Length"] = request.headers["content-length"]
+        elif plan.has_body:
+            request_body = await request.body()
             try:
-                proxy_response = await method_creation[method](
-                    client,
-                    url + query_params,
-                    headers,
-                    params,
-                    request_body,
-                    auth
+                request_body = codec.loads(request_body) if request_body else request_body
+            except codec.DecodeError:
+                pass
+            if request_body:
+                request_body = self._process_request_data(request_body, plan.request_transform)
+        
+        # Add proxy route data if specified
+        if proxy_def_route.data:
+            if request_body and isinstance(request_body, dict):
+                request_body.update(proxy_def_route.data)
+            else:
+                request_body = proxy_def_route.data
+        
+        # Apply input callback to request body
+        if _in_callback:
+            start = time.perf_counter()
+            request_body = _in_callback(request_body) or request_body
+            add_time("callback", time.perf_counter() - start)
+            
+        missing_body = self._check_body(method, request_body)
+        if missing_body is not None:
+            return missing_body
+        if proxy_def_route.stream or (plan.passthrough and get_compression_config().passthrough):
+            return await self._stream_response(client, path + query_params, pick, plan, headers, params, request_body, request)
+        cache_key, cached = await self._cache_lookup(method, url + query_params, params, request, proxy_def_route)
+        # A piped through request stream can only be sent once
+        replayable = not isinstance(request_body, AsyncIterator)
+
+        async def fetch(stale: CacheEntry | None = None):
+            # With a stale entry the request is conditional and a 304 reuses the stored body
+            request_headers = {**headers, **stale.validators()} if stale is not None else headers
+            credential = await self._add_credentials(plan, request_headers)
+            proxy_response = await self.resilience.call(
+                pick,
+                lambda upstream: self._send(upstream, lambda: plan.send(
+                    client, upstream.url + path + query_params, request_headers, params, request_body, plan.auth, plan.timeout
+                )),
+                (RequestError,),
+                plan.retries if replayable else None,
+                plan.hedge if replayable else None
+            )
+            mark_body_read()
+            self._check_rejected(plan, credential, proxy_response.status_code)
+            if stale is not None and proxy_response.status_code == 304:
+                entry = await self._cache_refresh(cache_key, proxy_def_route, stale, proxy_response.headers)
+                return self._cached_body(entry), entry.headers
+            body = self._process_response_data(proxy_response.content, plan.response_transform)
+            body.status_code, body.headers = proxy_response.status_code, forwardable_headers(proxy_response.headers)
+            await self._cache_store(cache_key, proxy_def_route, proxy_response.status_code, proxy_response.headers, body)
+            return body, proxy_response.headers
+
+        try:
+            if cached is not None and (cached.is_fresh() or cached.can_serve_stale()):
+                if not cached.is_fresh():
+                    self._revalidate_in_background(cache_key, fetch, cached)
+                body, response_headers = self._cached_body(cached), cached.headers
+            elif cached is not None and cached.validators():
+                body, response_headers = await fetch(cached)
+            elif method == "GET" and proxy_def_route.coalesce:
+                shared, response_headers = await self.singleflight.do(
+                    self._coalesce_key(url + query_params, params, headers, proxy_def_route), fetch
                 )
-                processed_content = self._process_response_data(proxy_response.content)
-                if _out_callback:
-                    processed_content = _out_callback(processed_content)
-                return processed_content,
-            except RequestError as e:
-                error_response = {
-                    "error": f"Error proxying request: {str(e)}",
-                    "status": "failed"
-                }
-                return json.dumps(error_response).encode("utf-8"),
+                # Every waiter gets its own copy so callbacks can't see each other's changes
+                body = ParsedBody(shared.raw, status_code=shared.status_code, headers=dict(shared.headers))
+            else:
+                body, response_headers = await fetch()
+            if cache_key is not None and not_modified(request.headers, response_headers.get("etag"), response_headers.get("last-modified")):
+                return FastAPIResponse(status_code=304, headers={
+                    k: v for k, v in response_headers.items() if k.lower() in {"etag", "last-modified", "cache-control"}
+                })
+            return await self._build_response(self._apply_out_callback(body, _out_callback), request)
+        except (RequestError, CircuitOpenError, Overloaded, CredentialError) as e:
+            return self._error_response(e)
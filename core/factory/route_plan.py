@@ -0,0 +1,154 @@
+"""
+Per-route request plan. Everything about a ProxyRouteDefinition that doesn't depend on the
+incoming request is resolved once when the route is registered, the handlers only do per-request work.
+"""
+
+from string import Formatter
+from typing import Any, Callable
+
+from core.authentication.credentials import CredentialProvider
+from core.factory.resilience import IDEMPOTENT_METHODS
+from core.middleware.limits import RouteLimits
+from core.logging.metrics import get_metrics
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition, TimeoutSettings
+
+# Incoming request headers passed on to the upstream unless the route sets them itself
+FORWARDED_HEADERS = frozenset({"content-type", "authorization", "accept"})
+BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+
+def split_url_template(template: str) -> tuple[str, ...] | None:
+    """
+    Split a URL template like "/todos/{id}" into alternating literals and field names
+    ("/todos/", "id", ""). Returns None for templates that need str.format
+    (conversions, format specs, attribute or index access).
+    """
+    parts: list[str] = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        parts.append(literal)
+        if field is None:
+            continue
+        if spec or conversion or not field.isidentifier():
+            return None
+        parts.append(field)
+    if len(parts) % 2 == 0:
+        parts.append("")
+    return tuple(parts)
+
+
+class RoutePlan:
+    """
+    Immutable, compiled form of a route. Build it with RoutePlan.compile.
+    """
+    __slots__ = (
+        "route", "method", "base", "path_template", "path_parts", "headers", "forward", "query_params",
+        "send", "auth", "credentials", "timeout", "requests_timeout", "retries", "hedge", "has_body", "merges_body", "response_transform",
+        "request_transform", "in_callback", "out_callback", "passthrough", "limits", "metrics",
+    )
+
+    def __init__(self, **fields: Any) -> None:
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"RoutePlan is immutable, recompile the route to change {name}")
+
+    @classmethod
+    def compile(
+        cls,
+        proxy: ProxyDefinition,
+        proxy_route_def: ProxyRouteDefinition,
+        send: Callable | None = None,
+        extra_headers: dict[str, str] | None = None,
+        _in_callback: Any = None,
+        _out_callback: Any = None,
+        credentials: CredentialProvider | None = None,
+    ) -> "RoutePlan":
+        # A route's own auth wins over the mod's credentials, a CredentialProvider there replaces them
+        auth = proxy_route_def.auth
+        if isinstance(auth, CredentialProvider):
+            credentials, auth = auth, None
+        elif auth is not None:
+            credentials = None
+        excluded = frozenset(h.lower() for h in proxy.header) if proxy.header else frozenset()
+        if credentials is not None:
+            # Set on every request from the provider, never taken from the route or the client
+            excluded |= {credentials.header}
+        headers = dict(proxy_route_def.headers) if proxy_route_def.headers else {}
+        headers.update(extra_headers or {})
+        headers = {k: v for k, v in headers.items() if k.lower() not in excluded}
+        own = {k.lower() for k in headers}
+
+        path_template = proxy_route_def.url_route or ""
+
+        # The route's own settings win over [mod_settings], global_timeout (ms) is the mod's read timeout
+        mod = proxy.mod_settings
+        timeouts = proxy_route_def.timeouts or mod.timeouts or TimeoutSettings(
+            **({"read": mod.global_timeout / 1000} if mod.global_timeout else {})
+        )
+        idempotent = proxy_route_def.method in IDEMPOTENT_METHODS
+        transform = proxy_route_def.column_transforms or proxy_route_def.response_transform
+        registry = get_metrics()
+        return cls(
+            route=proxy_route_def,
+            method=proxy_route_def.method,
+            # The first upstream names the route in cache and coalescing keys, whichever host serves it
+            base=proxy.targets[0],
+            path_template=path_template,
+            path_parts=split_url_template(path_template),
+            headers=tuple(headers.items()),
+            # Raw ASGI header names are lowercase bytes, matched against them directly
+            forward=frozenset(name.encode("latin-1") for name in FORWARDED_HEADERS - own - excluded),
+            query_params=tuple((proxy_route_def.query_params or {}).items()),
+            send=send,
+            auth=auth,
+            credentials=credentials,
+            timeout=timeouts.as_httpx(),
+            requests_timeout=(timeouts.connect, timeouts.read),
+            # Calls that aren't safe to send twice are never retried or hedged
+            retries=(proxy_route_def.retries or mod.retries) if idempotent else None,
+            hedge=(proxy_route_def.hedge or mod.hedge) if idempotent else None,
+            has_body=proxy_route_def.method in BODY_METHODS,
+            # Only routes that change the body need it decoded
+            merges_body=bool(proxy_route_def.data) or _in_callback is not None or proxy_route_def.request_transform is not None,
+            response_transform=transform,
+            request_transform=proxy_route_def.request_transform,
+            in_callback=_in_callback,
+            out_callback=_out_callback,
+            # Nothing looks at or keeps the response body, so it can be forwarded still compressed
+            passthrough=transform is None and _out_callback is None and proxy_route_def.cache is None and not proxy_route_def.coalesce,
+            # None unless the route sets rate_limit or concurrency
+            limits=RouteLimits.build(f"{proxy_route_def.method} {proxy.endpoint}{proxy_route_def.route}", proxy_route_def),
+            # Preallocated counters and histograms of the route, None when [metrics] is disabled
+            metrics=registry.route(proxy.endpoint, f"{proxy_route_def.method} {proxy_route_def.route}") if registry is not None else None,
+        )
+
+    def path(self, path_params: dict[str, Any] | None = None) -> str:
+        if not path_params:
+            return self.path_template
+        parts = self.path_parts
+        if parts is None:
+            return self.path_template.format(**path_params)
+        # Literals sit at the even indexes, field names at the odd ones
+        return "".join([part if i % 2 == 0 else str(path_params[part]) for i, part in enumerate(parts)])
+
+    def url(self, path_params: dict[str, Any] | None = None) -> str:
+        return self.base + self.path(path_params)
+
+    def build_headers(self, raw_headers: list[tuple[bytes, bytes]]) -> dict[str, str]:
+        headers = dict(self.headers)
+        forward = self.forward
+        if forward:
+            for name, value in raw_headers:
+                if name in forward:
+                    headers.setdefault(name.decode("latin-1"), value.decode("latin-1"))
+        return headers
+
+    def build_params(self, query_params) -> dict[str, Any]:
+        params = dict(query_params)
+        for key, value in self.query_params:
+            if key not in params:
+                params[key] = value
+            else:
+                params[key] = str(params[key]) + "," + str(value)
+        return params
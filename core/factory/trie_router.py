@@ -0,0 +1,151 @@
+"""
+Trie dispatch for proxy routes, the [mod_settings] dispatch = "trie" mode. Starlette tries the
+regex of every route in turn, so matching costs grow with the route count. The trie walks the
+path one segment at a time instead and hands the path params straight to the handler, without
+FastAPI's dependency resolution. Static segments win over params, params over {name:path} tails.
+Routes the trie can't express (a param inside a segment, like /file.{ext}) stay FastAPI routes.
+"""
+
+import re
+from typing import Any, Awaitable, Callable
+
+from starlette._utils import get_route_path
+from starlette.convertors import CONVERTOR_TYPES, Convertor
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+# Called as handler(request, **path_params), or handler(request) for routes added with path_params=False
+Handler = Callable[..., Awaitable[Response]]
+
+
+def split_route(path: str) -> list[str | tuple[str, Convertor]] | None:
+    """
+    The segments of a route path, params as (name, convertor). None when the trie can't route it.
+
+    Example:
+        split_route("/api/item/{id:int}") -> ["api", "item", ("id", IntegerConvertor)]
+    """
+    segments: list[str | tuple[str, Convertor]] = []
+    for segment in path.strip("/").split("/") if path.strip("/") else []:
+        if "{" not in segment and "}" not in segment:
+            segments.append(segment)
+            continue
+        if not (segment.startswith("{") and segment.endswith("}")) or segment.count("{") > 1:
+            return None
+        name, _, kind = segment[1:-1].partition(":")
+        convertor = CONVERTOR_TYPES.get(kind or "str")
+        if convertor is None or not name.isidentifier():
+            return None
+        segments.append((name, convertor))
+    # {name:path} takes the rest of the path, so it can only come last
+    if any(not isinstance(s, str) and s[1] is CONVERTOR_TYPES["path"] for s in segments[:-1]):
+        return None
+    return segments
+
+
+class TrieNode:
+    __slots__ = ("static", "params", "tail", "handlers")
+
+    def __init__(self) -> None:
+        self.static: dict[str, TrieNode] = {}
+        # (name, convertor, pattern, child), tried in the order they were added. No pattern for plain {name}
+        self.params: list[tuple[str, Convertor, re.Pattern | None, TrieNode]] = []
+        # {name:path} ending here: (name, handlers by method)
+        self.tail: tuple[str, dict[str, tuple[Handler, bool]]] | None = None
+        # method -> (handler, takes the path params) of the route ending at this node
+        self.handlers: dict[str, tuple[Handler, bool]] = {}
+
+
+class TrieRouter(BaseRoute):
+    """All the trie dispatched routes of one RouteFactory, one entry of its APIRouter."""
+
+    def __init__(self) -> None:
+        self.root = TrieNode()
+        self.count = 0
+
+    def add(self, path: str, method: str, handler: Handler, path_params: bool = True) -> bool:
+        """Add a route, False when the path needs a FastAPI route instead."""
+        segments = split_route(path)
+        if segments is None:
+            return False
+        node = self.root
+        for segment in segments:
+            if isinstance(segment, str):
+                node = node.static.setdefault(segment, TrieNode())
+                continue
+            name, convertor = segment
+            if convertor is CONVERTOR_TYPES["path"]:
+                if node.tail is None:
+                    node.tail = (name, {})
+                elif node.tail[0] != name:
+                    return False
+                node.tail[1][method] = (handler, path_params)
+                self.count += 1
+                return True
+            for param_name, param_convertor, _, child in node.params:
+                if param_name == name and param_convertor is convertor:
+                    node = child
+                    break
+            else:
+                child = TrieNode()
+                pattern = None if convertor is CONVERTOR_TYPES["str"] else re.compile(convertor.regex)
+                node.params.append((name, convertor, pattern, child))
+                node = child
+        node.handlers[method] = (handler, path_params)
+        self.count += 1
+        return True
+
+    def lookup(self, path: str) -> tuple[dict[str, tuple[Handler, bool]], dict[str, Any]] | None:
+        """The handlers by method and the path params of the route matching path."""
+        stripped = path.strip("/")
+        return _walk(self.root, stripped.split("/") if stripped else [], 0, {})
+
+    def matches(self, scope) -> tuple[Match, dict]:
+        if scope["type"] != "http":
+            return Match.NONE, {}
+        # Relative to root_path, like the Starlette routes, so the app can be mounted under a prefix
+        found = self.lookup(get_route_path(scope))
+        if found is None:
+            return Match.NONE, {}
+        handlers, params = found
+        child_scope = {"path_params": {**scope.get("path_params", {}), **params}, "sisyphus.trie": (handlers, params)}
+        return (Match.FULL if scope["method"] in handlers else Match.PARTIAL), child_scope
+
+    def url_path_for(self, name: str, /, **path_params: Any):
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope, receive, send) -> None:
+        handlers, params = scope.pop("sisyphus.trie")
+        entry = handlers.get(scope["method"])
+        if entry is None:
+            response: Response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": ", ".join(handlers)})
+        else:
+            handler, path_params = entry
+            request = Request(scope, receive, send)
+            response = await (handler(request, **params) if path_params else handler(request))
+        await response(scope, receive, send)
+
+
+def _walk(node: TrieNode, parts: list[str], index: int, params: dict[str, Any]):
+    if index == len(parts):
+        if node.handlers:
+            return node.handlers, params
+        if node.tail is not None:
+            return node.tail[1], {**params, node.tail[0]: ""}
+        return None
+    part = parts[index]
+    child = node.static.get(part)
+    if child is not None:
+        found = _walk(child, parts, index + 1, params)
+        if found is not None:
+            return found
+    for name, convertor, pattern, child in node.params:
+        if part if pattern is None else pattern.fullmatch(part):
+            found = _walk(child, parts, index + 1, {**params, name: convertor.convert(part)})
+            if found is not None:
+                return found
+    if node.tail is not None:
+        name, handlers = node.tail
+        return handlers, {**params, name: "/".join(parts[index:])}
+    return None
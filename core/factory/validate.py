@@ -0,0 +1,238 @@
+"""
+The [[routes]] a mod declares in its TOML, and the snapshot that saves later startups from
+parsing and validating them again. load_mod_config parses a mod's TOML with tomllib and validates
+its routes. The result is pickled to __pycache__/<name>.toml.snapshot next to the file and keyed by
+the file's mtime, size and hash, and by a fingerprint of the code that validated it. Every worker
+process, restart and reload after that unpickles it, as long as neither the TOML nor that code changed.
+
+    [[routes]]
+    route = "/item/{id}"
+    url_route = "/todos/{id}"
+    method = "GET"
+    params = { id = "id" }
+    client = "requests"                                   # optional, httpx by default
+    out_callback = "core.scripts.out_callbacks:funny_haha_example"
+"""
+
+import functools
+import hashlib
+import importlib
+import os
+import pickle
+import sys
+import tomllib
+from pathlib import Path
+from string import Formatter
+from typing import Any, Callable
+
+import pydantic
+from pydantic import BaseModel, ValidationError
+
+from core.logging.logging import custom_message
+from core.scripts.transform_stage import validate_transform
+from core.shared.proxy_definition import RATE_LIMIT_KEYS, ProxyRouteDefinition
+
+# The models and validators a snapshot holds the results of, any change to them rebuilds it
+FINGERPRINTED_MODULES = ("core.factory.validate", "core.shared.proxy_definition", "core.scripts.transform_stage")
+
+
+class RouteConfigError(ValueError):
+    pass
+
+
+class RouteEntry(BaseModel):
+    # httpx (create_router*) or requests (create_requests_router*)
+    client: str = "httpx"
+    # "module:function", resolved when the route is registered
+    in_callback: str | None = None
+    out_callback: str | None = None
+    definition: ProxyRouteDefinition
+
+    @property
+    def factory_method(self) -> str:
+        # The RouteFactory.create_* that registers the route, the _param ones pass on the path params
+        name = "create_requests_router" if self.client == "requests" else "create_router"
+        return name + "_param" if _fields(self.definition.route) else name
+
+    def callbacks(self) -> dict[str, Callable]:
+        callbacks = {}
+        if self.in_callback:
+            callbacks["_in_callback"] = import_callback(self.in_callback)
+        if self.out_callback:
+            callbacks["_out_callback"] = import_callback(self.out_callback)
+        return callbacks
+
+
+class ConfigSnapshot:
+    __slots__ = ("config", "routes")
+
+    def __init__(self, config: dict[str, Any], routes: list[RouteEntry]) -> None:
+        self.config = config
+        self.routes = routes
+
+
+METHODS = frozenset({"GET", "POST", "PUT", "DELETE", "PATCH"})
+ROUTE_KEYS = frozenset(ProxyRouteDefinition.model_fields) | {"client", "in_callback", "out_callback"}
+
+
+def _fields(template: str | None) -> set[str]:
+    # Field names of a path template, "/todos/{id:int}" -> {"id"}
+    return {field.partition(":")[0] for _, field, _, _ in Formatter().parse(template or "") if field}
+
+
+def import_callback(path: str) -> Callable:
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def validate_routes(tables: list[dict[str, Any]], source: str) -> list[RouteEntry]:
+    """
+    Validate every [[routes]] table and report all the problems at once.
+
+    Raises:
+        RouteConfigError: One line per problem, "<source> [[routes]] #<n> (<method> <route>): <problem>"
+    """
+    errors: list[str] = []
+    routes: list[RouteEntry] = []
+    seen: set[tuple[str, str]] = set()
+    for index, table in enumerate(tables, 1):
+        where = f"{source} [[routes]] #{index} ({table.get('method', '?')} {table.get('route', '?')})"
+        unknown = sorted(set(table) - ROUTE_KEYS)
+        if unknown:
+            errors.append(f"{where}: unknown keys {', '.join(unknown)}")
+            continue
+        # ProxyRouteDefinition exits on these, checked first so every problem of the file is reported
+        early = [f"{where}: {problem}" for problem in _exiting_problems(table)]
+        if early:
+            errors += early
+            continue
+        try:
+            definition = ProxyRouteDefinition(**{k: v for k, v in table.items() if k in ProxyRouteDefinition.model_fields})
+            entry = RouteEntry(definition=definition, **{k: v for k, v in table.items() if k not in ProxyRouteDefinition.model_fields})
+        except ValidationError as e:
+            errors += [f"{where}: {'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+            continue
+        except SystemExit:
+            # A validator _exiting_problems doesn't know about yet, its message was logged above
+            errors.append(f"{where}: invalid route, see the error above")
+            continue
+        errors += [f"{where}: {problem}" for problem in _route_problems(entry)]
+        key = (definition.method, definition.route)
+        if key in seen:
+            errors.append(f"{where}: declared twice")
+        seen.add(key)
+        routes.append(entry)
+    if errors:
+        for error in errors:
+            custom_message(error, "error")
+        raise RouteConfigError("\n".join(errors))
+    return routes
+
+
+def _exiting_problems(table: dict[str, Any]) -> list[str]:
+    # Everything the validators of ProxyRouteDefinition and its settings exit the process on
+    problems = [f"{key} must start with /" for key in ("route", "url_route") if not str(table.get(key, "/")).startswith("/")]
+    if str(table.get("method", "")).upper() not in METHODS:
+        problems.append(f"method must be one of {', '.join(sorted(METHODS))}")
+    columns = table.get("column_transforms")
+    names = [table.get("response_transform"), table.get("request_transform")]
+    names += list(columns.values()) if isinstance(columns, dict) else []
+    for name in names:
+        try:
+            validate_transform(name)
+        except ValueError as e:
+            problems.append(str(e))
+    rate_limit = table.get("rate_limit")
+    if isinstance(rate_limit, dict) and rate_limit.get("key", "ip") not in RATE_LIMIT_KEYS:
+        problems.append(f"rate_limit key must be one of {', '.join(sorted(RATE_LIMIT_KEYS))}, not {rate_limit['key']}")
+    return problems
+
+
+def _route_problems(entry: RouteEntry) -> list[str]:
+    definition = entry.definition
+    problems = []
+    if entry.client not in {"httpx", "requests"}:
+        problems.append(f"client must be httpx or requests, not {entry.client}")
+    if definition.route is None or definition.url_route is None:
+        problems.append("route and url_route are both required")
+        return problems
+    route_fields, url_fields = _fields(definition.route), _fields(definition.url_route)
+    if url_fields - route_fields:
+        problems.append(f"url_route uses {', '.join(sorted(url_fields - route_fields))}, which the route doesn't capture")
+    if url_fields and not definition.params:
+        problems.append(f"params must name the path params passed on to url_route ({', '.join(sorted(url_fields))})")
+    for name in (entry.in_callback, entry.out_callback):
+        if name is not None and (":" not in name or not all(name.partition(":")[::2])):
+            problems.append(f"callback {name} should look like module:function")
+    if definition.stream and (entry.out_callback or entry.client == "requests"):
+        problems.append("streamed routes take no out_callback and need the httpx client")
+    return problems
+
+
+@functools.cache
+def code_fingerprint() -> str:
+    digest = hashlib.blake2b(pydantic.VERSION.encode(), digest_size=16)
+    for name in FINGERPRINTED_MODULES:
+        digest.update(Path(sys.modules[name].__file__).read_bytes())
+    return digest.hexdigest()
+
+
+# path -> (mtime_ns, size, snapshot), so a process parses every file at most once
+_loaded: dict[str, tuple[int, int, ConfigSnapshot]] = {}
+
+
+def load_mod_config(path: str | Path) -> ConfigSnapshot:
+    """The parsed TOML of a mod and its validated [[routes]], from the snapshot when the file is unchanged."""
+    path = Path(path)
+    stat = path.stat()
+    loaded = _loaded.get(str(path))
+    if loaded is not None and loaded[:2] == (stat.st_mtime_ns, stat.st_size):
+        return loaded[2]
+
+    snapshot_path = path.parent / "__pycache__" / f"{path.name}.snapshot"
+    stored = _read_snapshot(snapshot_path)
+    if stored is not None and (stored["mtime_ns"], stored["size"]) == (stat.st_mtime_ns, stat.st_size):
+        snapshot = stored["snapshot"]
+    else:
+        data = path.read_bytes()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if stored is not None and stored["hash"] == digest:
+            # Touched, not changed
+            snapshot = stored["snapshot"]
+        else:
+            config = tomllib.loads(data.decode("utf-8"))
+            snapshot = ConfigSnapshot(config, validate_routes(config.get("routes", []), str(path)))
+        _write_snapshot(snapshot_path, {
+            "code": code_fingerprint(), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest,
+            "snapshot": pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL),
+        })
+    _loaded[str(path)] = (stat.st_mtime_ns, stat.st_size, snapshot)
+    return snapshot
+
+
+def _read_snapshot(path: Path) -> dict | None:
+    # The validated objects are pickled on their own and only unpickled once the code fingerprint matches
+    try:
+        with open(path, "rb") as f:
+            stored = pickle.load(f)
+        if not isinstance(stored, dict) or stored.get("code") != code_fingerprint():
+            return None
+        return {**stored, "snapshot": pickle.loads(stored["snapshot"])}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Written by another version of the code, or cut short. Rebuilt from the TOML
+        custom_message(f"Ignoring config snapshot {path}: {e!r}", "debug")
+        return None
+
+
+def _write_snapshot(path: Path, stored: dict) -> None:
+    # Written next to the file and renamed into place, workers starting together never read half a snapshot
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(exist_ok=True)
+        with open(temporary, "wb") as f:
+            pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError as e:
+        custom_message(f"Could not write config snapshot {path}: {e!r}", "debug")
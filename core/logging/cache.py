@@ -0,0 +1,55 @@
+from pydantic import BaseModel
+
+from core.logging.cache_backend import CacheBackend, CacheEntry, make_cache_key
+from core.logging.disk_cache import DiskCache
+from core.logging.logging import custom_message
+from core.logging.memory_cache import MemoryCache
+from core.logging.redis_cache import RedisCache
+
+
+class CacheConfig(BaseModel):
+    # The [cache] table of sisyphus.toml, off unless it turns the cache on
+    enable_cache: bool = False
+    backend: str = "memory"
+    cache_dir: str = "./cache"
+    cache_duration: int = 3600
+    # Bounds of the memory and disk backends, the least recently used entries go first
+    max_entries: int = 1024
+    max_bytes: int = 64 * 1024 * 1024
+    redis_url: str = "redis://127.0.0.1:6379/0"
+
+
+_config: CacheConfig = CacheConfig()
+_cache: CacheBackend | None = None
+_configured: bool = False
+
+
+def build_cache(config: CacheConfig) -> CacheBackend:
+    if config.backend == "memory":
+        return MemoryCache(max_entries=config.max_entries, max_bytes=config.max_bytes)
+    if config.backend == "disk":
+        return DiskCache(config.cache_dir, max_entries=config.max_entries, max_bytes=config.max_bytes)
+    if config.backend == "redis":
+        return RedisCache(config.redis_url)
+    raise ValueError(f"Unknown cache backend: {config.backend}")
+
+
+def configure_cache(config: dict | CacheConfig | None) -> CacheBackend | None:
+    global _config, _cache, _configured
+    _config = config if isinstance(config, CacheConfig) else CacheConfig(**(config or {}))
+    _cache = build_cache(_config) if _config.enable_cache else None
+    _configured = True
+    if _cache is not None:
+        custom_message(f"Response cache enabled with the {_config.backend} backend", "info")
+    return _cache
+
+
+def get_cache() -> CacheBackend | None:
+    """The shared response cache, None when disabled in sisyphus.toml (the default)."""
+    if not _configured:
+        configure_cache(None)
+    return _cache
+
+
+def get_cache_config() -> CacheConfig:
+    return _config
@@ -0,0 +1,88 @@
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    status_code: int = 200
+    headers: dict[str, str] = field(default_factory=dict)
+    stored_at: float = field(default_factory=time.time)
+    # Past this point the entry is stale, backends may still hold it for a while after
+    expires_at: float = 0.0
+    # Until then a stale entry may still be served while it is revalidated in the background
+    stale_until: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    @property
+    def etag(self) -> str | None:
+        return self.headers.get("etag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return self.headers.get("last-modified")
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def can_serve_stale(self, now: float | None = None) -> bool:
+        return (now or time.time()) < self.stale_until
+
+    def validators(self) -> dict[str, str]:
+        """Conditional request headers that let the upstream answer with a 304."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "stores", "evictions", "expirations")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class CacheBackend:
+    """Storage interface behind the response cache, every backend keeps its own counters."""
+
+    def __init__(self) -> None:
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> CacheEntry | None:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        """Store an entry and keep it for ttl seconds."""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    async def clear(self) -> None:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    async def close(self) -> None:
+        pass
+
+
+def make_cache_key(method: str, url: str, params: Mapping[str, str], headers: Mapping[str, str], vary_headers: Iterable[str]) -> str:
+    """Key on the method, the resolved url, the sorted query params and the selected request headers."""
+    parts = [method.upper(), url]
+    parts.extend(f"{k}={v}" for k, v in sorted((str(k), str(v)) for k, v in params.items()))
+    parts.extend(f"{h}:{headers.get(h, '')}" for h in vary_headers)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
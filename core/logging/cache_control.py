@@ -0,0 +1,87 @@
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    """
+    Parse a Cache-Control header into its directives.
+
+    Example:
+        parse_cache_control('public, max-age=60') -> {'public': None, 'max-age': '60'}
+    """
+    directives: dict[str, str | None] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def _seconds(value: str | None) -> int | None:
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _expires_in(headers: Mapping[str, str]) -> int | None:
+    # Expires relative to the upstream's Date, so clock skew between the hosts doesn't matter
+    try:
+        expires = parsedate_to_datetime(headers["expires"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        # An invalid Expires, "0" included, means already expired
+        return 0 if "expires" in headers else None
+    try:
+        now = parsedate_to_datetime(headers["date"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        now = time.time()
+    return max(int(expires - now), 0)
+
+
+def cache_lifetime(headers: Mapping[str, str], default_ttl: int, default_stale: int) -> tuple[int, int] | None:
+    """
+    Freshness lifetime and stale-while-revalidate window of an upstream response, in seconds.
+    Returns None when the upstream forbids a shared cache from storing it.
+    """
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in directives or "private" in directives:
+        return None
+    ttl = _seconds(directives.get("s-maxage"))
+    if ttl is None:
+        ttl = _seconds(directives.get("max-age"))
+    if ttl is None:
+        ttl = _expires_in(headers)
+    if ttl is None:
+        ttl = default_ttl
+    if "no-cache" in directives:
+        ttl = 0
+    stale = _seconds(directives.get("stale-while-revalidate"))
+    if "must-revalidate" in directives or "proxy-revalidate" in directives:
+        stale = 0
+    return ttl, default_stale if stale is None else stale
+
+
+def _strip_weak(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def not_modified(request_headers: Mapping[str, str], etag: str | None, last_modified: str | None) -> bool:
+    """Whether the client's conditional headers match, so it can be answered with a 304."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        return _strip_weak(etag) in {_strip_weak(tag.strip()) for tag in if_none_match.split(",")}
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from core.logging.cache_backend import CacheBackend, CacheEntry
+
+# Every file starts with its retain_until, so expired files are found without unpickling them
+_HEADER = struct.Struct("<d")
+# Seconds between two sweeps for expired files, run by set()
+SWEEP_INTERVAL = 60.0
+
+
+class DiskCache(CacheBackend):
+    """
+    One file per entry under cache_dir, file I/O runs off the event loop.
+    Bounded like MemoryCache: the least recently used files are deleted past max_entries or max_bytes.
+    The index of the files is kept in memory and rebuilt from cache_dir on start, so every worker
+    sharing the directory enforces the bounds for the files it knows about.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024) -> None:
+        super().__init__()
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # key -> (retain_until, file size), least recently used first
+        self._index: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self._swept_at = time.monotonic()
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    async def get(self, key: str) -> CacheEntry | None:
+        entry, expired = await asyncio.to_thread(self._read, key)
+        if entry is None:
+            # Expired, never stored or deleted by another worker
+            self._forget(key)
+            self.stats.expirations += expired
+            self.stats.misses += 1
+            return None
+        if key in self._index:
+            self._index.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        if entry.size > self.max_bytes:
+            return
+        retain_until = time.time() + ttl
+        size = await asyncio.to_thread(self._write, key, entry, retain_until)
+        self._forget(key)
+        self._index[key] = (retain_until, size)
+        self.size += size
+        self.stats.stores += 1
+        evicted = []
+        while len(self._index) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self._index))
+            self._forget(oldest)
+            evicted.append(oldest)
+            self.stats.evictions += 1
+        if time.monotonic() - self._swept_at >= SWEEP_INTERVAL:
+            evicted += self._expired()
+        if evicted:
+            await asyncio.to_thread(self._unlink, evicted)
+
+    async def delete(self, key: str) -> None:
+        self._forget(key)
+        await asyncio.to_thread(self._path(key).unlink, True)
+
+    async def clear(self) -> None:
+        self._index.clear()
+        self.size = 0
+        await asyncio.to_thread(shutil.rmtree, self.cache_dir, True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    async def sweep(self) -> int:
+        """Delete the expired files, returns how many."""
+        expired = self._expired()
+        await asyncio.to_thread(self._unlink, expired)
+        return len(expired)
+
+    def _expired(self) -> list[str]:
+        now = time.time()
+        self._swept_at = time.monotonic()
+        expired = [key for key, (retain_until, _) in self._index.items() if now >= retain_until]
+        for key in expired:
+            self._forget(key)
+        self.stats.expirations += len(expired)
+        return expired
+
+    def _forget(self, key: str) -> None:
+        item = self._index.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def _unlink(self, keys: list[str]) -> None:
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+    def _load_index(self) -> None:
+        files = []
+        for path in self.cache_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+                with open(path, "rb") as f:
+                    header = f.read(_HEADER.size)
+            except OSError:
+                continue
+            if len(header) == _HEADER.size and path.parent.name == path.name[:2]:
+                files.append((stat.st_mtime, path.name, _HEADER.unpack(header)[0], stat.st_size))
+        # Oldest writes are the first to be evicted
+        for _, key, retain_until, size in sorted(files):
+            self._index[key] = (retain_until, size)
+            self.size += size
+
+    def _read(self, key: str) -> tuple[CacheEntry | None, bool]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return None, False
+                if time.time() >= _HEADER.unpack(header)[0]:
+                    path.unlink(missing_ok=True)
+                    return None, True
+                return pickle.load(f), False
+        except FileNotFoundError:
+            return None, False
+        except Exception:
+            # Unreadable or written by another version, a miss either way
+            path.unlink(missing_ok=True)
+            return None, False
+
+    def _write(self, key: str, entry: CacheEntry, retain_until: float) -> int:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = _HEADER.pack(retain_until) + pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        # Write to a temporary file first so readers never see a half written entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
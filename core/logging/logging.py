@@ -1,8 +1,22 @@
+"""
+Logging for Sisyphus. Records are put on a queue by the calling thread and formatted and
+written by a background listener, so a log call on the request path never waits on a
+terminal or a disk. configure_logging applies the [logging] table of sisyphus.toml.
+"""
+
 from core.shared.base import get_project_root
+from core.shared import codec
 
+import atexit
 import logging
-from pathlib import Path
+import logging.handlers
 import os
+import queue
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pydantic import BaseModel
+
 
 class CustomFormatter(logging.Formatter):
 
@@ -21,20 +35,112 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    def __init__(self):
+        super().__init__()
+        # Built once, not per record
+        self.formatters = {level: logging.Formatter(fmt) for level, fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self.formatters.get(record.levelno, self.formatters[logging.INFO]).format(record)
 
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Values passed as extra={"fields": {...}} become top level keys."""
 
-ch.setFormatter(CustomFormatter())
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+            "source": f"{record.filename}:{record.lineno}",
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return codec.dumps(entry).decode("utf-8")
+
+
+class LoggingConfig(BaseModel):
+    # The [logging] table of sisyphus.toml
+    level: str = "info"
+    # text (coloured) or json on the console
+    format: str = "text"
+    # Rotated at max_bytes, backup_count old files kept. {pid} is replaced by the process id,
+    # so several workers don't rotate the same file
+    logfile: str | None = None
+    max_bytes: int = 10 * 1024 * 1024
+    backup_count: int = 5
+    # One line per proxied request, see core.middleware.access_log
+    access_log: bool = False
+    # Share of the requests that get an access line, errors and slow requests are always logged
+    access_sample_rate: float = 1.0
+    slow_request_ms: float = 1000
+
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
 
-logger.addHandler(ch)
+logger = logging.getLogger(__name__)
+# Per-request lines, kept apart so they can be filtered or routed on their own
+access_logger = logging.getLogger("sisyphus.access")
+
+_config: LoggingConfig = LoggingConfig()
+_listener: logging.handlers.QueueListener | None = None
+
+
+def build_handlers(config: LoggingConfig) -> list[logging.Handler]:
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if config.format == "json" else CustomFormatter())
+    handlers: list[logging.Handler] = [console]
+    if config.logfile:
+        path = Path(config.logfile.format(pid=os.getpid()))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        logfile = logging.handlers.RotatingFileHandler(path, maxBytes=config.max_bytes, backupCount=config.backup_count, encoding="utf-8")
+        logfile.setFormatter(JsonFormatter())
+        handlers.append(logfile)
+    return handlers
+
+
+def configure_logging(config: dict | LoggingConfig | None) -> LoggingConfig:
+    """(Re)build the pipeline: one QueueHandler on the loggers, the real handlers behind a listener thread."""
+    global _config, _listener
+    _config = config if isinstance(config, LoggingConfig) else LoggingConfig(**(config or {}))
+    stop_logging()
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, *build_handlers(_config), respect_handler_level=True)
+    _listener.start()
+    level = LEVELS.get(_config.level.lower(), logging.INFO)
+    for log in (logger, access_logger):
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+        log.addHandler(logging.handlers.QueueHandler(records))
+        log.setLevel(level)
+        log.propagate = False
+    return _config
+
+
+def get_logging_config() -> LoggingConfig:
+    return _config
+
+
+def stop_logging() -> None:
+    """Write out what is still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+configure_logging(None)
 
 def change_method_color(method: str):
     if method == "GET":
@@ -51,19 +157,8 @@ def change_method_color(method: str):
     return method
 
 def custom_message(message: str, type: str = "info"):
-    
-    if(type == "info"):
-        logger.info(message)
-    elif(type == "debug"):
-        logger.debug(message)
-    elif(type == "warning"):
-        logger.warning(message)
-    elif(type == "error"):
-        logger.error(message)
-    elif(type == "critical"):
-        logger.critical(message)
-    else:
-        logger.info(message)
+    # stacklevel points filename:lineno at the caller instead of this function
+    logger.log(LEVELS.get(type, logging.INFO), message, stacklevel=2)
 
 def register_mod_lib(mod_name:str, lib:str):
     logger.info(f"Registering {mod_name} with {lib}")
@@ -81,7 +176,7 @@ def invalid_port(port:int) -> int:
     return port
 
 def log_route_creation(route: str, method: str, message: str = ""):
-    logger.info(f"Created Route: {route} with method: {change_method_color(method)} {message}")
+    logger.info(f"Created Route: {route} with method: {change_method_color(method)} {message}", stacklevel=2)
 
 def check_path_exists(path: str):
     if not os.path.exists(path):
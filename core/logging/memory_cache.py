@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+from core.logging.cache_backend import CacheBackend, CacheEntry
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache, bounded by entry count and total body size."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, CacheEntry]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> CacheEntry | None:
+        item = self._entries.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+        retain_until, entry = item
+        if time.time() >= retain_until:
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + ttl, entry)
+        self.size += entry.size
+        self.stats.stores += 1
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            oldest, _ = next(iter(self._entries.items()))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key: str) -> None:
+        _, entry = self._entries.pop(key)
+        self.size -= entry.size
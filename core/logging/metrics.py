@@ -0,0 +1,261 @@
+"""
+Request metrics in the Prometheus text format. Every route gets its counters and histograms
+when it is compiled, so a request only bumps preallocated slots. Everything is recorded on the
+event loop thread, no locks are needed. Connection pool gauges are read when /metrics is scraped.
+/metrics has no authentication and names the routes and upstream hosts, keep it off or firewalled.
+"""
+
+import time
+import weakref
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any
+
+from httpx import Request as UpstreamRequest, Response as UpstreamResponse
+from pydantic import BaseModel
+
+from core.logging.cache import get_cache
+from core.logging.logging import custom_message
+
+# Seconds, from fast cache hits to slow upstreams
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Where the time of a proxied request goes, see RequestTiming
+STAGES = ("queue", "connect", "ttfb", "body", "transform", "callback")
+CACHE_RESULTS = ("hit", "stale", "miss")
+
+
+class MetricsConfig(BaseModel):
+    # The [metrics] table of sisyphus.toml. Off by default, /metrics is unauthenticated
+    enable: bool = False
+    path: str = "/metrics"
+    # Split upstream time into pool wait, connect and time to first byte with httpx trace events
+    upstream_phases: bool = True
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        # One slot per bucket plus +Inf, cumulated only when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str, lines: list[str]) -> None:
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+
+
+class RequestTiming:
+    """
+    Timings of the request being handled, reached through current_timing. The stages stay None
+    when they didn't happen (no upstream call on a cache hit, no new connection).
+        queue: waiting for a route or upstream concurrency slot and for a pooled connection
+        connect: opening a new upstream connection, TLS included
+        ttfb: request sent until the upstream's response headers
+        body: reading the upstream body
+        transform / callback: the route's response transform and out callback
+    """
+    __slots__ = ("start", "cache", "requested_at", "sent_at", "headers_at", "connect_at") + STAGES
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.cache: str | None = None
+        self.requested_at = self.sent_at = self.headers_at = self.connect_at = None
+        for stage in STAGES:
+            setattr(self, stage, None)
+
+    def add(self, stage: str, seconds: float) -> None:
+        current = getattr(self, stage)
+        setattr(self, stage, seconds if current is None else current + seconds)
+
+    async def trace(self, event: str, info: dict) -> None:
+        # httpcore trace events, only hooked up with upstream_phases
+        if event == "connection.connect_tcp.started":
+            self.connect_at = time.perf_counter()
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect = time.perf_counter() - self.connect_at
+        elif event.endswith(".send_request_headers.started"):
+            self.sent_at = time.perf_counter()
+            # Whatever isn't connecting between handing the request to httpx and writing it is pool wait
+            self.add("queue", max(self.sent_at - self.requested_at - (self.connect or 0.0), 0.0))
+
+
+current_timing: ContextVar[RequestTiming | None] = ContextVar("current_timing", default=None)
+
+
+def add_time(stage: str, seconds: float) -> None:
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+def mark_cache(result: str) -> None:
+    timing = current_timing.get()
+    if timing is not None:
+        timing.cache = result
+
+
+def mark_body_read() -> None:
+    timing = current_timing.get()
+    if timing is not None and timing.headers_at is not None:
+        timing.body = time.perf_counter() - timing.headers_at
+
+
+async def on_upstream_request(request: UpstreamRequest) -> None:
+    timing = current_timing.get()
+    if timing is None:
+        return
+    timing.requested_at = time.perf_counter()
+    timing.sent_at = None
+    if _config.upstream_phases:
+        request.extensions["trace"] = timing.trace
+
+
+async def on_upstream_response(response: UpstreamResponse) -> None:
+    # Called by httpx once the headers are in, before the body is read
+    timing = current_timing.get()
+    if timing is None or timing.requested_at is None:
+        return
+    timing.headers_at = time.perf_counter()
+    timing.ttfb = timing.headers_at - (timing.sent_at or timing.requested_at)
+
+
+class RouteMetrics:
+    __slots__ = ("labels", "statuses", "bytes_in", "bytes_out", "latency", "stages", "cache")
+
+    def __init__(self, mod: str, route: str) -> None:
+        self.labels = f'mod="{_escape(mod)}",route="{_escape(route)}"'
+        self.statuses: dict[int, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.cache = dict.fromkeys(CACHE_RESULTS, 0)
+
+    def record(self, timing: RequestTiming, status: int, bytes_in: int, bytes_out: int) -> None:
+        self.latency.observe(time.perf_counter() - timing.start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        for stage, histogram in self.stages.items():
+            value = getattr(timing, stage)
+            if value is not None:
+                histogram.observe(value)
+        if timing.cache is not None:
+            self.cache[timing.cache] += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        # (mod, route) -> its metrics, a reloaded mod keeps counting on the same ones
+        self.by_route: dict[tuple[str, str], RouteMetrics] = {}
+        # mod label -> RouteFactory, weak so factories of finished tests or reloads don't linger
+        self.factories: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def route(self, mod: str, route: str) -> RouteMetrics:
+        metrics = self.by_route.get((mod, route))
+        if metrics is None:
+            metrics = self.by_route[mod, route] = RouteMetrics(mod, route)
+        return metrics
+
+    @property
+    def routes(self):
+        return self.by_route.values()
+
+    def watch(self, mod: str, factory: Any) -> None:
+        self.factories[mod] = factory
+
+    def render(self) -> str:
+        lines: list[str] = []
+        self._render_requests(lines)
+        self._render_pools(lines)
+        self._render_cache(lines)
+        return "\n".join(lines) + "\n"
+
+    def _render_requests(self, lines: list[str]) -> None:
+        lines += ["# HELP sisyphus_requests_total Requests handled per route and status", "# TYPE sisyphus_requests_total counter"]
+        for route in self.routes:
+            for status, count in sorted(route.statuses.items()):
+                lines.append(f'sisyphus_requests_total{{{route.labels},status="{status}"}} {count}')
+        for name, attr, help in (
+            ("sisyphus_request_bytes_total", "bytes_in", "Request body bytes received per route"),
+            ("sisyphus_response_bytes_total", "bytes_out", "Response body bytes sent per route"),
+        ):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            lines += [f"{name}{{{route.labels}}} {getattr(route, attr)}" for route in self.routes]
+
+        lines += ["# HELP sisyphus_request_duration_seconds Time to answer a request", "# TYPE sisyphus_request_duration_seconds histogram"]
+        for route in self.routes:
+            route.latency.render("sisyphus_request_duration_seconds", route.labels, lines)
+        lines += ["# HELP sisyphus_stage_duration_seconds Time spent per stage of a request", "# TYPE sisyphus_stage_duration_seconds histogram"]
+        for route in self.routes:
+            for stage, histogram in route.stages.items():
+                if histogram.count:
+                    histogram.render("sisyphus_stage_duration_seconds", f'{route.labels},stage="{stage}"', lines)
+
+        lines += ["# HELP sisyphus_cache_requests_total Response cache lookups per route and result", "# TYPE sisyphus_cache_requests_total counter"]
+        for route in self.routes:
+            if any(route.cache.values()):
+                lines += [f'sisyphus_cache_requests_total{{{route.labels},result="{result}"}} {count}' for result, count in route.cache.items()]
+
+    def _render_pools(self, lines: list[str]) -> None:
+        # Counted by the factory around every upstream call. Calls, not connections: with keep-alive
+        # and HTTP/2 they don't tell how many connections of the pool are open
+        lines += ["# HELP sisyphus_upstream_requests_in_flight Upstream calls in flight per mod", "# TYPE sisyphus_upstream_requests_in_flight gauge"]
+        limits, outstanding = [], []
+        for mod, factory in sorted(self.factories.items()):
+            labels = f'mod="{_escape(mod)}"'
+            lines.append(f"sisyphus_upstream_requests_in_flight{{{labels}}} {factory.in_flight}")
+            limit = factory.proxy.mod_settings.max_connections
+            if limit is not None:
+                limits.append(f"sisyphus_upstream_pool_limit{{{labels}}} {limit}")
+            for upstream in factory.balancer.upstreams:
+                outstanding.append(f'sisyphus_upstream_outstanding{{{labels},upstream="{_escape(upstream.origin)}"}} {upstream.outstanding}')
+        lines += ["# HELP sisyphus_upstream_pool_limit max_connections of the mod's pool", "# TYPE sisyphus_upstream_pool_limit gauge", *limits]
+        lines += ["# HELP sisyphus_upstream_outstanding Calls in flight per upstream", "# TYPE sisyphus_upstream_outstanding gauge", *outstanding]
+
+    def _render_cache(self, lines: list[str]) -> None:
+        # Counted by the backend, so they include the lookups of every mod and the evictions
+        cache = get_cache()
+        if cache is None:
+            return
+        lines += ["# HELP sisyphus_cache_backend_total Response cache backend operations", "# TYPE sisyphus_cache_backend_total counter"]
+        lines += [f'sisyphus_cache_backend_total{{backend="{type(cache).__name__}",event="{event}"}} {count}' for event, count in cache.stats.as_dict().items()]
+
+
+_config: MetricsConfig = MetricsConfig()
+_registry: MetricsRegistry | None = None
+
+
+def configure_metrics(config: dict | MetricsConfig | None) -> MetricsRegistry | None:
+    global _config, _registry
+    _config = config if isinstance(config, MetricsConfig) else MetricsConfig(**(config or {}))
+    _registry = MetricsRegistry() if _config.enable else None
+    if _registry is not None:
+        custom_message(f"Metrics enabled at {_config.path}", "info")
+    return _registry
+
+
+def get_metrics() -> MetricsRegistry | None:
+    """The process wide registry, None when [metrics] is disabled. Routes compiled before configure_metrics keep the old one."""
+    return _registry
+
+
+def get_metrics_config() -> MetricsConfig:
+    return _config
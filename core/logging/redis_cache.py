@@ -0,0 +1,131 @@
+import asyncio
+import pickle
+from urllib.parse import urlparse
+
+from core.logging.cache_backend import CacheBackend, CacheEntry
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """
+    Minimal client for the Redis protocol (RESP2), enough for the cache and shared limiters.
+    Keeps a small pool of connections and reconnects on the next command after a failure.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", pool_size: int = 4) -> None:
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._pool: asyncio.Queue[tuple[asyncio.StreamReader, asyncio.StreamWriter] | None] = asyncio.Queue()
+        for _ in range(pool_size):
+            self._pool.put_nowait(None)
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = (reader, writer)
+        if self.password:
+            await self._send(connection, "AUTH", self.password)
+        if self.db:
+            await self._send(connection, "SELECT", self.db)
+        return connection
+
+    async def execute(self, *args):
+        connection = await self._pool.get()
+        try:
+            if connection is None:
+                connection = await self._connect()
+            return await self._send(connection, *args)
+        except (OSError, asyncio.IncompleteReadError):
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            raise
+        finally:
+            self._pool.put_nowait(connection)
+
+    async def close(self) -> None:
+        while not self._pool.empty():
+            connection = self._pool.get_nowait()
+            if connection is not None:
+                connection[1].close()
+
+    async def _send(self, connection, *args):
+        reader, writer = connection
+        writer.write(encode_command(*args))
+        await writer.drain()
+        return await read_reply(reader)
+
+
+def encode_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    if kind == b"-":
+        raise RespError(payload.decode("utf-8"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unknown reply type: {line!r}")
+
+
+class RedisCache(CacheBackend):
+    """Cache stored on a Redis protocol server, expiry is left to the server."""
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "sisyphus:cache:") -> None:
+        super().__init__()
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> CacheEntry | None:
+        data = await self.client.execute("GET", self.prefix + key)
+        if data is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return pickle.loads(data)
+
+    async def set(self, key: str, entry: CacheEntry, ttl: float) -> None:
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        await self.client.execute("SET", self.prefix + key, data, "PX", max(int(ttl * 1000), 1))
+        self.stats.stores += 1
+
+    async def delete(self, key: str) -> None:
+        await self.client.execute("DEL", self.prefix + key)
+
+    async def clear(self) -> None:
+        cursor = "0"
+        while True:
+            cursor, keys = await self.client.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500)
+            cursor = cursor.decode("utf-8")
+            if keys:
+                await self.client.execute("DEL", *keys)
+            if cursor == "0":
+                break
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,50 @@
+"""
+Access log: one line per request through the logging queue. Only a sample of the requests is
+logged when access_sample_rate is below 1, server errors and slow requests always are.
+"""
+
+import random
+import time
+
+from core.logging.logging import LoggingConfig, access_logger
+from core.middleware.auth import client_ip
+
+
+class AccessLogMiddleware:
+    def __init__(self, app, config: LoggingConfig) -> None:
+        self.app = app
+        self.sample_rate = config.access_sample_rate
+        self.slow = config.slow_request_ms / 1000
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if status >= 500 or elapsed >= self.slow or random.random() < self.sample_rate:
+                self.log(scope, status, elapsed)
+
+    def log(self, scope, status: int, elapsed: float) -> None:
+        fields = {
+            "client": client_ip(scope),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+        }
+        access_logger.info(
+            '%s "%s %s" %d %.1fms', fields["client"], fields["method"], fields["path"], status, fields["duration_ms"],
+            extra={"fields": fields}
+        )
@@ -0,0 +1,44 @@
+"""
+Who is calling. Used to key rate limits, works on the raw ASGI scope so the middleware
+doesn't have to build a Request.
+"""
+
+import hashlib
+
+# Credentials are hashed before they are used as keys, so they never sit in memory or Redis in clear
+IDENTITY_HEADERS = (b"authorization", b"x-api-key")
+
+
+def client_ip(scope: dict, trust_forwarded: bool = False) -> str:
+    """
+    The client address. With trust_forwarded (Sisyphus behind a proxy you control) the
+    first X-Forwarded-For entry is used instead of the socket peer.
+    """
+    if trust_forwarded:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.split(b",", 1)[0].strip().decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def auth_identity(scope: dict) -> str | None:
+    """A stable, hashed id of the caller's credentials, None for anonymous requests."""
+    for name, value in scope.get("headers", ()):
+        if name in IDENTITY_HEADERS:
+            return hashlib.blake2b(value, digest_size=12).hexdigest()
+    return None
+
+
+def limit_key(scope: dict, kind: str, trust_forwarded: bool = False) -> str:
+    """
+    Example:
+        limit_key(scope, "identity") -> "id:3f2a..." or "ip:10.0.0.7" for anonymous callers
+    """
+    if kind == "route":
+        return "route"
+    if kind == "identity":
+        identity = auth_identity(scope)
+        if identity is not None:
+            return "id:" + identity
+    return "ip:" + client_ip(scope, trust_forwarded)
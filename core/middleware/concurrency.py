@@ -0,0 +1,64 @@
+"""
+Concurrency limiting with a bounded wait queue. Past the queue requests are turned away at
+once instead of piling up as coroutines that all end in a timeout.
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from core.logging.metrics import add_time
+from core.shared.proxy_definition import ConcurrencySettings
+
+
+class Overloaded(Exception):
+    """No slot free and no room left in the queue, or the queue wait ran out."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name} is overloaded, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    __slots__ = ("name", "settings", "waiting", "_semaphore")
+
+    def __init__(self, name: str, settings: ConcurrencySettings) -> None:
+        self.name = name
+        self.settings = settings
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(settings.max_concurrent)
+
+    @property
+    def retry_after(self) -> int:
+        return max(math.ceil(self.settings.queue_timeout), 1)
+
+    async def acquire(self) -> None:
+        """Take one of the max_concurrent slots, raises Overloaded when the request is shed."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self.waiting >= self.settings.max_queue:
+            raise Overloaded(self.name, self.retry_after)
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.settings.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(self.name, self.retry_after) from None
+        finally:
+            self.waiting -= 1
+            add_time("queue", time.perf_counter() - start)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
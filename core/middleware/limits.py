@@ -0,0 +1,170 @@
+"""
+Rate and concurrency limits. The [limits] table of sisyphus.toml sets the store and optional
+limits over every request (LimitsMiddleware), routes add their own through
+ProxyRouteDefinition.rate_limit / concurrency (RouteLimits) and pools cap the calls to each
+upstream with BalancerSettings.upstream_concurrency.
+Rate limited requests get a 429, shed ones a 503, both with Retry-After.
+"""
+
+import math
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel, field_validator
+from starlette.responses import Response
+
+from core.logging.logging import custom_message
+from custom_core.logging import exit_with_custom_message
+from core.middleware.auth import limit_key
+from core.middleware.concurrency import ConcurrencyLimiter, Overloaded
+from core.middleware.rate_limit import MemoryRateLimitStore, RateLimiter, RateLimitStore, RedisRateLimitStore
+from core.shared import codec
+from core.shared.proxy_definition import ConcurrencySettings, ProxyRouteDefinition, RateLimitSettings
+
+
+class LimitsConfig(BaseModel):
+    # The [limits] table of sisyphus.toml
+    enable: bool = True
+    # memory (per worker) or redis (redis_url, shared by every worker)
+    backend: str = "memory"
+    redis_url: str = "redis://127.0.0.1:6379/0"
+    # Buckets kept by the memory backend, the least recently used go first
+    max_keys: int = 100_000
+    # Key ip limits on X-Forwarded-For, only behind a proxy you control
+    trust_forwarded: bool = False
+    # Over every request, before routing
+    rate_limit: RateLimitSettings | None = None
+    concurrency: ConcurrencySettings | None = None
+
+    @field_validator("backend")
+    @classmethod
+    def validate_backend(cls, value: str) -> str:
+        if value not in {"memory", "redis"}:
+            exit_with_custom_message(f"Invalid limits backend: {value}", "error")
+            raise ValueError(f"Invalid limits backend: {value}, expected memory or redis")
+        return value
+
+
+_config: LimitsConfig = LimitsConfig()
+_store: RateLimitStore | None = None
+
+
+def build_store(config: LimitsConfig) -> RateLimitStore:
+    if config.backend == "redis":
+        return RedisRateLimitStore(config.redis_url)
+    return MemoryRateLimitStore(config.max_keys)
+
+
+def configure_limits(config: dict | LimitsConfig | None) -> LimitsConfig:
+    global _config, _store
+    _config = config if isinstance(config, LimitsConfig) else LimitsConfig(**(config or {}))
+    _store = build_store(_config)
+    if _config.enable and (_config.rate_limit or _config.concurrency):
+        custom_message(f"Global limits enabled with the {_config.backend} backend", "info")
+    return _config
+
+
+def get_limits_config() -> LimitsConfig:
+    return _config
+
+
+def get_limit_store() -> RateLimitStore:
+    """The shared rate limit store, in-memory until configure_limits says otherwise."""
+    global _store
+    if _store is None:
+        _store = build_store(_config)
+    return _store
+
+
+async def close_limit_store() -> None:
+    if _store is not None:
+        await _store.close()
+
+
+def rate_limited_response(retry_after: float) -> Response:
+    return shed_response(429, retry_after, "Rate limit exceeded")
+
+
+def shed_response(status_code: int, retry_after: float, message: str) -> Response:
+    return Response(
+        content=codec.dumps({"error": message, "status": "failed"}),
+        status_code=status_code,
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        media_type="application/json",
+    )
+
+
+class RouteLimits:
+    """The rate_limit and concurrency of one route, built by RoutePlan.compile."""
+    __slots__ = ("name", "rate_limit", "concurrency", "_limiter")
+
+    def __init__(self, name: str, rate_limit: RateLimitSettings | None, concurrency: ConcurrencySettings | None) -> None:
+        self.name = name
+        self.rate_limit = rate_limit
+        self.concurrency = ConcurrencyLimiter(name, concurrency) if concurrency is not None else None
+        self._limiter: RateLimiter | None = None
+
+    @classmethod
+    def build(cls, name: str, proxy_route_def: ProxyRouteDefinition) -> "RouteLimits | None":
+        if proxy_route_def.rate_limit is None and proxy_route_def.concurrency is None:
+            return None
+        return cls(name, proxy_route_def.rate_limit, proxy_route_def.concurrency)
+
+    async def run(self, scope: dict, call: Callable[[], Awaitable[Any]]) -> Any:
+        if self.rate_limit is not None:
+            if self._limiter is None:
+                # The store is looked up on first use so configure_limits may run after the mods registered
+                self._limiter = RateLimiter(self.name, self.rate_limit, get_limit_store())
+            key = limit_key(scope, self.rate_limit.key, _config.trust_forwarded)
+            retry_after = await self._limiter.check(key)
+            if retry_after:
+                return rate_limited_response(retry_after)
+        if self.concurrency is None:
+            return await call()
+        try:
+            await self.concurrency.acquire()
+        except Overloaded as e:
+            return shed_response(503, e.retry_after, str(e))
+        try:
+            return await call()
+        finally:
+            self.concurrency.release()
+
+
+class LimitsMiddleware:
+    """
+    ASGI middleware applying the global [limits] before routing. Passes everything through when
+    the table sets no limit.
+    """
+
+    def __init__(self, app, config: LimitsConfig | None = None) -> None:
+        self.app = app
+        self.config = config or get_limits_config()
+        self.rate_limit = self.config.rate_limit if self.config.enable else None
+        self.concurrency = (
+            ConcurrencyLimiter("Sisyphus", self.config.concurrency) if self.config.enable and self.config.concurrency else None
+        )
+        self._limiter: RateLimiter | None = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.rate_limit is not None:
+            if self._limiter is None:
+                self._limiter = RateLimiter("global", self.rate_limit, get_limit_store())
+            retry_after = await self._limiter.check(limit_key(scope, self.rate_limit.key, self.config.trust_forwarded))
+            if retry_after:
+                await rate_limited_response(retry_after)(scope, receive, send)
+                return
+        if self.concurrency is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.concurrency.acquire()
+        except Overloaded as e:
+            await shed_response(503, e.retry_after, str(e))(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrency.release()
@@ -0,0 +1,112 @@
+"""
+Token bucket rate limiting. Buckets live in memory by default, or in a Redis protocol
+server when several workers have to share them.
+"""
+
+import time
+from collections import OrderedDict
+
+from core.logging.logging import custom_message
+from core.logging.redis_cache import RespClient
+from core.shared.proxy_definition import RateLimitSettings
+
+
+class RateLimitStore:
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take a token from the bucket at key. Returns 0 when allowed, otherwise seconds until a token is available."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Buckets of this process, the least recently used are dropped past max_keys."""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+# Refill and take in one round trip, atomic on the server. The server clock is used so workers on
+# different hosts agree on the time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Buckets shared by every worker through a Redis protocol server. When the server can't be
+    reached requests are let through rather than failing them all.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "sisyphus:ratelimit:") -> None:
+        self.client = RespClient(url)
+        self.prefix = prefix
+        self._sha: str | None = None
+        self._warned = False
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        try:
+            return float(await self._eval(self.prefix + key, rate, burst))
+        except OSError as e:
+            if not self._warned:
+                custom_message(f"Rate limit store unreachable, not limiting: {e}", "warning")
+                self._warned = True
+            return 0.0
+
+    async def _eval(self, key: str, rate: float, burst: int):
+        if self._sha is None:
+            self._sha = (await self.client.execute("SCRIPT", "LOAD", TOKEN_BUCKET_SCRIPT)).decode("utf-8")
+        self._warned = False
+        return await self.client.execute("EVALSHA", self._sha, 1, key, rate, burst)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class RateLimiter:
+    """One limit, e.g. a route's rate_limit, on top of a shared store."""
+
+    def __init__(self, name: str, settings: RateLimitSettings, store: RateLimitStore) -> None:
+        self.name = name
+        self.settings = settings
+        self.burst = settings.burst or max(int(settings.rate), 1)
+        self.store = store
+
+    async def check(self, key: str) -> float:
+        """0 when the request may go on, otherwise the seconds the caller should wait (Retry-After)."""
+        return await self.store.take(f"{self.name}:{key}", self.settings.rate, self.burst)
@@ -1,19 +1,19 @@
 from core.logging.logging import custom_message
 from pathlib import Path
 import os
-import toml
+import tomllib
 
 def load_toml_config(config_path: str):
     try:
         custom_message(f"Loading config file: {config_path}", "info")
-        with open(config_path, "r") as f:
-            config = toml.load(f)
+        with open(config_path, "rb") as f:
+            config = tomllib.load(f)
         custom_message("Config file loaded successfully.", "info")
         return config
     except FileNotFoundError:
         custom_message(f"Config file not found: {config_path}", "error")
         raise
-    except toml.TomlDecodeError:
+    except tomllib.TOMLDecodeError:
         custom_message(f"Error decoding TOML file: {config_path}", "error")
         raise
 
@@ -25,5 +25,5 @@ def load_local_toml_config(config_path: str):
 
     config_path = os.path.abspath(config_path)
     custom_message(f"Config path resolved to: {config_path}", "info")
-    load_toml_config(config_path)
+    return load_toml_config(config_path)
 
@@ -1,8 +1,8 @@
 from core.logging.logging import custom_message
-import json
+from core.shared import codec
 def funny_haha_example(input):
     custom_message("This is a funny ahah, very peak!", "info")
-    input = json.loads(input)
+    input = codec.loads(input)
     input["funny"] = "haha"
     return input
 
@@ -0,0 +1,31 @@
+from typing import Any, AsyncIterator, Callable
+
+from httpx import Response
+
+
+def streaming_transform(func: Callable[[bytes], bytes]) -> Callable[[bytes], bytes]:
+    """
+    Mark an out callback as a per-chunk transform.
+    Streamed routes skip their out callback unless it is marked with this decorator,
+    in which case it is called with every chunk as it arrives and returns the chunk to forward.
+    """
+    func.streaming_transform = True
+    return func
+
+
+def is_streaming_transform(callback: Any) -> bool:
+    return getattr(callback, "streaming_transform", False) is True
+
+
+async def iter_upstream(response: Response, callback: Callable[[bytes], bytes] | None = None, raw: bool = False) -> AsyncIterator[bytes]:
+    # Closing here as well as in the response background task releases the pooled
+    # connection even when the client goes away halfway through the body.
+    # raw forwards the bytes as they came off the wire, still in their Content-Encoding
+    try:
+        async for chunk in (response.aiter_raw() if raw else response.aiter_bytes()):
+            if callback is not None:
+                chunk = callback(chunk)
+            if chunk:
+                yield chunk
+    finally:
+        await response.aclose()
@@ -1,12 +1,16 @@
 """
 Performance-optimized transformation functions using Numba.
 These functions can be used throughout the codebase for data processing tasks.
+
+Kernels are compiled with cache=True, so the machine code is written next to this file
+and later processes load it instead of compiling again. Call warmup() at startup so the
+first request never pays for compilation.
 """
 
 import numpy as np
 from numba import jit, njit, prange
 
-@njit
+@njit(cache=True)
 def fast_json_process(data):
     """
     Process JSON-like data with Numba optimization.
@@ -23,7 +27,7 @@ def fast_json_process(data):
         result[i] = data[i] * 2  # Example operation
     return result
 
-@jit(parallel=True)
+@jit(nopython=True, parallel=True, cache=True)
 def parallel_data_transform(data, transform_factor=1.0):
     """
     Apply a transformation to data using parallel processing.
@@ -44,7 +48,7 @@ def parallel_data_transform(data, transform_factor=1.0):
     
     return result
 
-@njit
+@njit(cache=True)
 def fast_header_process(headers_array):
     """
     Process HTTP headers with Numba optimization.
@@ -64,6 +68,21 @@ def fast_header_process(headers_array):
             result[i] = headers_array[i]
     return result
 
+def warmup():
+    """
+    Compile (or load from the on-disk cache) every kernel for the float64 arrays
+    produced by convert_dict_to_array.
+    """
+    sample = np.array([1.0, 2.0], dtype=np.float64)
+    fast_json_process(sample)
+    parallel_data_transform(sample)
+    parallel_data_transform(sample, 1.0)
+    fast_header_process(sample)
+
+def _is_number(value):
+    # bool is an int subclass but never a numeric value in JSON
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
 def convert_dict_to_array(data_dict):
     """
     Convert dictionary data to numpy arrays for Numba processing.
@@ -81,7 +100,7 @@ def convert_dict_to_array(data_dict):
         return np.array([])
     
     try:
-        values = [float(v) for v in data_dict.values() if isinstance(v, (int, float))]
+        values = [float(v) for v in data_dict.values() if _is_number(v)]
         return np.array(values, dtype=np.float64)
     except (ValueError, TypeError):
         return np.array([])
@@ -103,10 +122,158 @@ def convert_array_to_dict(original_dict, processed_array):
         return original_dict.copy()
     
     result = original_dict.copy()
-    numeric_keys = [k for k, v in original_dict.items() if isinstance(v, (int, float))]
+    numeric_keys = [k for k, v in original_dict.items() if _is_number(v)]
     
     for i, key in enumerate(numeric_keys):
         if i < len(processed_array):
             result[key] = processed_array[i]
             
     return result
+
+
+# Columnar engine
+#
+# A JSON array of homogeneous records is turned into one float64 column per JSON path
+# (e.g. "userId" or "address.geo.lat"), each kernel runs once over a whole column and
+# the results are written back into the decoded records in a single sweep.
+
+KERNELS = {
+    "fast_json_process": fast_json_process,
+    "parallel_data_transform": parallel_data_transform,
+    "fast_header_process": fast_header_process,
+}
+
+class Column:
+    """Numeric values found at one JSON path, with the index of the record each came from (None when every record has one)."""
+    __slots__ = ("keys", "rows", "values", "all_int")
+
+    def __init__(self, keys, rows, values, all_int):
+        self.keys = keys
+        self.rows = rows
+        self.values = values
+        self.all_int = all_int
+
+def as_records(data):
+    """
+    The records a payload holds: the dicts of a JSON array, or the object itself.
+    """
+    if isinstance(data, list):
+        return [record for record in data if isinstance(record, dict)]
+    if isinstance(data, dict):
+        return [data]
+    return []
+
+def discover_numeric_paths(record, prefix=""):
+    """
+    Every JSON path of a record that holds a number, nested objects included.
+
+    Example:
+        discover_numeric_paths({"id": 1, "geo": {"lat": 1.5}, "done": True}) -> ["id", "geo.lat"]
+    """
+    paths = []
+    for key, value in record.items():
+        if _is_number(value):
+            paths.append(prefix + key)
+        elif isinstance(value, dict):
+            paths.extend(discover_numeric_paths(value, prefix + key + "."))
+    return paths
+
+def _get_path(record, keys):
+    for key in keys:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+def _set_path(record, keys, value):
+    for key in keys[:-1]:
+        record = record[key]
+    record[keys[-1]] = value
+
+def _gather(records, keys):
+    if len(keys) == 1:
+        key = keys[0]
+        return [record.get(key) for record in records]
+    try:
+        # Homogeneous records have the whole path everywhere
+        if len(keys) == 2:
+            first, second = keys
+            return [record[first][second] for record in records]
+        return [_get_path(record, keys) for record in records]
+    except (KeyError, TypeError):
+        return [_get_path(record, keys) for record in records]
+
+def records_to_columns(records, paths):
+    """
+    Flatten records into one column per JSON path. Records without a number at a path are left out of that column.
+
+    Args:
+        records: List of decoded JSON objects
+        paths: Dotted JSON paths to collect
+
+    Returns:
+        Dict of path to Column
+    """
+    columns = {}
+    for path in paths:
+        keys = path.split(".")
+        values = _gather(records, keys)
+        types = set(map(type, values))
+        if types and types <= {int, float}:
+            # Every record has a number here, the common case for homogeneous payloads
+            columns[path] = Column(keys, None, np.array(values, dtype=np.float64), float not in types)
+            continue
+        found = [(i, value) for i, value in enumerate(values) if _is_number(value)]
+        if not found:
+            continue
+        rows, values = zip(*found)
+        columns[path] = Column(
+            keys,
+            rows,
+            np.array(values, dtype=np.float64),
+            all(isinstance(value, int) for value in values)
+        )
+    return columns
+
+def columns_to_records(records, columns):
+    """
+    Write every column back into its records, in one sweep once all kernels have run.
+    Columns that only held ints stay ints when the kernel kept them whole.
+    """
+    for column in columns.values():
+        values = column.values
+        if column.all_int and np.all(np.mod(values, 1) == 0):
+            values = values.astype(np.int64)
+        values = values.tolist()
+        keys = column.keys
+        targets = records if column.rows is None else [records[row] for row in column.rows]
+        if len(keys) == 1:
+            key = keys[0]
+            for record, value in zip(targets, values):
+                record[key] = value
+        else:
+            for record, value in zip(targets, values):
+                _set_path(record, keys, value)
+    return records
+
+def transform_records(data, transforms):
+    """
+    Run kernels over columns of a decoded JSON payload, in place.
+
+    Args:
+        data: Decoded JSON, an array of records or a single object
+        transforms: Dict of JSON path to kernel name, or a kernel name to run on every numeric path
+
+    Returns:
+        The same payload with the transformed values
+    """
+    records = as_records(data)
+    if not records:
+        return data
+    if isinstance(transforms, str):
+        transforms = {path: transforms for path in discover_numeric_paths(records[0])}
+    columns = records_to_columns(records, transforms.keys())
+    for path, column in columns.items():
+        column.values = np.asarray(KERNELS[transforms[path]](column.values), dtype=np.float64)
+    columns_to_records(records, columns)
+    return data
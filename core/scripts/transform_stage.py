@@ -0,0 +1,55 @@
+"""
+Opt-in transform stage of a route. Nothing here imports numba until a route
+actually declares a transform, routes without one never have their body parsed.
+"""
+
+from typing import Any
+
+from core.shared import codec
+
+# Kernels from core.scripts.transform that routes can name in response_transform,
+# request_transform and as the values of column_transforms
+TRANSFORMS = ("fast_json_process", "parallel_data_transform", "fast_header_process")
+
+
+def validate_transform(name: str | None) -> str | None:
+    if name is not None and name not in TRANSFORMS:
+        raise ValueError(f"Unknown transform: {name}. Available transforms: {', '.join(TRANSFORMS)}")
+    return name
+
+
+def warmup_transforms() -> None:
+    from core.scripts import transform
+    transform.warmup()
+
+
+def validate_column_transforms(transforms: dict[str, str] | None) -> dict[str, str] | None:
+    for name in (transforms or {}).values():
+        validate_transform(name)
+    return transforms
+
+
+def apply_transform(data: Any, transforms: str | dict[str, str]) -> Any:
+    """
+    Run kernels over the numeric columns of a decoded JSON body, see transform_records.
+
+    Args:
+        data: Decoded JSON body, an array of records or a single object
+        transforms: Kernel name for every numeric path, or a dict of JSON path to kernel name
+
+    Returns:
+        The transformed body
+    """
+    from core.scripts import transform
+
+    return transform.transform_records(data, transforms)
+
+
+def transform_json_bytes(body: bytes, transforms: str | dict[str, str]) -> bytes:
+    try:
+        data = codec.loads(body)
+    except codec.DecodeError:
+        return body
+    if not isinstance(data, (dict, list)):
+        return body
+    return codec.dumps(apply_transform(data, transforms))
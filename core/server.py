@@ -0,0 +1,104 @@
+"""
+Production serving. With more than one worker uvicorn starts that many processes, and each one
+imports the app factory, so mods, routes and pooled clients are built per process.
+"""
+
+import importlib.util
+import os
+from typing import Any
+
+import uvicorn
+from pydantic import BaseModel, field_validator
+
+from core.authentication.certificate import SSLCertificateManager
+from core.logging.logging import custom_message, invalid_port
+from core.scripts.loader import load_toml_config
+from custom_core.logging import exit_with_custom_message
+
+
+class ServerConfig(BaseModel):
+    # The [server] table of sisyphus.toml
+    host: str = "0.0.0.0"
+    # Worker processes, 0 starts one per CPU available to Sisyphus
+    workers: int = 0
+    # auto picks uvloop and httptools when they are installed (pip install .[server])
+    loop: str = "auto"
+    http: str = "auto"
+    # Seconds in-flight requests get to finish on shutdown before they are cancelled
+    graceful_timeout: int = 30
+    timeout_keep_alive: int = 5
+    backlog: int = 2048
+
+    @field_validator("workers")
+    @classmethod
+    def validate_workers(cls, value: int) -> int:
+        if value < 0:
+            exit_with_custom_message(f"Invalid worker count: {value}", "error")
+            raise ValueError(f"Invalid worker count: {value}, expected 0 (one per CPU) or more")
+        return value
+
+    def worker_count(self) -> int:
+        if self.workers:
+            return self.workers
+        # The CPUs this process may run on, which is less than cpu_count() in a container with a cpuset
+        if hasattr(os, "sched_getaffinity"):
+            return max(len(os.sched_getaffinity(0)), 1)
+        return os.cpu_count() or 1
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def event_loop(setting: str) -> str:
+    if setting != "auto":
+        return setting
+    return "uvloop" if _installed("uvloop") else "asyncio"
+
+
+def http_protocol(setting: str) -> str:
+    if setting != "auto":
+        return setting
+    return "httptools" if _installed("httptools") else "h11"
+
+
+def run_server(app: Any, server: ServerConfig, port: int, ssl_config=None) -> None:
+    """
+    Serve app on port. app is either an ASGI app, served by this process only, or an import
+    string "module:function" of an app factory, which may run in several worker processes.
+    """
+    workers = server.worker_count()
+    if workers > 1 and not isinstance(app, str):
+        custom_message("Several workers need an app factory (\"module:function\"), serving one process", "warning")
+        workers = 1
+    loop, http = event_loop(server.loop), http_protocol(server.http)
+    custom_message(f"Serving on {server.host}:{port} with {workers} worker(s), {loop} loop, {http} parser", "info")
+    ssl = {"ssl_keyfile": ssl_config.keyfile, "ssl_certfile": ssl_config.certfile} if ssl_config is not None else {}
+    uvicorn.run(
+        app,
+        factory=isinstance(app, str),
+        host=server.host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=server.graceful_timeout,
+        timeout_keep_alive=server.timeout_keep_alive,
+        backlog=server.backlog,
+        # Sisyphus has its own sampled, queued access log ([logging] access_log)
+        access_log=False,
+        **ssl,
+    )
+
+
+def serve(app_factory: str, config_path: str = "sisyphus.toml") -> None:
+    """
+    Production entry point. Only the [server], port and certificate settings are read here, the
+    workers build everything else by calling app_factory.
+
+    Example:
+        serve("main:create_app")
+    """
+    config = load_toml_config(config_path)
+    ssl_config = SSLCertificateManager(config["load_cert"]) if config.get("load_cert", {}).get("load") else None
+    run_server(app_factory, ServerConfig(**config.get("server", {})), invalid_port(int(config["port"])), ssl_config)
@@ -0,0 +1,143 @@
+"""
+Central JSON codec. Uses orjson or msgspec when installed and falls back to the stdlib,
+every hook in the request path should encode and decode through here.
+"""
+
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def _stdlib_loads(data: bytes | str) -> Any:
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _default(obj: Any) -> Any:
+    # numpy scalars and arrays coming out of the transform stage
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _msgspec_codec() -> tuple[Callable[[bytes | str], Any], Callable[[Any], bytes]]:
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    decoder = msgspec.json.Decoder()
+    return decoder.decode, encoder.encode
+
+
+BACKENDS: dict[str, Callable[[], tuple[Callable[[bytes | str], Any], Callable[[Any], bytes]]]] = {
+    "stdlib": lambda: (_stdlib_loads, _stdlib_dumps),
+}
+if orjson is not None:
+    BACKENDS["orjson"] = lambda: (orjson.loads, _orjson_dumps)
+if msgspec is not None:
+    BACKENDS["msgspec"] = _msgspec_codec
+
+backend: str = ""
+_loads: Callable[[bytes | str], Any] = _stdlib_loads
+_dumps: Callable[[Any], bytes] = _stdlib_dumps
+
+
+def use_backend(name: str) -> None:
+    global backend, _loads, _dumps
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name} is not installed. Available: {', '.join(BACKENDS)}")
+    _loads, _dumps = BACKENDS[name]()
+    backend = name
+
+
+use_backend("orjson" if orjson is not None else "msgspec" if msgspec is not None else "stdlib")
+
+
+def loads(data: "bytes | str | ParsedBody") -> Any:
+    """
+    Decode JSON. A ParsedBody is only decoded the first time.
+
+    Example:
+        loads(b'{"key": "value"}') -> {'key': 'value'}
+    """
+    if isinstance(data, ParsedBody):
+        return data.json()
+    try:
+        return _loads(data)
+    except Exception as e:
+        raise DecodeError(str(e)) from e
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact JSON bytes."""
+    if isinstance(obj, ParsedBody):
+        return obj.raw
+    return _dumps(obj)
+
+
+_MISSING = object()
+
+
+class ParsedBody:
+    """
+    A request or response body that is decoded at most once and encoded at most once,
+    however many hooks look at it. Hooks read it with json() (or codec.loads). A body that is
+    only read goes out as the bytes it came in as. Hooks changing the returned object in place
+    call mark_dirty(), or hand back a new one with set().
+
+    Response bodies also carry the upstream status code and headers, hooks can change those too.
+    """
+    __slots__ = ("_raw", "_data", "status_code", "headers")
+
+    def __init__(self, raw: bytes | None = None, data: Any = _MISSING, status_code: int = 200, headers: dict[str, str] | None = None) -> None:
+        self._raw = raw
+        self._data = data
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def decoded(self) -> bool:
+        return self._data is not _MISSING
+
+    def json(self) -> Any:
+        if self._data is _MISSING:
+            self._data = loads(self._raw or b"null")
+        return self._data
+
+    def set(self, data: Any) -> None:
+        self._data = data
+        self._raw = None
+
+    def mark_dirty(self) -> None:
+        """The object json() returned was changed in place, encode it again on the way out."""
+        if self._data is not _MISSING:
+            self._raw = None
+
+    @property
+    def raw(self) -> bytes:
+        if self._raw is None:
+            self._raw = b"" if self._data is _MISSING else dumps(self._data)
+        return self._raw
+
+    def __bytes__(self) -> bytes:
+        return self.raw
+
+    def __len__(self) -> int:
+        return len(self.raw)
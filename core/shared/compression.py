@@ -0,0 +1,87 @@
+"""
+Response compression. Routes that hand the upstream body out untouched can pass the upstream's
+compressed bytes straight through, bodies Sisyphus had to decode are gzipped again on the way out.
+"""
+
+import asyncio
+import gzip
+
+from pydantic import BaseModel
+
+from core.logging.logging import custom_message
+
+# Content types worth compressing, images, archives and the like already are
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "+json", "+xml")
+# Above this size gzip runs on a worker thread (zlib releases the GIL) instead of on the event loop
+THREAD_THRESHOLD = 256 * 1024
+
+
+class CompressionConfig(BaseModel):
+    # The [compression] table of sisyphus.toml
+    # Forward the client's Accept-Encoding and stream the compressed upstream body through as is
+    passthrough: bool = False
+    # gzip bodies that were decoded for a transform, an out callback or the cache
+    enable: bool = False
+    level: int = 6
+    min_size: int = 1024
+
+
+_config: CompressionConfig = CompressionConfig()
+
+
+def configure_compression(config: dict | CompressionConfig | None) -> CompressionConfig:
+    global _config
+    _config = config if isinstance(config, CompressionConfig) else CompressionConfig(**(config or {}))
+    if _config.passthrough or _config.enable:
+        custom_message(f"Compression: passthrough={_config.passthrough}, gzip={_config.enable} (level {_config.level})", "info")
+    return _config
+
+
+def get_compression_config() -> CompressionConfig:
+    return _config
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Example:
+        accepts_gzip("br, gzip;q=0.8") -> True
+        accepts_gzip("gzip;q=0") -> False
+    """
+    if not accept_encoding:
+        return False
+    # An explicit gzip entry wins over *, whatever their order
+    weights: dict[str, float] = {}
+    for coding in accept_encoding.lower().split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        if name in {"gzip", "*"}:
+            weights.setdefault(name, _quality(params))
+    return weights.get("gzip", weights.get("*", 0.0)) > 0
+
+
+def _quality(params: list[str]) -> float:
+    # A malformed q-value makes the coding not acceptable instead of failing the response
+    for param in params:
+        if param.startswith("q="):
+            try:
+                q = float(param[2:])
+            except ValueError:
+                return 0.0
+            return q if 0 <= q <= 1 else 0.0
+    return 1.0
+
+
+def should_compress(headers: dict[str, str], size: int, accept_encoding: str | None) -> bool:
+    config = _config
+    if not config.enable or size < config.min_size or "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "application/json").lower()
+    if not any(t in content_type for t in COMPRESSIBLE_TYPES):
+        return False
+    return accepts_gzip(accept_encoding)
+
+
+async def gzip_body(body: bytes) -> bytes:
+    # mtime=0 keeps the output stable, so identical bodies give identical bytes
+    if len(body) >= THREAD_THRESHOLD:
+        return await asyncio.to_thread(gzip.compress, body, _config.level, mtime=0)
+    return gzip.compress(body, _config.level, mtime=0)
@@ -1,5 +1,5 @@
 from core.logging.logging import register_mod_lib
-from core.scripts.loader import load_toml_config
+from core.factory.validate import RouteEntry, load_mod_config
 
 
 class LoadedTomlConfigs:
@@ -9,11 +9,12 @@ class LoadedTomlConfigs:
 
     def load_config(self, config_path: str):
         if config_path not in self.configs:
-            self.configs[config_path] = load_toml_config(config_path)
+            self.configs[config_path] = load_mod_config(config_path).config
         return self.configs[config_path]
 
     def load_local_config(self, config_path: str):
-        if config_path not in self.configs:
-            self.configs[config_path] = load_toml_config(config_path)
-        return self.configs[config_path]
+        return self.load_config(config_path)
 
+    def load_routes(self, config_path: str) -> list[RouteEntry]:
+        # The validated [[routes]] of the file, pass them to RouteFactory.create_routes
+        return load_mod_config(config_path).routes
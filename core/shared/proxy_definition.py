@@ -1,28 +1,225 @@
 
 import sys
 from typing import Any
-from pydantic import BaseModel, HttpUrl, ValidationError, ValidatorFunctionWrapHandler, field_validator
+from pydantic import BaseModel, HttpUrl, ValidationError, ValidatorFunctionWrapHandler, field_validator, model_validator
 from urllib.parse import urlparse
 from custom_core.logging import exit_with_custom_message
-from httpx import BasicAuth
+from core.scripts.transform_stage import validate_column_transforms, validate_transform
+from httpx import BasicAuth, Timeout
 
 
 
+class TimeoutSettings(BaseModel):
+    # Seconds, None waits forever
+    connect: float | None = 5.0
+    read: float | None = 30.0
+    write: float | None = 30.0
+    # Waiting for a free connection of the pool
+    pool: float | None = 5.0
+
+    def as_httpx(self) -> Timeout:
+        return Timeout(connect=self.connect, read=self.read, write=self.write, pool=self.pool)
+
+
+class RetrySettings(BaseModel):
+    # Only idempotent methods with a buffered body are retried
+    max_retries: int = 2
+    # Seconds, the backoff doubles every attempt up to max_backoff and is fully jittered
+    backoff: float = 0.05
+    max_backoff: float = 1.0
+    # Upstream statuses that are retried like connection errors
+    statuses: list[int] = [502, 503, 504]
+    # Retries and hedges may add this share of the mod's traffic, plus budget_min_per_second
+    budget_ratio: float = 0.2
+    budget_min_per_second: float = 10.0
+
+
+class HedgeSettings(BaseModel):
+    # Seconds to wait for an answer before a second copy of the request goes out, roughly the upstream's p95
+    delay: float = 0.1
+
+
+class CircuitBreakerSettings(BaseModel):
+    # Consecutive failures (connection errors, timeouts or one of statuses) that open the breaker
+    failure_threshold: int = 5
+    # Upstream statuses counted as failures, whether or not the call may be retried
+    statuses: list[int] = [502, 503, 504]
+    # Seconds the breaker stays open before letting probes through
+    reset_timeout: float = 10.0
+    half_open_max: int = 1
+
+
+RATE_LIMIT_KEYS = frozenset({"ip", "identity", "route"})
+
+
+class RateLimitSettings(BaseModel):
+    # Token bucket: `rate` requests per second on average, bursts of up to `burst` (defaults to rate)
+    rate: float
+    burst: int | None = None
+    # What the bucket is per: ip (client address), identity (Authorization / X-API-Key, falls back to ip) or route (shared by everyone)
+    key: str = "ip"
+
+    @field_validator("key")
+    @classmethod
+    def validate_key(cls, value: str) -> str:
+        if value not in RATE_LIMIT_KEYS:
+            exit_with_custom_message(f"Invalid rate limit key: {value}", "error")
+            raise ValueError(f"Invalid rate limit key: {value}, expected ip, identity or route")
+        return value
+
+
+class ConcurrencySettings(BaseModel):
+    # Calls running at once, the next max_queue wait up to queue_timeout seconds for a slot and the rest are turned away
+    max_concurrent: int
+    max_queue: int = 0
+    queue_timeout: float = 1.0
+
+
+class HealthCheckSettings(BaseModel):
+    # Polled on every upstream of the pool, a failing host gets no traffic until it answers again
+    path: str = "/health"
+    # Seconds
+    interval: float = 10.0
+    timeout: float = 2.0
+
+
+class BalancerSettings(BaseModel):
+    # How a request picks one of the target_url upstreams:
+    # round_robin, least_outstanding, ewma (latency weighted) or consistent_hash (on hash_param)
+    strategy: str = "round_robin"
+    # Path param hashed by consistent_hash, the whole path when unset or missing from the route
+    hash_param: str | None = None
+    # Passive health: consecutive failures (errors or 5xx) that eject a host, for eject_seconds
+    failure_threshold: int = 3
+    eject_seconds: float = 30.0
+    # Weight of the newest latency sample in the ewma strategy
+    ewma_alpha: float = 0.3
+    health_check: HealthCheckSettings | None = None
+    # Caps the calls in flight to each upstream of the pool, see ConcurrencySettings
+    upstream_concurrency: ConcurrencySettings | None = None
+
+    @field_validator("strategy")
+    @classmethod
+    def validate_strategy(cls, value: str) -> str:
+        allowed = {"round_robin", "least_outstanding", "ewma", "consistent_hash"}
+        if value not in allowed:
+            exit_with_custom_message(f"Invalid balancer strategy: {value}", "error")
+            raise ValueError(f"Invalid balancer strategy: {value}, expected one of {', '.join(sorted(allowed))}")
+        return value
+
+
+class CredentialSettings(BaseModel):
+    # Credentials sent upstream, see core/authentication/credentials.py
+    # basic, bearer, api_key or client_credentials (OAuth 2, tokens cached and refreshed before they expire)
+    type: str
+    # Header the credentials go in, Authorization by default and X-API-Key for api_key
+    header: str | None = None
+    # Secrets may be "env:NAME" to read them from the environment
+    username: str | None = None
+    password: str | None = None
+    # The bearer token or the API key
+    token: str | None = None
+    token_url: HttpUrl | None = None
+    client_id: str | None = None
+    client_secret: str | None = None
+    scope: str | None = None
+    # Seconds before a token expires that it is refreshed in the background
+    refresh_margin: float = 30.0
+
+    @model_validator(mode="after")
+    def validate_type(self) -> "CredentialSettings":
+        required = {
+            "basic": ("username", "password"),
+            "bearer": ("token",),
+            "api_key": ("token",),
+            "client_credentials": ("token_url", "client_id", "client_secret"),
+        }
+        if self.type not in required:
+            exit_with_custom_message(f"Invalid credentials type: {self.type}", "error")
+            raise ValueError(f"Invalid credentials type: {self.type}, expected one of {', '.join(required)}")
+        missing = [name for name in required[self.type] if getattr(self, name) is None]
+        if missing:
+            exit_with_custom_message(f"{self.type} credentials need {', '.join(missing)}", "error")
+            raise ValueError(f"{self.type} credentials need {', '.join(missing)}")
+        return self
+
+
+class ModSettings(BaseModel):
+    # Read from the [mod_settings] table of a mod's TOML
+    # Milliseconds, read timeout of every route unless [mod_settings.timeouts] or the route says otherwise
+    global_timeout: int | None = None
+    timeouts: TimeoutSettings | None = None
+    retries: RetrySettings = RetrySettings()
+    # Off by default, hedging doubles the load on slow upstreams (within the retry budget)
+    hedge: HedgeSettings | None = None
+    # One breaker per upstream, None turns it off
+    circuit_breaker: CircuitBreakerSettings | None = CircuitBreakerSettings()
+    # Spreads requests over the upstreams when target_url is a list
+    balancer: BalancerSettings = BalancerSettings()
+    http2: bool = True
+    max_connections: int | None = 100
+    max_keepalive_connections: int | None = 20
+    keepalive_expiry: float | None = 5.0
+    # Size of the thread pool behind the requests based routes, caps their concurrency
+    requests_max_workers: int = 16
+    # fastapi, or trie to match the proxy routes with core/factory/trie_router.py (custom routes stay FastAPI routes)
+    dispatch: str = "fastapi"
+    # Added to every upstream request of the mod, unless the route sets its own auth
+    credentials: CredentialSettings | None = None
+
+    @field_validator("dispatch")
+    @classmethod
+    def validate_dispatch(cls, value: str) -> str:
+        if value not in {"fastapi", "trie"}:
+            exit_with_custom_message(f"Invalid dispatch mode: {value}", "error")
+            raise ValueError(f"Invalid dispatch mode: {value}, expected fastapi or trie")
+        return value
+
+
+class RouteCacheSettings(BaseModel):
+    # Seconds an entry stays fresh, defaults to cache_duration from sisyphus.toml
+    ttl: int | None = None
+    # Request headers that are part of the cache key
+    vary_headers: list[str] = ["accept", "authorization"]
+    # Seconds a stale entry is still served while it is refreshed in the background,
+    # unless the upstream sends its own stale-while-revalidate
+    stale_while_revalidate: int = 0
+
+    @field_validator("vary_headers", mode="after")
+    @classmethod
+    def lower_vary_headers(cls, value: list[str]) -> list[str]:
+        return [h.lower() for h in value]
+
+
 class ProxyDefinition(BaseModel):
     endpoint: str
-    target_url: HttpUrl
+    # One upstream, or a pool of them balanced with mod_settings.balancer
+    target_url: HttpUrl | list[HttpUrl]
     header: set[str] | None = None
+    mod_settings: ModSettings = ModSettings()
+    # A CredentialProvider, replaces mod_settings.credentials for mods built in Python
+    credentials: Any | None = None
 
     @field_validator("target_url", mode="after")
     @classmethod
-    def disallow_localhost(cls, value: HttpUrl) -> HttpUrl:
-        parsed = urlparse(str(value))
-        if parsed.hostname in {"localhost", "127.0.0.1"}:
+    def disallow_localhost(cls, value: HttpUrl | list[HttpUrl]) -> HttpUrl | list[HttpUrl]:
+        for url in value if isinstance(value, list) else [value]:
+            parsed = urlparse(str(url))
+            if parsed.hostname in {"localhost", "127.0.0.1"}:
 
-            exit_with_custom_message(f"Localhost is not allowed! {value}", "error")
-            raise ValueError("Localhost URLs are not allowed.")
+                exit_with_custom_message(f"Localhost is not allowed! {url}", "error")
+                raise ValueError("Localhost URLs are not allowed.")
+        if isinstance(value, list) and not value:
+            exit_with_custom_message("target_url needs at least one upstream", "error")
+            raise ValueError("target_url needs at least one upstream")
         return value
 
+    @property
+    def targets(self) -> list[str]:
+        # HttpUrl adds a trailing slash to a bare host, url_route brings its own
+        urls = self.target_url if isinstance(self.target_url, list) else [self.target_url]
+        return [str(url).rstrip("/") for url in urls]
+
 class ProxyRouteDefinition(BaseModel):
     url_route: str | None = None
     route: str | None = None
@@ -32,7 +229,24 @@ class ProxyRouteDefinition(BaseModel):
     data: Any | None = None
     auth: Any | None = None
     headers: Any | None = None
-    _timeout: int = 1
+    # Forward the upstream body as it arrives instead of buffering and post-processing it
+    stream: bool = False
+    # Cache GET responses, see the [cache] table in sisyphus.toml
+    cache: RouteCacheSettings | None = None
+    # Share one upstream call between identical GETs that are in flight at the same time
+    coalesce: bool = False
+    # Numba kernel run over the JSON body, see core/scripts/transform_stage.py. Without one the body isn't parsed.
+    response_transform: str | None = None
+    request_transform: str | None = None
+    # Kernel per JSON path of the response records, e.g. {"userId": "fast_json_process", "geo.lat": "parallel_data_transform"}
+    column_transforms: dict[str, str] | None = None
+    # Override the mod's [mod_settings] for this route
+    timeouts: TimeoutSettings | None = None
+    retries: RetrySettings | None = None
+    hedge: HedgeSettings | None = None
+    # Checked before the route does any work, on top of the [limits] of sisyphus.toml
+    rate_limit: RateLimitSettings | None = None
+    concurrency: ConcurrencySettings | None = None
     _name: str | None = None
     _tags: list[str] | None  = None
 
@@ -58,6 +272,24 @@ class ProxyRouteDefinition(BaseModel):
 
         return upper_value
 
+    @field_validator("response_transform", "request_transform", mode="after")
+    @classmethod
+    def validate_transform(cls, value: str | None) -> str | None:
+        try:
+            return validate_transform(value)
+        except ValueError as e:
+            exit_with_custom_message(str(e), "error")
+            raise
+
+    @field_validator("column_transforms", mode="after")
+    @classmethod
+    def validate_column_transforms(cls, value: dict[str, str] | None) -> dict[str, str] | None:
+        try:
+            return validate_column_transforms(value)
+        except ValueError as e:
+            exit_with_custom_message(str(e), "error")
+            raise
+
     @field_validator("url_route", mode="after")
     @classmethod
     def validate_url_route(cls, value: str) -> str:
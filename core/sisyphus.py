@@ -1,19 +1,44 @@
-import uvicorn
-
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import PlainTextResponse
 from core.scripts.loader import load_toml_config
-from core.logging.logging import invalid_port
+from core.logging.logging import configure_logging, invalid_port
+from core.middleware.access_log import AccessLogMiddleware
 from core.authentication.certificate import SSLCertificateManager
+from core.factory.register_mod import mod_registry
+from core.logging.cache import configure_cache, get_cache
+from core.shared.compression import configure_compression
+from core.middleware.limits import LimitsMiddleware, close_limit_store, configure_limits
+from core.server import ServerConfig, run_server
+from core.logging.metrics import configure_metrics, get_metrics_config
+from core.factory.mod_loader import ModLoader, ModsConfig
+from core.factory.mod_admin import AdminConfig, admin_router
+from core.factory.trie_router import TrieRouter
 
 
 class Sisyphus:
-    def __init__(self):
-        self.app: FastAPI = FastAPI()
+    def __init__(self, config_path: str = "sisyphus.toml"):
+        self.app: FastAPI = FastAPI(lifespan=self.lifespan)
         self.ssl_config = None
         self.cors_config = None
-        self.config = load_toml_config("sisyphus.toml")
+        self.config = load_toml_config(config_path)
+        self.logging = configure_logging(self.config.get("logging"))
         self.port: int = invalid_port(int(self.config["port"]))
+        self.server: ServerConfig = ServerConfig(**self.config.get("server", {}))
+        self.mods: ModLoader = ModLoader(self, ModsConfig(**self.config.get("mods", {})))
+        self.admin: AdminConfig = AdminConfig(**self.config.get("admin", {}))
+        if self.admin.enable:
+            self.app.include_router(admin_router(self.mods, self.admin))
+        configure_cache(self.config.get("cache"))
+        configure_compression(self.config.get("compression"))
+        configure_limits(self.config.get("limits"))
+        # Before any mod compiles its routes, they take their counters from this registry
+        self.metrics = configure_metrics(self.config.get("metrics"))
+        if self.metrics is not None:
+            self.app.add_api_route(get_metrics_config().path, self.metrics_endpoint, methods=["GET"], include_in_schema=False)
+        # Added before CORS so it runs inside it, shed responses still get the CORS headers
+        self.app.add_middleware(LimitsMiddleware)
         
 
 
@@ -27,16 +52,50 @@ class Sisyphus:
                 allow_headers=self.cors_config["allow_headers"],
             )
 
+        if self.logging.access_log:
+            # Added last so it is outermost, shed and CORS preflight requests are logged too
+            self.app.add_middleware(AccessLogMiddleware, config=self.logging)
+
         
         if self.config["load_cert"]["load"] == True:
             self.ssl_config = SSLCertificateManager(self.config["load_cert"])
     
-    def run(self):
-        if self.config["load_cert"]["load"] == True:
-            uvicorn.run(self.app, host="0.0.0.0", port=self.port, ssl_keyfile=self.ssl_config.keyfile, ssl_certfile=self.ssl_config.certfile)
-        else:
-            uvicorn.run(self.app, host="0.0.0.0", port=self.port) 
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI):
+        # Every registered mod keeps one pooled upstream client for the lifetime of the app
+        for mod in mod_registry.values():
+            await mod.Factory.startup()
+        if self.mods.config.watch:
+            self.mods.start_watching()
+        yield
+        # Replaced mod versions finish their requests and close first
+        await self.mods.close()
+        # uvicorn has stopped accepting and waited for in-flight requests by now, the factories
+        # still let their background revalidations finish before closing the clients
+        for mod in mod_registry.values():
+            await mod.Factory.shutdown(drain_timeout=self.server.graceful_timeout)
+        cache = get_cache()
+        if cache is not None:
+            await cache.close()
+        await close_limit_store()
+
+    def run(self, app_factory: str | None = None):
+        """
+        Serve this app in one process. Pass the import string of an app factory
+        ("main:create_app") to run the [server] workers, each building its own app.
+        """
+        run_server(app_factory or self.app, self.server, self.port, self.ssl_config)
+
+    async def metrics_endpoint(self) -> PlainTextResponse:
+        return PlainTextResponse(self.metrics.render(), media_type="text/plain; version=0.0.4")
+
+    def load_mods(self) -> ModLoader:
+        """Find the mods under [mods] path. Lazy ones are only imported on their first request."""
+        self.mods.discover()
+        self.mods.register()
+        return self.mods
 
     def register(self, route: APIRouter):
-        print(route)
         self.app.include_router(route)
+        # include_router only copies FastAPI routes, the trie of dispatch = "trie" mods is added as is
+        self.app.router.routes.extend(r for r in route.routes if isinstance(r, TrieRouter))
@@ -0,0 +1,78 @@
+from collections import Counter
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.balancer import Balancer
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import BalancerSettings, HealthCheckSettings, ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+HOSTS = ["http://a.test/", "http://b.test/", "http://c.test/"]
+
+
+def make_balancer(**settings) -> Balancer:
+    return Balancer(HOSTS, BalancerSettings(**settings))
+
+
+def test_round_robin_spreads_evenly():
+    balancer = make_balancer()
+    assert Counter(balancer.pick().url for _ in range(30)) == {url: 10 for url in HOSTS}
+
+
+def test_least_outstanding_and_ewma_avoid_busy_hosts():
+    balancer = make_balancer(strategy="least_outstanding")
+    a, b, c = balancer.upstreams
+    a.outstanding, b.outstanding = 3, 1
+    assert balancer.pick() is c
+
+    balancer = make_balancer(strategy="ewma")
+    a, b, c = balancer.upstreams
+    a.ewma, b.ewma, c.ewma = 0.5, 0.01, 0.02
+    assert balancer.pick() is b
+    # A slow host with nothing in flight beats a fast host with a queue
+    b.outstanding = 4
+    assert balancer.pick() is c
+
+
+def test_consistent_hash_only_moves_keys_of_an_ejected_host():
+    balancer = make_balancer(strategy="consistent_hash")
+    before = {key: balancer.pick(key) for key in map(str, range(300))}
+    assert len(set(before.values())) == 3
+
+    ejected = balancer.upstreams[0]
+    ejected.ejected_until = float("inf")
+    after = {key: balancer.pick(key) for key in before}
+
+    assert all(after[key] is before[key] for key in before if before[key] is not ejected)
+    assert ejected not in after.values()
+
+
+@pytest.mark.asyncio
+async def test_failing_host_is_ejected_and_active_check_restores_it():
+    def upstream(request):
+        if request.url.host == "a.test":
+            return Response(503 if request.url.path != "/health" else 200)
+        return Response(200, json={"host": request.url.host})
+
+    settings = ModSettings(
+        balancer=BalancerSettings(failure_threshold=2, health_check=HealthCheckSettings(path="/health", interval=60)),
+        circuit_breaker=None,
+    )
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url=HOSTS[:2], mod_settings=settings), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        responses = [await client.get("/api/item") for _ in range(10)]
+    a = factory.balancer.upstreams[0]
+
+    # The retries land on b.test, a.test is left alone once ejected
+    assert all(response.json() == {"host": "b.test"} for response in responses)
+    assert a.ejected_until > 0
+
+    a.healthy = False
+    await factory.balancer.check_health(factory.get_client())
+    assert a.healthy
+    await factory.shutdown()
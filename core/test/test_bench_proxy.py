@@ -0,0 +1,9 @@
+from core.bench.bench_proxy import SCENARIOS, run
+
+
+def test_every_scenario_runs():
+    results = run(list(SCENARIOS), total=5, concurrency=2, latency=0.0)
+
+    assert [result.scenario for result in results] == list(SCENARIOS)
+    for result in results:
+        assert result.rps > 0 and 0 < result.p50_ms <= result.p99_ms and result.rss_mb > 0
@@ -0,0 +1,285 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.logging.cache import configure_cache
+from core.logging.cache_backend import CacheEntry, make_cache_key
+from core.logging.cache_control import cache_lifetime
+from core.logging.disk_cache import DiskCache
+from core.logging.memory_cache import MemoryCache
+from core.logging.redis_cache import RedisCache, encode_command, read_reply
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+def entry(body: bytes) -> CacheEntry:
+    return CacheEntry(body=body, expires_at=time.time() + 60)
+
+
+class RedisStandIn:
+    """Speaks enough of the Redis protocol for RedisCache: GET, SET with PX, DEL and SCAN."""
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float]] = {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self.run(*command))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    def run(self, name, *args):
+        name = name.upper()
+        if name == b"SET":
+            key, value, _, ttl = args
+            self.data[key] = (value, time.time() + int(ttl) / 1000)
+            return b"+OK\r\n"
+        if name == b"GET":
+            value, expires = self.data.get(args[0], (None, 0))
+            if value is None or time.time() >= expires:
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"DEL":
+            removed = sum(self.data.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % removed
+        if name == b"SCAN":
+            prefix = args[2].rstrip(b"*")
+            keys = [key for key in self.data if key.startswith(prefix)]
+            return b"*2\r\n$1\r\n0\r\n" + encode_command(*keys)
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_and_limits():
+    cache = MemoryCache(max_entries=2, max_bytes=1024)
+    await cache.set("a", entry(b"1"), ttl=60)
+    await cache.set("b", entry(b"2"), ttl=60)
+    assert (await cache.get("a")).body == b"1"
+    # "b" is now least recently used and gets evicted
+    await cache.set("c", entry(b"3"), ttl=60)
+    assert await cache.get("b") is None
+    assert (await cache.get("c")).body == b"3"
+
+    await cache.set("big", entry(b"x" * 1000), ttl=60)
+    assert cache.size <= 1024
+    await cache.set("expired", entry(b"old"), ttl=0)
+    assert await cache.get("expired") is None
+
+    stats = cache.stats.as_dict()
+    assert stats["evictions"] >= 2
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    await cache.set("k" * 64, entry(b"body"), ttl=60)
+    assert (await DiskCache(str(tmp_path)).get("k" * 64)).body == b"body"
+    await cache.set("e" * 64, entry(b"body"), ttl=0)
+    assert await cache.get("e" * 64) is None
+    await cache.clear()
+    assert await cache.get("k" * 64) is None
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_is_bounded(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    for key in ("aa1", "bb2"):
+        await cache.set(key, entry(b"1"), ttl=60)
+    assert (await cache.get("aa1")).body == b"1"
+    # "bb2" is least recently used, its file goes
+    await cache.set("cc3", entry(b"3"), ttl=60)
+    assert not (tmp_path / "bb" / "bb2").exists() and await cache.get("bb2") is None
+
+    # The index survives a restart, in the order the files were written
+    restarted = DiskCache(str(tmp_path), max_entries=2, max_bytes=cache.size)
+    assert len(restarted) == 2 and restarted.size == cache.size
+    await restarted.set("dd4", entry(b"4"), ttl=0)
+    assert len(restarted) == 2 and restarted.stats.evictions == 1
+
+    # Expired files nobody reads again are swept
+    monkeypatch.setattr("core.logging.disk_cache.SWEEP_INTERVAL", 0.0)
+    await cache.set("ee5", entry(b"5"), ttl=0)
+    await cache.set("ff6", entry(b"6"), ttl=60)
+    assert not (tmp_path / "ee" / "ee5").exists()
+    assert cache.stats.evictions >= 1 and cache.stats.expirations >= 1
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_against_stand_in():
+    stand_in = RedisStandIn()
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    cache = RedisCache(f"redis://127.0.0.1:{port}/0")
+
+    await cache.set("key", entry(b"body"), ttl=60)
+    assert (await cache.get("key")).body == b"body"
+    await cache.delete("key")
+    assert await cache.get("key") is None
+    await cache.set("other", entry(b"body"), ttl=60)
+    await cache.clear()
+    assert stand_in.data == {}
+    assert cache.stats.as_dict()["hits"] == 1
+
+    await cache.close()
+    server.close()
+    await server.wait_closed()
+
+
+def test_cache_key_selects_headers():
+    first = make_cache_key("GET", "https://a.test/x", {"b": "2", "a": "1"}, {"accept": "json", "cookie": "1"}, ["accept"])
+    second = make_cache_key("GET", "https://a.test/x", {"a": "1", "b": "2"}, {"accept": "json", "cookie": "2"}, ["accept"])
+    other_accept = make_cache_key("GET", "https://a.test/x", {"a": "1", "b": "2"}, {"accept": "xml"}, ["accept"])
+    assert first == second
+    assert first != other_accept
+
+
+@pytest.mark.asyncio
+async def test_cached_route_hits_upstream_once():
+    calls = []
+
+    def upstream(request):
+        calls.append(request.url)
+        return Response(200, json=[{"id": len(calls)}])
+
+    cache = configure_cache({"enable_cache": True, "backend": "memory"})
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET", cache={"ttl": 60}))
+    factory.create_router(ProxyRouteDefinition(route="/fresh", url_route="/fresh", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        first = await client.get("/api/todos", params={"page": 1})
+        second = await client.get("/api/todos", params={"page": 1})
+        await client.get("/api/todos", params={"page": 2})
+        await client.get("/api/fresh")
+        await client.get("/api/fresh")
+
+    assert first.content == second.content
+    assert len(calls) == 4
+    assert cache.stats.hits == 1
+    configure_cache(None)
+
+
+class VersionedUpstream:
+    """Serves the current version with an ETag and answers matching conditional requests with a 304."""
+
+    def __init__(self, cache_control: str):
+        self.cache_control = cache_control
+        self.version = 1
+        self.conditional_calls = 0
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        etag = f'"v{self.version}"'
+        if request.headers.get("if-none-match") == etag:
+            self.conditional_calls += 1
+            return Response(304, headers={"etag": etag, "cache-control": self.cache_control})
+        return Response(200, json=[{"version": self.version}], headers={"etag": etag, "cache-control": self.cache_control})
+
+
+def served_version(response) -> int:
+    return response.json()[0]["version"]
+
+
+def versioned_app(upstream: VersionedUpstream, **cache) -> tuple[FastAPI, RouteFactory]:
+    configure_cache({"enable_cache": True, "backend": "memory"})
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET", cache=cache))
+    app = FastAPI()
+    app.include_router(factory.router)
+    return app, factory
+
+
+def test_lifetime_follows_the_upstream_headers():
+    date = "Sun, 18 Oct 2026 10:00:00 GMT"
+    assert cache_lifetime({"cache-control": "s-maxage=30, max-age=10, stale-while-revalidate=5"}, 60, 0) == (30, 5)
+    # max-age wins over Expires, which counts from the upstream's Date
+    assert cache_lifetime({"cache-control": "max-age=10", "expires": "Sun, 18 Oct 2026 10:05:00 GMT", "date": date}, 60, 0) == (10, 0)
+    assert cache_lifetime({"expires": "Sun, 18 Oct 2026 10:05:00 GMT", "date": date}, 60, 0) == (300, 0)
+    assert cache_lifetime({"expires": "0"}, 60, 0) == (0, 0)
+    assert cache_lifetime({"cache-control": "must-revalidate"}, 60, 20) == (60, 0)
+    assert cache_lifetime({}, 60, 20) == (60, 20)
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_revalidated_with_validators():
+    upstream = VersionedUpstream("max-age=0")
+    app, _ = versioned_app(upstream)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        first = await client.get("/api/todos")
+        second = await client.get("/api/todos")
+        not_modified = await client.get("/api/todos", headers={"If-None-Match": '"v1"'})
+
+    assert first.content == second.content
+    assert upstream.conditional_calls == 2
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == '"v1"'
+    configure_cache(None)
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_serves_stale_then_refreshes():
+    upstream = VersionedUpstream("max-age=0, stale-while-revalidate=30")
+    app, factory = versioned_app(upstream)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        await client.get("/api/todos")
+        upstream.version = 2
+        stale = await client.get("/api/todos")
+        await asyncio.gather(*factory._background_tasks)
+        refreshed = await client.get("/api/todos")
+
+    assert served_version(stale) == 1
+    assert served_version(refreshed) == 2
+    configure_cache(None)
+
+
+@pytest.mark.asyncio
+async def test_no_store_is_not_cached():
+    upstream = VersionedUpstream("no-store")
+    app, _ = versioned_app(upstream, ttl=60)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        await client.get("/api/todos")
+        await client.get("/api/todos")
+
+    assert upstream.calls == 2
+    assert upstream.conditional_calls == 0
+    configure_cache(None)
+
+
+@pytest.mark.asyncio
+async def test_cookies_and_private_responses_are_not_shared():
+    def upstream(request):
+        cache_control = "private, max-age=60" if request.url.path.endswith("/private") else "max-age=60"
+        return Response(200, json={"path": request.url.path}, headers={"cache-control": cache_control, "set-cookie": "session=first"})
+
+    cache = configure_cache({"enable_cache": True, "backend": "memory"})
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET", cache={"ttl": 60}))
+    factory.create_router(ProxyRouteDefinition(route="/private", url_route="/private", method="GET", cache={"ttl": 60}))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        first = await client.get("/api/todos")
+        second = await client.get("/api/todos")
+        await client.get("/api/private")
+        await client.get("/api/private")
+
+    # The client that caused the upstream call gets its cookie, the hit doesn't
+    assert first.headers["set-cookie"] == "session=first" and "set-cookie" not in second.headers
+    assert first.json() == second.json() == {"path": "/todos"}
+    assert cache.stats.stores == 1 and cache.stats.hits == 1
+    configure_cache(None)
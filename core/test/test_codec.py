@@ -0,0 +1,37 @@
+import pytest
+
+from core.shared import codec
+from core.shared.codec import ParsedBody
+
+
+@pytest.fixture(params=list(codec.BACKENDS))
+def backend(request):
+    previous = codec.backend
+    codec.use_backend(request.param)
+    yield request.param
+    codec.use_backend(previous)
+
+
+def test_backends_round_trip(backend):
+    data = {"id": 1, "title": "ünïcode", "nested": [1.5, None, True]}
+    assert codec.loads(codec.dumps(data)) == data
+    with pytest.raises(codec.DecodeError):
+        codec.loads(b"{not json")
+
+
+def test_parsed_body_is_decoded_and_encoded_once(backend):
+    raw = b'{"id":   1}'
+    body = ParsedBody(raw)
+    assert body.raw is raw
+    assert body.decoded is False
+
+    assert body.json() == {"id": 1}
+    # Only read, the original bytes go out
+    assert body.raw is raw
+
+    body.json()["id"] = 2
+    body.mark_dirty()
+    # Every reader shares the same decoded object
+    assert codec.loads(body) is body.json()
+    assert codec.loads(body.raw) == {"id": 2}
+    assert body.raw is body.raw
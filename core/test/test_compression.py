@@ -0,0 +1,107 @@
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.shared.compression import accepts_gzip, configure_compression
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+TODOS = json.dumps([{"id": i, "title": "delectus aut autem"} for i in range(200)]).encode()
+
+
+async def over_the_wire(body: bytes):
+    # An unread stream, like a real connection hands to httpx
+    yield body
+
+
+class GzipUpstream:
+    def __init__(self):
+        self.accept_encoding = []
+
+    def __call__(self, request):
+        self.accept_encoding.append(request.headers.get("accept-encoding"))
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return Response(200, content=over_the_wire(gzip.compress(TODOS)), headers={"content-type": "application/json", "content-encoding": "gzip"})
+        return Response(200, content=over_the_wire(TODOS), headers={"content-type": "application/json"})
+
+
+@pytest.fixture
+def compression():
+    configure_compression({"passthrough": True, "enable": True, "min_size": 512})
+    yield
+    configure_compression(None)
+
+
+def make_app(upstream, _out_callback=None) -> tuple[FastAPI, RouteFactory]:
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET"), _out_callback=_out_callback)
+    app = FastAPI()
+    app.include_router(factory.router)
+    return app, factory
+
+
+@pytest.mark.asyncio
+async def test_compressed_upstream_body_passes_through(compression):
+    upstream = GzipUpstream()
+    app, factory = make_app(upstream)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        async with client.stream("GET", "/api/todos", headers={"Accept-Encoding": "gzip"}) as response:
+            wire = b"".join([chunk async for chunk in response.aiter_raw()])
+        plain = await client.get("/api/todos", headers={"Accept-Encoding": "identity"})
+    await factory.shutdown()
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert wire == gzip.compress(TODOS)
+    assert plain.content == TODOS and "content-encoding" not in plain.headers
+    assert upstream.accept_encoding == ["gzip", "identity"]
+
+
+@pytest.mark.asyncio
+async def test_decoded_body_is_compressed_again(compression):
+    def tag(body):
+        body.json()[0]["seen"] = True
+        body.mark_dirty()
+
+    app, factory = make_app(GzipUpstream(), tag)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/todos", headers={"Accept-Encoding": "gzip"})
+        plain = await client.get("/api/todos", headers={"Accept-Encoding": "identity"})
+    await factory.shutdown()
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json()[0] == {"id": 0, "title": "delectus aut autem", "seen": True}
+    assert "content-encoding" not in plain.headers
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("br, gzip;q=0.8")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("gzip;q=0")
+    assert not accepts_gzip(None)
+    assert not accepts_gzip("gzip;q=abc")
+    # A bad entry doesn't hide a later acceptable one, and an explicit gzip wins over *
+    assert accepts_gzip("gzip;q=abc, *;q=0.5") is False
+    assert accepts_gzip("*;q=abc, gzip")
+    assert not accepts_gzip("*, gzip;q=0")
+
+
+@pytest.mark.asyncio
+async def test_malformed_accept_encoding_is_answered_uncompressed(compression):
+    def read(body):
+        body.json()
+
+    app, factory = make_app(GzipUpstream(), read)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/todos", headers={"Accept-Encoding": "gzip;q=abc"})
+    await factory.shutdown()
+
+    assert response.status_code == 200 and "content-encoding" not in response.headers
+    # Only read by the callback, the upstream bytes go out as they came
+    assert response.content == TODOS
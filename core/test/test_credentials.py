@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.authentication.credentials import ClientCredentials, StaticCredentials, basic_header, build_credentials
+from core.bench.upstream_stub import make_token_app
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import CredentialSettings, ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+CLIENT_AUTH = basic_header("sisyphus", "secret")
+
+
+def token_provider(token_app, refresh_margin: float = 30.0) -> ClientCredentials:
+    client = AsyncClient(transport=ASGITransport(app=token_app))
+    return ClientCredentials("http://auth.test/token", "sisyphus", "secret", refresh_margin=refresh_margin, client=client)
+
+
+@pytest.mark.asyncio
+async def test_static_credentials_are_encoded_once(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_KEY", "k-123")
+    api_key = build_credentials(CredentialSettings(type="api_key", token="env:UPSTREAM_KEY"))
+    assert (api_key.header, await api_key.value()) == ("x-api-key", "k-123")
+    basic = StaticCredentials.basic("user", "pass")
+    assert await basic.value() is await basic.value() == "Basic dXNlcjpwYXNz"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_token_fetch():
+    token_app = make_token_app(latency=0.05, client_auth=CLIENT_AUTH)
+    provider = token_provider(token_app)
+    values = await asyncio.gather(*(provider.value() for _ in range(20)))
+    assert set(values) == {"Bearer token-1"} and token_app.calls == 1
+    # Cached until it expires
+    assert await provider.value() == "Bearer token-1" and token_app.calls == 1
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_before_it_expires():
+    token_app = make_token_app(expires_in=0.2)
+    provider = token_provider(token_app, refresh_margin=0.05)
+    assert await provider.value() == "Bearer token-1"
+    # Refreshed in the background 0.05s before the first token expires, nobody waits on it
+    await asyncio.sleep(0.25)
+    assert token_app.calls == 2 and provider._value == "Bearer token-2"
+    assert await provider.value() == "Bearer token-2" and token_app.calls == 2
+    await provider.close()
+
+
+@pytest.mark.asyncio
+async def test_routes_send_the_token_and_refetch_it_after_a_401():
+    token_app = make_token_app()
+    seen = []
+
+    def upstream(request):
+        seen.append(request.headers["authorization"])
+        # token-1 was revoked upstream
+        return Response(401 if request.headers["authorization"] == "Bearer token-1" else 200, json={"ok": True})
+
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/api", target_url="http://upstream.test", credentials=token_provider(token_app)),
+        transport=MockTransport(upstream),
+    )
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        # The client's own Authorization never reaches the upstream
+        first = await client.get("/api/todos", headers={"Authorization": "Bearer client"})
+        second = await client.get("/api/todos")
+    await factory.shutdown()
+
+    assert (first.status_code, second.status_code) == (401, 200)
+    assert seen == ["Bearer token-1", "Bearer token-2"]
+
+
+@pytest.mark.asyncio
+async def test_mod_settings_credentials_fetch_a_token(monkeypatch):
+    monkeypatch.setenv("TOKEN_SECRET", "secret")
+    issued = []
+
+    def transport(request):
+        if request.url.host == "auth.test":
+            issued.append(request.headers["authorization"])
+            return Response(200, json={"access_token": "from-settings", "expires_in": 60})
+        return Response(200, json={"authorization": request.headers["authorization"]})
+
+    mod_settings = ModSettings(credentials={
+        "type": "client_credentials", "token_url": "https://auth.test/token", "client_id": "sisyphus", "client_secret": "env:TOKEN_SECRET",
+    })
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/api", target_url="http://upstream.test", mod_settings=mod_settings), transport=MockTransport(transport)
+    )
+    factory.create_router(ProxyRouteDefinition(route="/todos", url_route="/todos", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/todos")
+    await factory.shutdown()
+
+    assert response.status_code == 200 and response.json() == {"authorization": "Bearer from-settings"}
+    assert issued == [CLIENT_AUTH]
+
+
+@pytest.mark.asyncio
+async def test_json_api_bodies_keep_the_credentials_and_route_headers():
+    seen = []
+
+    def upstream(request):
+        seen.append((request.headers, request.url.params, request.content))
+        return Response(201, json={"data": {"id": "1"}})
+
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/api", target_url="http://upstream.test", credentials=StaticCredentials.bearer("upstream-token")),
+        transport=MockTransport(upstream),
+    )
+    factory.create_router(ProxyRouteDefinition(
+        route="/todos", url_route="/todos", method="POST",
+        headers={"Content-Type": "application/vnd.api+json", "X-Tenant": "acme"}, query_params={"include": "author"},
+        data={"meta": {"source": "sisyphus"}},
+    ))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.post("/api/todos", json={"data": {"type": "todos"}}, headers={"Content-Type": "application/vnd.api+json"})
+    await factory.shutdown()
+
+    headers, params, content = seen[0]
+    assert response.status_code == 201
+    assert headers["authorization"] == "Bearer upstream-token" and headers["x-tenant"] == "acme"
+    assert headers["content-type"] == "application/vnd.api+json" and params["include"] == "author"
+    assert content == b'{"data":{"type":"todos"},"meta":{"source":"sisyphus"}}'
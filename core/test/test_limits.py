@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.middleware.auth import limit_key
+from core.middleware.concurrency import ConcurrencyLimiter, Overloaded
+from core.middleware.limits import LimitsConfig, LimitsMiddleware
+from core.middleware.rate_limit import MemoryRateLimitStore, RateLimiter
+from core.shared.proxy_definition import (
+    BalancerSettings,
+    ConcurrencySettings,
+    ModSettings,
+    ProxyDefinition,
+    ProxyRouteDefinition,
+    RateLimitSettings,
+)
+
+
+def slow_upstream(started: list, release: asyncio.Event):
+    async def upstream(request):
+        started.append(request)
+        await release.wait()
+        return Response(200, json={"ok": True})
+    return upstream
+
+
+def make_app(upstream, route: ProxyRouteDefinition, **mod_settings) -> tuple[FastAPI, RouteFactory]:
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/api", target_url="http://upstream.test", mod_settings=ModSettings(**mod_settings)),
+        transport=MockTransport(upstream),
+    )
+    factory.create_router(route)
+    app = FastAPI()
+    app.include_router(factory.router)
+    return app, factory
+
+
+def test_limit_keys():
+    scope = {"client": ("10.0.0.7", 5000), "headers": [(b"x-forwarded-for", b"1.2.3.4, 10.0.0.1")]}
+    assert limit_key(scope, "ip") == "ip:10.0.0.7"
+    assert limit_key(scope, "ip", trust_forwarded=True) == "ip:1.2.3.4"
+    assert limit_key(scope, "identity") == "ip:10.0.0.7"
+    assert limit_key(scope, "route") == "route"
+
+    a = limit_key({**scope, "headers": [(b"authorization", b"Bearer a")]}, "identity")
+    b = limit_key({**scope, "headers": [(b"authorization", b"Bearer b")]}, "identity")
+    assert a.startswith("id:") and a != b and "Bearer" not in a
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_allows_burst_then_refills():
+    limiter = RateLimiter("test", RateLimitSettings(rate=100, burst=3), MemoryRateLimitStore())
+    assert [await limiter.check("ip:a") for _ in range(3)] == [0, 0, 0]
+    assert 0 < await limiter.check("ip:a") <= 0.01
+    # Buckets are per key
+    assert await limiter.check("ip:b") == 0
+    await asyncio.sleep(0.02)
+    assert await limiter.check("ip:a") == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_queues_then_sheds():
+    limiter = ConcurrencyLimiter("test", ConcurrencySettings(max_concurrent=1, max_queue=1, queue_timeout=0.05))
+    await limiter.acquire()
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    # The queue is full: shed at once
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    limiter.release()
+    await queued
+    # The queued call got the slot, the next one times out of the queue
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    limiter.release()
+
+
+@pytest.mark.asyncio
+async def test_route_rate_limit_answers_429():
+    app, factory = make_app(
+        lambda request: Response(200, json={"ok": True}),
+        ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", rate_limit=RateLimitSettings(rate=1, burst=2, key="identity")),
+    )
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        alice = [(await client.get("/api/item", headers={"Authorization": "alice"})).status_code for _ in range(3)]
+        bob = await client.get("/api/item", headers={"Authorization": "bob"})
+        limited = await client.get("/api/item", headers={"Authorization": "alice"})
+    await factory.shutdown()
+
+    assert alice == [200, 200, 429]
+    assert bob.status_code == 200
+    assert int(limited.headers["retry-after"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_route_and_upstream_concurrency_shed_with_503():
+    for settings in (
+        {"route": {"concurrency": ConcurrencySettings(max_concurrent=2)}, "mod": {}},
+        {"route": {}, "mod": {"balancer": BalancerSettings(upstream_concurrency=ConcurrencySettings(max_concurrent=2))}},
+    ):
+        started, release = [], asyncio.Event()
+        app, factory = make_app(
+            slow_upstream(started, release),
+            ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", **settings["route"]),
+            **settings["mod"]
+        )
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+            running = [asyncio.create_task(client.get("/api/item")) for _ in range(2)]
+            while len(started) < 2:
+                await asyncio.sleep(0.001)
+            shed = await client.get("/api/item")
+            release.set()
+            responses = await asyncio.gather(*running)
+        await factory.shutdown()
+
+        assert shed.status_code == 503 and shed.headers["retry-after"] == "1"
+        assert [response.status_code for response in responses] == [200, 200]
+        assert len(started) == 2
+
+
+@pytest.mark.asyncio
+async def test_global_limits_middleware():
+    app, factory = make_app(lambda request: Response(200, json={"ok": True}), ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+    app.add_middleware(LimitsMiddleware, config=LimitsConfig(rate_limit=RateLimitSettings(rate=1, burst=1)))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        first = await client.get("/api/item")
+        second = await client.get("/api/item")
+    await factory.shutdown()
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.json()["status"] == "failed"
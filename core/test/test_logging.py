@@ -0,0 +1,51 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+
+from core.logging.logging import LoggingConfig, configure_logging, custom_message, stop_logging
+from core.middleware.access_log import AccessLogMiddleware
+
+
+def read_lines(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.fixture
+def logfile(tmp_path):
+    path = tmp_path / "logs" / "sisyphus.log"
+    yield path
+    configure_logging(None)
+
+
+def test_messages_reach_the_logfile_as_json(logfile):
+    configure_logging({"logfile": str(logfile), "level": "info"})
+    custom_message("hello", "warning")
+    custom_message("hidden", "debug")
+    stop_logging()
+
+    [entry] = read_lines(logfile)
+    assert entry["message"] == "hello" and entry["level"] == "warning"
+    # Points at the caller, not at custom_message
+    assert entry["source"].startswith("test_logging.py:")
+
+
+@pytest.mark.asyncio
+async def test_access_log_samples_but_keeps_errors(logfile):
+    config = configure_logging(LoggingConfig(logfile=str(logfile), access_log=True, access_sample_rate=0.0))
+    app = FastAPI()
+    app.get("/ok")(lambda: {"ok": True})
+    app.get("/boom")(lambda: JSONResponse({"ok": False}, status_code=502))
+    app.add_middleware(AccessLogMiddleware, config=config)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        for _ in range(5):
+            await client.get("/ok")
+        await client.get("/boom")
+    stop_logging()
+
+    [entry] = read_lines(logfile)
+    assert entry["logger"] == "sisyphus.access"
+    assert entry["path"] == "/boom" and entry["status"] == 502 and entry["method"] == "GET"
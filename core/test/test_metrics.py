@@ -0,0 +1,99 @@
+import asyncio
+import re
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.bench.upstream_stub import UpstreamStub, make_upstream_app, route_to_stubs
+from core.factory.route_factory import RouteFactory
+from core.logging.cache import configure_cache
+from core.logging.metrics import Histogram, configure_metrics
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+def sample(text: str, name: str, **labels) -> float:
+    for line in text.splitlines():
+        series, _, value = line.rpartition(" ")
+        if series.split("{")[0] == name and all(f'{k}="{v}"' in series for k, v in labels.items()):
+            return float(value)
+    raise AssertionError(f"{name} {labels} not in metrics")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(value)
+    lines = []
+    histogram.render("h", 'route="x"', lines)
+    assert lines[:3] == ['h_bucket{route="x",le="0.1"} 1', 'h_bucket{route="x",le="1.0"} 3', 'h_bucket{route="x",le="+Inf"} 4']
+    assert lines[-1] == 'h_count{route="x"} 4'
+
+
+@pytest.mark.asyncio
+async def test_route_metrics_break_down_the_request():
+    registry = configure_metrics({"enable": True})
+    configure_cache({"enable_cache": True, "backend": "memory"})
+    with UpstreamStub(make_upstream_app()) as stub:
+        factory = route_to_stubs(RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test")), {"upstream.test": stub.port})
+        factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", cache={"ttl": 60}))
+        factory.create_router(ProxyRouteDefinition(route="/fresh", url_route="/todos", method="GET"))
+        app = FastAPI()
+        app.include_router(factory.router)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+            for _ in range(3):
+                await client.get("/api/item")
+            await client.get("/api/fresh", headers={"Accept-Encoding": "identity"})
+            text = registry.render()
+        await factory.shutdown()
+    configure_metrics(None)
+    configure_cache(None)
+
+    item = {"mod": "/api", "route": "GET /item"}
+    assert sample(text, "sisyphus_requests_total", status="200", **item) == 3
+    assert sample(text, "sisyphus_request_duration_seconds_count", **item) == 3
+    assert sample(text, "sisyphus_cache_requests_total", result="miss", **item) == 1
+    assert sample(text, "sisyphus_cache_requests_total", result="hit", **item) == 2
+    assert sample(text, "sisyphus_cache_backend_total", event="stores") == 1
+    assert sample(text, "sisyphus_response_bytes_total", **item) > 0
+    # Only the miss went upstream, over one new connection
+    assert sample(text, "sisyphus_stage_duration_seconds_count", stage="ttfb", **item) == 1
+    assert sample(text, "sisyphus_stage_duration_seconds_count", stage="body", **item) == 1
+    assert sample(text, "sisyphus_stage_duration_seconds_count", stage="connect", **item) == 1
+    # The second route reused the pooled connection
+    assert 'route="GET /fresh",stage="connect"' not in text
+    assert sample(text, "sisyphus_stage_duration_seconds_count", stage="queue", route="GET /fresh") == 1
+    assert sample(text, "sisyphus_upstream_requests_in_flight", mod="/api") == 0
+    assert sample(text, "sisyphus_upstream_pool_limit", mod="/api") == 100
+    assert re.search(r'sisyphus_upstream_outstanding\{mod="/api",upstream="http://upstream.test"\} 0', text)
+
+
+@pytest.mark.asyncio
+async def test_in_flight_gauge_counts_the_upstream_calls():
+    registry = configure_metrics({"enable": True})
+    release = asyncio.Event()
+
+    async def upstream(request):
+        await release.wait()
+        return Response(200, json={})
+
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/pool", target_url="http://upstream.test", mod_settings={"max_connections": 2}), transport=MockTransport(upstream)
+    )
+    factory.create_router(ProxyRouteDefinition(route="/slow", url_route="/slow", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        calls = [asyncio.create_task(client.get("/pool/slow")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        text = registry.render()
+        release.set()
+        await asyncio.gather(*calls)
+    await factory.shutdown()
+    configure_metrics(None)
+
+    assert sample(text, "sisyphus_upstream_requests_in_flight", mod="/pool") == 3
+    assert sample(text, "sisyphus_upstream_pool_limit", mod="/pool") == 2
+    assert factory.in_flight == 0
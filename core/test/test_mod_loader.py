@@ -0,0 +1,198 @@
+import asyncio
+import sys
+
+import pytest
+from fastapi import FastAPI
+from functools import partial
+
+from httpx import ASGITransport, AsyncClient
+
+from core.bench.upstream_stub import make_upstream_app
+from core.factory.mod_admin import AdminConfig, admin_router
+from core.factory.mod_loader import ModLoader, ModsConfig
+from core.factory import register_mod
+from core.factory.register_mod import mod_registry
+from core.factory.route_factory import RouteFactory
+
+MOD_SOURCE = '''
+from core.factory.register_mod import register_mod
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+class LazyTestMod:
+    def __init__(self, sisyphus):
+        self.register_mod = register_mod("lazy_test", {
+            "ProxyDefinition": ProxyDefinition(endpoint="/lazy", target_url="http://upstream.test"),
+            "mod_name": "Lazy", "mod_id": "lazy_test", "mod_description": "",
+        })
+        self.register_mod.Factory.create_router(ProxyRouteDefinition(route="%s", url_route="/todos", method="GET"))
+        sisyphus.register(self.register_mod.Factory.router)
+'''
+
+
+class Host:
+    # The part of Sisyphus the loader uses
+    def __init__(self):
+        self.app = FastAPI()
+
+
+def write_mod(tmp_path, endpoint: str | None = "/lazy", route: str = "/item"):
+    mod_dir = tmp_path / "lazy_mods" / "lazy_test"
+    mod_dir.mkdir(parents=True, exist_ok=True)
+    (tmp_path / "lazy_mods" / "__init__.py").write_text("")
+    (mod_dir / "__init__.py").write_text("")
+    (mod_dir / "lazy_test.py").write_text(MOD_SOURCE % route)
+    manifest = '[mod]\nmod_id = "lazy_test"\nentry = "lazy_mods.lazy_test.lazy_test:LazyTestMod"\n'
+    if endpoint:
+        manifest += f'endpoint = "{endpoint}"\n'
+    (mod_dir / "lazy_test.toml").write_text(manifest)
+    return tmp_path / "lazy_mods"
+
+
+@pytest.fixture
+def cleanup():
+    yield
+    for name in [name for name in sys.modules if name.startswith("lazy_mods")]:
+        del sys.modules[name]
+    mod_registry.pop("lazy_test", None)
+
+
+def use_upstream(monkeypatch, app) -> None:
+    # Every version of the mod shares the transport, so a reload can adopt the pool
+    monkeypatch.setattr(register_mod, "RouteFactory", partial(RouteFactory, transport=ASGITransport(app=app)))
+
+
+@pytest.mark.asyncio
+async def test_lazy_mod_is_built_on_its_first_request(tmp_path, monkeypatch, cleanup):
+    use_upstream(monkeypatch, make_upstream_app())
+    path = write_mod(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path)))
+    loader.discover()
+    loader.register()
+    assert "lazy_mods.lazy_test.lazy_test" not in sys.modules
+    assert loader.routes["lazy_test"].version is None
+
+    async with AsyncClient(transport=ASGITransport(app=host.app), base_url="http://sisyphus") as client:
+        first, second = await asyncio.gather(client.get("/lazy/item"), client.get("/lazy/item"))
+        missing = await client.get("/lazy/nothing")
+    await mod_registry["lazy_test"].Factory.shutdown()
+
+    assert first.status_code == second.status_code == 200 and first.json()["id"] == 1
+    assert missing.status_code == 404
+    # Built once
+    assert list(loader.mods) == ["lazy_test"]
+    assert loader.routes["lazy_test"].version is not None
+
+
+@pytest.mark.asyncio
+async def test_lazy_mod_under_a_mount(tmp_path, monkeypatch, cleanup):
+    use_upstream(monkeypatch, make_upstream_app())
+    path = write_mod(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path)))
+    loader.discover()
+    loader.register()
+    outer = FastAPI()
+    outer.mount("/edge", host.app)
+
+    async with AsyncClient(transport=ASGITransport(app=outer), base_url="http://sisyphus") as client:
+        response = await client.get("/edge/lazy/item")
+    await mod_registry["lazy_test"].Factory.shutdown()
+
+    assert response.status_code == 200 and response.json()["id"] == 1
+    assert loader.routes["lazy_test"].version is not None
+
+
+def test_mods_without_an_endpoint_are_built_at_startup(tmp_path, monkeypatch, cleanup):
+    path = write_mod(tmp_path, endpoint=None)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path)))
+    loader.discover()
+    loader.register()
+    assert "lazy_test" in loader.mods
+    assert "lazy_mods.lazy_test.lazy_test" in sys.modules
+    assert len(loader.routes["lazy_test"].version.routes) == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_swaps_routes_and_keeps_the_pool(tmp_path, monkeypatch, cleanup):
+    use_upstream(monkeypatch, make_upstream_app(latency=0.3))
+    path = write_mod(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path), lazy=False))
+    loader.discover()
+    loader.register()
+    old_factory = mod_registry["lazy_test"].Factory
+
+    async with AsyncClient(transport=ASGITransport(app=host.app), base_url="http://sisyphus") as client:
+        in_flight = asyncio.create_task(client.get("/lazy/item"))
+        await asyncio.sleep(0.1)
+        client_before = old_factory.client
+        write_mod(tmp_path, route="/other")
+        await loader.reload("lazy_test")
+        new_factory = mod_registry["lazy_test"].Factory
+        after = await client.get("/lazy/other")
+        gone = await client.get("/lazy/item")
+        # Routed before the swap, finishes on the old version
+        assert (await in_flight).status_code == 200
+    await loader.close()
+    # The old version is shut down, its pool lives on in the new one
+    assert new_factory is not old_factory and new_factory.client is client_before
+    assert not client_before.is_closed
+    await new_factory.shutdown()
+
+    assert after.status_code == 200 and gone.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_failed_reloads_keep_the_previous_version(tmp_path, monkeypatch, cleanup):
+    path = write_mod(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path), lazy=False, watch_interval=0.05))
+    host.app.include_router(admin_router(loader, AdminConfig(enable=True, token="secret")))
+    loader.discover()
+    loader.register()
+    running = loader.routes["lazy_test"].version
+    manifest = path / "lazy_test" / "lazy_test.toml"
+
+    # An invalid [[routes]] table in the TOML
+    manifest.write_text(manifest.read_text() + '[[routes]]\nroute = "/x"\nurl_route = "/x"\nmethod = "FETCH"\n')
+    async with AsyncClient(transport=ASGITransport(app=host.app), base_url="http://sisyphus") as client:
+        failed = await client.post("/admin/mods/lazy_test/reload", headers={"Authorization": "Bearer secret"})
+    assert failed.status_code == 500 and "method must be one of" in failed.json()["detail"]
+
+    # A route the ProxyRouteDefinition validator exits on, picked up by the watcher
+    write_mod(tmp_path, route="no-slash")
+    loader.start_watching()
+    await asyncio.sleep(0.3)
+    assert not loader._watcher.done()
+    await loader.close()
+    assert loader.routes["lazy_test"].version is running
+    await running.registered.Factory.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoints_need_the_token(tmp_path, monkeypatch, cleanup):
+    path = write_mod(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    host = Host()
+    loader = ModLoader(host, ModsConfig(path=str(path)))
+    host.app.include_router(admin_router(loader, AdminConfig(enable=True, token="secret")))
+    loader.discover()
+    loader.register()
+
+    async with AsyncClient(transport=ASGITransport(app=host.app), base_url="http://sisyphus") as client:
+        denied = await client.post("/admin/mods/lazy_test/unload", headers={"Authorization": "Bearer nope"})
+        listed = await client.get("/admin/mods", headers={"Authorization": "Bearer secret"})
+        unloaded = await client.post("/admin/mods/lazy_test/unload", headers={"Authorization": "Bearer secret"})
+        missing = await client.get("/lazy/item")
+
+    assert denied.status_code == 401
+    assert listed.json() == {"mods": [{"mod_id": "lazy_test", "endpoint": "/lazy", "loaded": False}]}
+    assert unloaded.status_code == 200 and missing.status_code == 404
+    assert "lazy_test" not in loader.routes
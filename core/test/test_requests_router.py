@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from core.bench.upstream_stub import route_to_stubs
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+UPSTREAM_DELAY = 0.5
+CONCURRENT_CALLS = 100
+
+
+class SlowUpstreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(UPSTREAM_DELAY)
+        body = b'[{"id": 1}]'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowUpstreamHandler)
+    server.request_queue_size = CONCURRENT_CALLS
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_requests_router_calls_overlap(slow_upstream):
+    """100 slow upstream calls through the requests path overlap instead of running one after another"""
+    proxy_def = ProxyDefinition(
+        endpoint="/api",
+        target_url="http://upstream.test",
+        mod_settings=ModSettings(requests_max_workers=CONCURRENT_CALLS)
+    )
+    factory = route_to_stubs(RouteFactory(proxy_def), {"upstream.test": slow_upstream})
+    factory.create_requests_router(ProxyRouteDefinition(route="/slow", url_route="/slow", method="GET"))
+    factory.create_requests_router_param(
+        ProxyRouteDefinition(route="/slow/{id}", url_route="/slow/{id}", params={"id": "1"}, method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    # Measures how long the event loop goes without getting a turn while the calls are in flight
+    longest_stall = 0.0
+    stop = asyncio.Event()
+
+    async def ticker():
+        nonlocal longest_stall
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            longest_stall = max(longest_stall, now - last)
+            last = now
+
+    ticker_task = asyncio.create_task(ticker())
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus", timeout=30) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.get("/api/slow" if i % 2 else f"/api/slow/{i}") for i in range(CONCURRENT_CALLS)
+        ))
+        elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+    await factory.shutdown()
+
+    assert all(response.status_code == 200 for response in responses)
+    # Run back to back these would take CONCURRENT_CALLS * UPSTREAM_DELAY = 50s
+    assert elapsed < UPSTREAM_DELAY * 10
+    assert longest_stall < UPSTREAM_DELAY
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from core.bench.upstream_stub import UpstreamStub, make_upstream_app, route_to_stubs
+from core.factory.resilience import CircuitBreaker, CircuitOpenError, RetryBudget
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import (
+    CircuitBreakerSettings,
+    HedgeSettings,
+    ModSettings,
+    ProxyDefinition,
+    ProxyRouteDefinition,
+    RetrySettings,
+    TimeoutSettings,
+)
+
+FAST_RETRIES = RetrySettings(max_retries=2, backoff=0.001, max_backoff=0.005)
+
+
+async def call_route(upstream, route: ProxyRouteDefinition, total: int = 1, **mod_settings):
+    with UpstreamStub(upstream) as stub:
+        factory = route_to_stubs(RouteFactory(ProxyDefinition(
+            endpoint="/api", target_url="http://upstream.test", mod_settings=ModSettings(**mod_settings)
+        )), {"upstream.test": stub.port})
+        factory.create_router(route)
+        app = FastAPI()
+        app.include_router(factory.router)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+            responses = [await client.request(route.method, "/api/item") for _ in range(total)]
+        await factory.shutdown()
+    return responses
+
+
+@pytest.mark.asyncio
+async def test_errors_and_timeouts_are_retried():
+    upstream = make_upstream_app(faults=[(0.0, 503), (0.5, 200)])
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", timeouts=TimeoutSettings(read=0.2))
+
+    [response] = await call_route(upstream, route, retries=FAST_RETRIES)
+
+    assert response.status_code == 200
+    assert upstream.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_post_is_not_retried():
+    upstream = make_upstream_app(faults=[(0.0, 503)])
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="POST", data={"title": "x"})
+
+    [response] = await call_route(upstream, route, retries=FAST_RETRIES)
+
+    assert response.status_code == 503
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_read_timeout_is_a_gateway_timeout():
+    upstream = make_upstream_app(latency=0.3)
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", retries=RetrySettings(max_retries=0))
+
+    # global_timeout is in milliseconds
+    [response] = await call_route(upstream, route, global_timeout=100)
+
+    assert response.status_code == 504
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_beats_slow_first_call():
+    upstream = make_upstream_app(faults=[(1.0, 200)])
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", hedge=HedgeSettings(delay=0.05))
+
+    [response] = await call_route(upstream, route)
+
+    assert response.status_code == 200
+    assert response.elapsed.total_seconds() < 0.9
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast():
+    upstream = make_upstream_app(faults=[(0.0, 503)] * 3)
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", retries=RetrySettings(max_retries=0))
+
+    responses = await call_route(
+        upstream, route, total=4, circuit_breaker=CircuitBreakerSettings(failure_threshold=2, reset_timeout=30)
+    )
+
+    assert [r.status_code for r in responses] == [503, 503, 503, 503]
+    # The last two never reached the upstream
+    assert upstream.calls == 2
+    assert "retry-after" in responses[-1].headers
+
+
+def test_circuit_breaker_half_open_probe():
+    breaker = CircuitBreaker("http://upstream.test", CircuitBreakerSettings(failure_threshold=1, reset_timeout=0.01))
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.02)
+    breaker.before_call()
+    # Only one probe at a time while half open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+
+
+def test_retry_budget_caps_retries():
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0)
+    budget.tokens = 0
+    for _ in range(4):
+        budget.deposit()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_failing_post_opens_the_circuit():
+    upstream = make_upstream_app(faults=[(0.0, 503)] * 3)
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="POST", data={"title": "x"})
+
+    # POST is never retried, its 503s still count against the upstream
+    responses = await call_route(
+        upstream, route, total=3, retries=FAST_RETRIES, circuit_breaker=CircuitBreakerSettings(failure_threshold=2, reset_timeout=30)
+    )
+
+    assert [r.status_code for r in responses] == [503, 503, 503]
+    assert upstream.calls == 2
+    assert "retry-after" in responses[-1].headers
@@ -0,0 +1,74 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, ConnectError, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+def upstream(request):
+    return Response(
+        404,
+        content=b'{"detail":"missing"}',
+        headers={"content-type": "application/problem+json", "cache-control": "no-cache", "connection": "keep-alive, x-hop", "x-hop": "1"},
+    )
+
+
+def make_app(_out_callback=None) -> tuple[FastAPI, RouteFactory]:
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"), _out_callback=_out_callback)
+    app = FastAPI()
+    app.include_router(factory.router)
+    return app, factory
+
+
+@pytest.mark.asyncio
+async def test_upstream_status_headers_and_body_pass_through():
+    app, factory = make_app()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/item")
+    await factory.shutdown()
+
+    assert response.status_code == 404
+    assert response.content == b'{"detail":"missing"}'
+    assert response.headers["content-type"] == "application/problem+json"
+    assert response.headers["cache-control"] == "no-cache"
+    # Hop-by-hop headers, including the ones named in Connection, stay between Sisyphus and the upstream
+    assert "x-hop" not in response.headers
+    assert response.headers.get("connection") != "keep-alive, x-hop"
+
+
+@pytest.mark.asyncio
+async def test_out_callback_overrides_status_headers_and_body():
+    def callback(body):
+        body.json()["detail"] = "rewritten"
+        body.mark_dirty()
+        body.status_code = 200
+        body.headers["x-sisyphus"] = "1"
+
+    app, factory = make_app(callback)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/item")
+    await factory.shutdown()
+
+    assert response.status_code == 200
+    assert response.json() == {"detail": "rewritten"}
+    assert response.headers["x-sisyphus"] == "1"
+    assert response.headers["content-length"] == str(len(response.content))
+
+
+@pytest.mark.asyncio
+async def test_unreachable_upstream_is_a_bad_gateway():
+    def down(request):
+        raise ConnectError("refused", request=request)
+
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(down))
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+    app = FastAPI()
+    app.include_router(factory.router)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/item")
+    await factory.shutdown()
+
+    assert response.status_code == 502
+    assert response.json()["status"] == "failed"
@@ -0,0 +1,51 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.factory.route_plan import RoutePlan
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+def test_plan_resolves_route_once():
+    proxy = ProxyDefinition(endpoint="/api", target_url="http://upstream.test", header={"X-Internal"})
+    route = ProxyRouteDefinition(
+        route="/item/{id}", url_route="/todos/{id}", method="GET",
+        headers={"Accept": "application/json", "X-Internal": "secret"}, query_params={"limit": 10}
+    )
+    plan = RoutePlan.compile(proxy, route)
+
+    assert plan.path({"id": "7"}) == "/todos/7"
+    assert plan.url({"id": "7"}) == "http://upstream.test/todos/7"
+    headers = plan.build_headers([(b"accept", b"text/html"), (b"authorization", b"Bearer t"), (b"x-internal", b"x")])
+    # The route's own Accept wins, excluded headers never make it upstream
+    assert headers == {"Accept": "application/json", "authorization": "Bearer t"}
+    assert plan.build_params({"limit": "5", "q": "x"}) == {"limit": "5,10", "q": "x"}
+    with pytest.raises(AttributeError):
+        plan.method = "POST"
+
+
+@pytest.mark.asyncio
+async def test_route_uses_compiled_plan():
+    seen = []
+
+    def upstream(request):
+        seen.append(request)
+        return Response(200, json={"ok": True})
+
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_router_param(ProxyRouteDefinition(
+        route="/item/{id}", url_route="/todos/{id}", method="GET", params={"id": "id"}, query_params={"expand": "user"}
+    ))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/item/3", headers={"Authorization": "Bearer t", "Cookie": "a=b"})
+    await factory.shutdown()
+
+    assert response.status_code == 200
+    assert seen[0].url.path == "/todos/3"
+    assert seen[0].url.params["expand"] == "user"
+    assert seen[0].headers["authorization"] == "Bearer t"
+    assert "cookie" not in seen[0].headers
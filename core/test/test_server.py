@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from core import server
+from core.factory.route_factory import RouteFactory
+from core.server import ServerConfig, run_server
+from core.shared.proxy_definition import ProxyDefinition
+
+
+def test_worker_count_defaults_to_available_cpus():
+    assert ServerConfig(workers=3).worker_count() == 3
+    assert ServerConfig().worker_count() >= 1
+
+
+def test_run_server_needs_a_factory_for_several_workers(monkeypatch):
+    calls = []
+    monkeypatch.setattr(server.uvicorn, "run", lambda app, **kwargs: calls.append((app, kwargs)))
+
+    run_server("main:create_app", ServerConfig(workers=4, graceful_timeout=7), 8000)
+    app = FastAPI()
+    run_server(app, ServerConfig(workers=4), 8000)
+
+    assert calls[0][0] == "main:create_app"
+    assert calls[0][1]["factory"] and calls[0][1]["workers"] == 4 and calls[0][1]["timeout_graceful_shutdown"] == 7
+    # A pre-built app can't be copied into other processes
+    assert calls[1][0] is app and calls[1][1]["workers"] == 1 and not calls[1][1]["factory"]
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_background_work():
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"))
+    finished = []
+
+    async def revalidation(delay):
+        await asyncio.sleep(delay)
+        finished.append(delay)
+
+    for delay in (0.01, 5):
+        task = asyncio.ensure_future(revalidation(delay))
+        factory._background_tasks.add(task)
+        task.add_done_callback(factory._background_tasks.discard)
+
+    await factory.shutdown(drain_timeout=0.2)
+    # The quick one finished, the slow one was cancelled instead of holding up the shutdown
+    assert finished == [0.01]
+    assert not factory._background_tasks
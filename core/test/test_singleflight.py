@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncBaseTransport, AsyncClient, Request, Response
+
+from core.factory.route_factory import RouteFactory
+from core.factory.singleflight import SingleFlight
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+class SlowUpstream(AsyncBaseTransport):
+    def __init__(self):
+        self.calls = 0
+
+    async def handle_async_request(self, request: Request) -> Response:
+        self.calls += 1
+        await asyncio.sleep(0.2)
+        return Response(200, json=[{"path": request.url.path}])
+
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_keeps_call_for_other_waiters():
+    flight = SingleFlight()
+    started = 0
+
+    async def fetch():
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.1)
+        return "shared"
+
+    leader = asyncio.create_task(flight.do("key", fetch))
+    followers = [asyncio.create_task(flight.do("key", fetch)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    assert await asyncio.gather(*followers) == ["shared"] * 3
+    assert leader.cancelled()
+    assert started == 1
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_every_waiter_leaves():
+    flight = SingleFlight()
+    finished = False
+
+    async def fetch():
+        nonlocal finished
+        await asyncio.sleep(0.1)
+        finished = True
+
+    waiters = [asyncio.create_task(flight.do("key", fetch)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.sleep(0.15)
+
+    assert not finished
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_route_sends_one_upstream_call():
+    upstream = SlowUpstream()
+    factory = RouteFactory(ProxyDefinition(endpoint="/proxy/test", target_url="http://upstream.test"), transport=upstream)
+    factory.create_router_param(ProxyRouteDefinition(
+        route="/item/{id}", url_route="/todos/{id}", params={"id": "5"}, method="GET", coalesce=True))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        responses = await asyncio.gather(*(client.get("/proxy/test/item/5") for _ in range(50)))
+        assert upstream.calls == 1
+        # A different credential is a different request
+        await asyncio.gather(
+            client.get("/proxy/test/item/5", headers={"Authorization": "Bearer a"}),
+            client.get("/proxy/test/item/5", headers={"Authorization": "Bearer b"}),
+        )
+
+    assert {response.content for response in responses} == {responses[0].content}
+    assert upstream.calls == 3
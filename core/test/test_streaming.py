@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncBaseTransport, AsyncByteStream, AsyncClient, Request, Response
+
+from core.factory.route_factory import RouteFactory
+from core.scripts.stream import streaming_transform
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+CHUNK = b"x" * 64 * 1024
+CHUNK_COUNT = 64
+
+
+class CountingStream(AsyncByteStream):
+    def __init__(self):
+        self.sent = 0
+
+    async def __aiter__(self):
+        for _ in range(CHUNK_COUNT):
+            self.sent += 1
+            yield CHUNK
+
+
+class StreamingUpstream(AsyncBaseTransport):
+    def __init__(self):
+        self.stream = CountingStream()
+
+    async def handle_async_request(self, request: Request) -> Response:
+        return Response(206, headers={"content-type": "image/jpeg"}, stream=self.stream)
+
+
+async def call_app(app, upstream, path):
+    messages = []
+    received = asyncio.Event()
+
+    async def receive():
+        if received.is_set():
+            # The client stays connected until the response is done
+            await asyncio.Event().wait()
+        received.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append((message, upstream.stream.sent))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"sisyphus")], "client": ("test", 1), "server": ("sisyphus", 80),
+    }
+    await app(scope, receive, send)
+    return messages
+
+
+def build_app(_out_callback=None):
+    upstream = StreamingUpstream()
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=upstream)
+    factory.create_router(
+        ProxyRouteDefinition(route="/image", url_route="/image", method="GET", stream=True),
+        _out_callback=_out_callback
+    )
+    app = FastAPI()
+    app.include_router(factory.router)
+    return app, upstream
+
+
+@pytest.mark.asyncio
+async def test_stream_forwards_chunks_as_they_arrive():
+    """A stream=True route sends each upstream chunk on before reading the next one"""
+    messages = await call_app(*build_app(), "/api/image")
+    start = messages[0][0]
+    bodies = [(message, sent) for message, sent in messages if message["type"] == "http.response.body"]
+
+    assert start["status"] == 206
+    assert (b"content-type", b"image/jpeg") in start["headers"]
+    assert b"".join(message.get("body", b"") for message, _ in bodies) == CHUNK * CHUNK_COUNT
+    # The first chunk reached the client while the upstream still had the rest to send
+    assert bodies[0][1] < CHUNK_COUNT
+
+
+@pytest.mark.asyncio
+async def test_stream_runs_only_streaming_out_callbacks():
+    """Plain out callbacks are skipped on streamed routes, @streaming_transform ones run per chunk"""
+    messages = await call_app(*build_app(_out_callback=lambda body: b"replaced"), "/api/image")
+    body = b"".join(m.get("body", b"") for m, _ in messages if m["type"] == "http.response.body")
+    assert body == CHUNK * CHUNK_COUNT
+
+    @streaming_transform
+    def upper(chunk: bytes) -> bytes:
+        return chunk.upper()
+
+    messages = await call_app(*build_app(_out_callback=upper), "/api/image")
+    body = b"".join(m.get("body", b"") for m, _ in messages if m["type"] == "http.response.body")
+    assert body == CHUNK.upper() * CHUNK_COUNT
+
+
+class RecordingUpstream(AsyncBaseTransport):
+    def __init__(self):
+        self.requests = []
+
+    async def handle_async_request(self, request: Request) -> Response:
+        body = await request.aread()
+        self.requests.append((request, body))
+        return Response(200, json={"received": len(body)})
+
+
+@pytest.mark.asyncio
+async def test_upload_is_piped_through_unchanged():
+    """Routes without data or an in callback forward the incoming body bytes untouched"""
+    upstream = RecordingUpstream()
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=upstream)
+    factory.create_router(ProxyRouteDefinition(route="/upload", url_route="/upload", method="POST"))
+    factory.create_router(
+        ProxyRouteDefinition(route="/merged", url_route="/merged", method="POST", data={"userId": 1}))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        files = {"file": ("photo.jpg", CHUNK * 4, "image/jpeg")}
+        response = await client.post("/api/upload", files=files)
+        assert response.status_code == 200
+        await client.post("/api/merged", json={"title": "kept"})
+
+    forwarded, body = upstream.requests[0]
+    assert forwarded.headers["content-type"].startswith("multipart/form-data; boundary=")
+    assert int(forwarded.headers["content-length"]) == len(body)
+    assert CHUNK * 4 in body
+
+    # Declaring data still goes through the decode and merge path
+    _, merged = upstream.requests[1]
+    assert json.loads(merged) == {"title": "kept", "userId": 1}
+
+
+@pytest.mark.asyncio
+async def test_post_without_a_body_is_a_client_error():
+    upstream = RecordingUpstream()
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=upstream)
+    factory.create_router(ProxyRouteDefinition(route="/upload", url_route="/upload", method="POST"))
+    factory.create_requests_router(ProxyRouteDefinition(route="/legacy", url_route="/legacy", method="POST"))
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        piped = await client.post("/api/upload")
+        legacy = await client.post("/api/legacy")
+    await factory.shutdown()
+
+    assert piped.status_code == legacy.status_code == 400
+    assert piped.json() == {"error": "POST request requires a body", "status": "failed"}
+    assert upstream.requests == []
@@ -0,0 +1,76 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from core.factory.route_factory import RouteFactory
+from core.shared.proxy_definition import ProxyDefinition, ProxyRouteDefinition
+
+
+def make_factory() -> RouteFactory:
+    return RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"))
+
+
+def test_route_factory_does_not_import_numba():
+    """numba is only loaded once a route declares a transform"""
+    code = "import sys, core.factory.route_factory; sys.exit('numba' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_routes_without_transform_pass_body_through():
+    factory = make_factory()
+    factory.create_router(ProxyRouteDefinition(route="/item", url_route="/todos", method="GET"))
+    body = b'{"id":   1, "title": "untouched"}'
+
+    processed = factory._process_response_data(body)
+    assert processed.raw is body
+    assert processed.decoded is False
+    assert factory.uses_transforms is False
+
+
+@pytest.mark.asyncio
+async def test_declared_transform_runs_and_is_warmed_up():
+    factory = make_factory()
+    route = ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", response_transform="fast_json_process")
+    factory.create_router(route)
+    await factory.startup()
+
+    processed = factory._process_response_data(b'{"id": 2, "title": "x"}', route.response_transform)
+    assert json.loads(processed.raw) == {"id": 4.0, "title": "x"}
+    assert factory.uses_transforms is True
+    await factory.shutdown()
+
+
+def test_unknown_transform_is_rejected():
+    with pytest.raises(SystemExit):
+        ProxyRouteDefinition(route="/item", url_route="/todos", method="GET", response_transform="nope")
+
+
+def test_columnar_engine_transforms_record_lists():
+    from core.scripts.transform import transform_records
+
+    todos = [
+        {"userId": 1, "id": 1, "completed": False, "geo": {"lat": 1.5}},
+        {"userId": 2, "id": 2, "completed": True, "geo": {"lat": -2.0}},
+        {"userId": 3, "title": "no id"},
+    ]
+    transform_records(todos, {"userId": "fast_json_process", "geo.lat": "fast_json_process"})
+
+    assert [todo["userId"] for todo in todos] == [2, 4, 6]
+    assert isinstance(todos[0]["userId"], int)
+    assert [todo["geo"]["lat"] for todo in todos[:2]] == [3.0, -4.0]
+    assert [todo.get("id") for todo in todos] == [1, 2, None]
+    assert todos[1]["completed"] is True
+
+
+def test_route_column_transforms_reach_list_payloads():
+    factory = make_factory()
+    route = ProxyRouteDefinition(
+        route="/todos", url_route="/todos", method="GET", column_transforms={"userId": "fast_json_process"})
+    factory.create_router(route)
+
+    body = json.dumps([{"userId": 1, "id": 1}, {"userId": 5, "id": 2}]).encode()
+    processed = factory._process_response_data(body, route.column_transforms)
+    assert processed.json() == [{"userId": 2, "id": 1}, {"userId": 10, "id": 2}]
+    assert factory.uses_transforms is True
@@ -0,0 +1,96 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory.route_factory import RouteFactory
+from core.factory.trie_router import TrieRouter, split_route
+from core.shared.proxy_definition import ModSettings, ProxyDefinition, ProxyRouteDefinition
+
+
+def test_split_route_leaves_mixed_segments_to_fastapi():
+    assert split_route("/api/item") == ["api", "item"]
+    assert split_route("/api/file.{ext}") is None
+    assert split_route("/api/{rest:path}/more") is None
+    assert split_route("/api/{id:nope}") is None
+
+
+def test_lookup_prefers_static_then_params_then_tails():
+    trie = TrieRouter()
+    for path, name in (("/api/item/latest", "static"), ("/api/item/{id:int}", "int"), ("/api/item/{slug}", "str"), ("/api/{rest:path}", "tail")):
+        assert trie.add(path, "GET", name)
+
+    def route(path):
+        handlers, params = trie.lookup(path)
+        return handlers["GET"][0], params
+
+    assert route("/api/item/latest") == ("static", {})
+    assert route("/api/item/7") == ("int", {"id": 7})
+    assert route("/api/item/seven") == ("str", {"slug": "seven"})
+    assert route("/api/item/7/history") == ("tail", {"rest": "item/7/history"})
+    assert trie.lookup("/other") is None
+
+
+@pytest.mark.asyncio
+async def test_trie_dispatch_serves_proxy_routes():
+    seen = []
+
+    def upstream(request):
+        seen.append(request.url.path)
+        return Response(200, json={"ok": True})
+
+    proxy = ProxyDefinition(endpoint="/api", target_url="http://upstream.test", mod_settings=ModSettings(dispatch="trie"))
+    factory = RouteFactory(proxy, transport=MockTransport(upstream))
+    factory.create_router_param(ProxyRouteDefinition(route="/item/{id}", url_route="/todos/{id}", method="GET", params={"id": "id"}))
+    factory.create_router(ProxyRouteDefinition(route="/items", url_route="/todos", method="GET"))
+
+    async def custom(route, request):
+        return JSONResponse({"custom": True})
+    factory.create_custom_router(ProxyRouteDefinition(route="/custom", method="GET"), custom)
+
+    app = FastAPI()
+    app.include_router(factory.router)
+    app.router.routes.append(factory.trie)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        item = await client.get("/api/item/3")
+        items = await client.get("/api/items")
+        wrong_method = await client.delete("/api/items")
+        custom_response = await client.get("/api/custom")
+    await factory.shutdown()
+
+    assert factory.trie.count == 2
+    assert item.status_code == items.status_code == 200
+    assert seen == ["/todos/3", "/todos"]
+    assert wrong_method.status_code == 405 and wrong_method.headers["allow"] == "GET"
+    # Custom handlers are FastAPI routes as before
+    assert custom_response.json() == {"custom": True}
+
+
+@pytest.mark.asyncio
+async def test_trie_dispatch_under_a_mount():
+    seen = []
+
+    def upstream(request):
+        seen.append(request.url.path)
+        return Response(200, json={"ok": True})
+
+    factory = RouteFactory(
+        ProxyDefinition(endpoint="/api", target_url="http://upstream.test", mod_settings=ModSettings(dispatch="trie")), transport=MockTransport(upstream)
+    )
+    factory.create_router_param(ProxyRouteDefinition(route="/item/{id}", url_route="/todos/{id}", method="GET", params={"id": "id"}))
+    app = FastAPI()
+    app.include_router(factory.router)
+    app.router.routes.append(factory.trie)
+    # Served under /edge, the path the trie sees still starts at /api
+    outer = FastAPI()
+    outer.mount("/edge", app)
+
+    async with AsyncClient(transport=ASGITransport(app=outer), base_url="http://sisyphus") as client:
+        mounted = await client.get("/edge/api/item/3")
+    async with AsyncClient(transport=ASGITransport(app=app, root_path="/proxy"), base_url="http://sisyphus") as client:
+        behind_a_proxy = await client.get("/proxy/api/item/4")
+    await factory.shutdown()
+
+    assert (mounted.status_code, behind_a_proxy.status_code) == (200, 200)
+    assert seen == ["/todos/3", "/todos/4"]
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient, MockTransport, Response
+
+from core.factory import validate
+from core.factory.route_factory import RouteFactory
+from core.factory.validate import RouteConfigError, load_mod_config, validate_routes
+from core.shared.proxy_definition import ProxyDefinition
+
+MOD_TOML = '''
+[mod]
+mod_id = "declared"
+
+[[routes]]
+route = "/item/{id}"
+url_route = "/todos/{id}"
+method = "get"
+params = { id = "id" }
+
+[[routes]]
+route = "/items"
+url_route = "/todos"
+method = "GET"
+client = "requests"
+'''
+
+
+def test_every_problem_is_reported():
+    with pytest.raises(RouteConfigError) as error:
+        validate_routes([
+            {"route": "/a", "url_route": "/a", "method": "GET", "metod": "GET"},
+            {"route": "/b", "url_route": "/b/{id}", "method": "GET"},
+            {"route": "c", "url_route": "/c", "method": "FETCH"},
+            {"route": "/d", "url_route": "/d", "method": "GET"},
+            {"route": "/d", "url_route": "/d", "method": "GET", "out_callback": "nocolon"},
+            {"route": "/e", "url_route": "/e", "method": "GET", "response_transform": "nope"},
+            {"route": "/f", "url_route": "/f", "method": "GET", "rate_limit": {"rate": 5, "key": "user"}},
+        ], "mod.toml")
+    lines = str(error.value).splitlines()
+    assert lines[0] == "mod.toml [[routes]] #1 (GET /a): unknown keys metod"
+    assert "url_route uses id, which the route doesn't capture" in lines[1]
+    assert "route must start with /" in lines[3] and "method must be one of" in lines[4]
+    assert lines[-4:-2] == [
+        "mod.toml [[routes]] #5 (GET /d): callback nocolon should look like module:function",
+        "mod.toml [[routes]] #5 (GET /d): declared twice",
+    ]
+    # Problems ProxyRouteDefinition would exit on are reported too
+    assert lines[-2].startswith("mod.toml [[routes]] #6 (GET /e): Unknown transform: nope.")
+    assert lines[-1] == "mod.toml [[routes]] #7 (GET /f): rate_limit key must be one of identity, ip, route, not user"
+
+
+def test_snapshot_skips_parsing_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "declared.toml"
+    path.write_text(MOD_TOML)
+    first = load_mod_config(path)
+    assert (tmp_path / "__pycache__" / "declared.toml.snapshot").is_file()
+    assert [entry.factory_method for entry in first.routes] == ["create_router_param", "create_requests_router"]
+
+    parsed = []
+    real_loads = validate.tomllib.loads
+    monkeypatch.setattr(validate.tomllib, "loads", lambda text: parsed.append(1) or real_loads(text))
+    # A new process: nothing in memory, the snapshot is on disk
+    validate._loaded.clear()
+    assert load_mod_config(path).routes[0].definition.method == "GET"
+    # Touched but unchanged, the hash still matches
+    os.utime(path, ns=(1, 1))
+    load_mod_config(path)
+    assert parsed == []
+
+    path.write_text(MOD_TOML.replace('"/todos"', '"/posts"'))
+    assert load_mod_config(path).routes[1].definition.url_route == "/posts"
+    assert parsed == [1]
+    validate._loaded.clear()
+
+
+def test_snapshot_is_rebuilt_when_the_code_changes(tmp_path, monkeypatch):
+    path = tmp_path / "declared.toml"
+    path.write_text(MOD_TOML)
+    load_mod_config(path)
+    snapshot = tmp_path / "__pycache__" / "declared.toml.snapshot"
+    parsed = []
+    real_loads = validate.tomllib.loads
+    monkeypatch.setattr(validate.tomllib, "loads", lambda text: parsed.append(1) or real_loads(text))
+
+    # Validated by another version of the models or validators
+    monkeypatch.setattr(validate, "code_fingerprint", lambda: "other code")
+    validate._loaded.clear()
+    assert load_mod_config(path).routes[1].definition.url_route == "/todos"
+    assert parsed == [1]
+
+    # Anything that fails to unpickle is a miss too
+    snapshot.write_bytes(b"\x80\x05not a pickle")
+    validate._loaded.clear()
+    assert load_mod_config(path).routes[0].definition.method == "GET"
+    assert parsed == [1, 1]
+    validate._loaded.clear()
+
+
+@pytest.mark.asyncio
+async def test_declared_routes_are_registered(tmp_path):
+    path = tmp_path / "declared.toml"
+    path.write_text(MOD_TOML)
+    seen = []
+
+    def upstream(request):
+        seen.append(request.url.path)
+        return Response(200, json={"ok": True})
+
+    factory = RouteFactory(ProxyDefinition(endpoint="/api", target_url="http://upstream.test"), transport=MockTransport(upstream))
+    factory.create_routes(load_mod_config(path).routes[:1])
+    app = FastAPI()
+    app.include_router(factory.router)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://sisyphus") as client:
+        response = await client.get("/api/item/3")
+    await factory.shutdown()
+    validate._loaded.clear()
+
+    assert response.status_code == 200 and seen == ["/todos/3"]
@@ -1,4 +1,4 @@
-import json
+from core.shared import codec
 from core.logging.logging import custom_message
 # Returns a JSON object if the string is a valid JSON, otherwise returns the string with an error message.
 # Example:
@@ -6,8 +6,9 @@ from core.logging.logging import custom_message
 # str_to_json('invalid json') -> 'invalid json##### Is not a valid JSON #####'
 def str_to_json(x: str) -> str:
     try:
-        return json.loads(x)
-    except json.JSONDecodeError:
+        return codec.loads(x)
+    except codec.DecodeError:
+        x = x if isinstance(x, str) else bytes(x).decode("utf-8", "replace")
         custom_message(f"Invalid JSON: {x} - Is not a valid JSON", "error")
         return x + " ::: Is not a valid JSON"
 
@@ -1,10 +1,13 @@
 from core.sisyphus import Sisyphus
+from core.server import serve
 
-from mods.example_pxy.example_pxy import ExampleMod
-from mods.hof.hof import Hof
 
-s = Sisyphus()
-#_ExampleMod = ExampleMod(s)
-_Hof = Hof(s)
+def create_app():
+    # Called once in every worker process, each one finds its own mods and registers their routes
+    s = Sisyphus()
+    s.load_mods()
+    return s.app
 
-s.run()
+
+if __name__ == "__main__":
+    serve("main:create_app")